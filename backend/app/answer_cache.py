@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+from app import metrics
+
+load_dotenv()
+
+# 🔹 Cache de respostas do /ask (0 desliga)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))  # segundos
+# reaproveita a resposta de uma pergunta recente com embedding quase igual;
+# vazio/0 desliga (perguntas como "GLI-11" e "GLI-12" têm embeddings muito parecidos)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0") or 0)
+ANSWER_CACHE_SIMILAR_SCAN = int(os.getenv("ANSWER_CACHE_SIMILAR_SCAN", "256"))  # entradas recentes comparadas
+
+
+# -------------------------
+# Cache de respostas
+# -------------------------
+class AnswerCache:
+    """
+    LRU com TTL, chaveado pelo texto normalizado da pergunta. Qualquer mudança
+    no corpus (perguntas, PDFs, recarga do índice) chama invalidate(), que
+    limpa tudo e avança a geração: respostas calculadas antes disso e
+    gravadas depois são descartadas.
+    """
+
+    def __init__(self, max_items: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 similarity: float = ANSWER_CACHE_SIMILARITY, similar_scan: int = ANSWER_CACHE_SIMILAR_SCAN):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.similarity = similarity
+        self.similar_scan = similar_scan
+        self._entries = OrderedDict()  # chave -> (expira_em, resposta, embedding normalizado)
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _alive(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key: str):
+        """Resposta já calculada para esta pergunta (cópia) ou None."""
+        if self.max_items <= 0:
+            return None
+        with self._lock:
+            entry = self._alive(key, time.monotonic())
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def get_similar(self, embedding):
+        """Resposta de uma pergunta recente com similaridade >= ANSWER_CACHE_SIMILARITY."""
+        if self.max_items <= 0 or self.similarity <= 0 or embedding is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        query = query / norm
+        now = time.monotonic()
+        with self._lock:
+            recent = [
+                (key, entry) for key, entry in reversed(self._entries.items())
+                if entry[0] >= now and entry[2] is not None and entry[2].shape == query.shape
+            ][:self.similar_scan]
+            if not recent:
+                return None
+            scores = np.stack([entry[2] for _, entry in recent]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity:
+                return None
+            key, entry = recent[best]
+            self._entries.move_to_end(key)
+            self.similar_hits += 1
+            return dict(entry[1])
+
+    def put(self, key: str, response: dict, embedding=None, generation: int = None):
+        """Grava a resposta; `generation` é a lida antes de calcular (evita gravar resposta velha)."""
+        if self.max_items <= 0:
+            return
+        vector = None
+        if embedding is not None and self.similarity > 0:
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, dict(response), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            "items": len(self._entries),
+            "max_items": self.max_items,
+            "ttl_seconds": self.ttl,
+            "invalidations": self.invalidations,
+        }
+
+
+# Cache global do processo
+answer_cache = AnswerCache()
+
+metrics.collector("answer_cache_lookups_total", "counter", "Answer cache lookups by result",
+                  lambda: {"hit": answer_cache.hits, "similar_hit": answer_cache.similar_hits,
+                           "miss": answer_cache.misses}, labels=("result",))
+metrics.collector("answer_cache_invalidations_total", "counter", "Answer cache invalidations (corpus changes)",
+                  lambda: {(): answer_cache.invalidations})
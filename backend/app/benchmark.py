@@ -0,0 +1,578 @@
+"""
+Benchmark de recuperação e ingestão, sem precisar do Ollama de verdade.
+
+Para cada tamanho de corpus (padrão: 1k, 10k e 100k trechos), em um diretório
+temporário próprio:
+
+1. gera um corpus sintético (trechos e perguntas respondidas) e grava direto
+   no banco, com os embeddings do servidor falso (app.fake_ollama);
+2. sobe a API com uvicorn num processo separado e mede o tempo de subida e
+   a memória (RSS) com os índices carregados;
+3. mede a latência do /ask (p50/p90/p99) com perguntas que caem numa
+   pergunta salva, num PDF ou em nenhum dos dois, a vazão com vários
+   usuários simultâneos e o tempo até o primeiro token do /ask/stream;
+4. gera PDFs sintéticos e mede a ingestão do pdf_indexer (trechos/s).
+
+O resultado vai para um JSON; com --compare, as métricas principais são
+comparadas com um resultado anterior e o comando sai com código 1 se alguma
+piorar mais que --tolerance.
+
+    cd backend
+    python -m app.benchmark --sizes 1000 10000 --output bench.json
+    python -m app.benchmark --sizes 1000 10000 --compare bench.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import httpx
+import numpy as np
+from app import fake_ollama
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = [1000, 10000, 100000]
+CONCURRENCY = [1, 8, 32]
+QUERY_KINDS = ("question", "pdf", "none")
+SYLLABLES = ["ka", "lo", "mi", "ne", "tor", "va", "sel", "dri", "quo", "ben", "ru", "fa",
+             "gli", "pes", "zan", "tu", "mor", "ci", "den", "pra", "lum", "ho", "xe", "bar"]
+WORDS_PER_PAGE = 250
+# variáveis que mudam o desempenho e vão para o relatório
+TRACKED_SETTINGS = ["VECTOR_BACKEND", "VECTOR_REDUCE_DIM", "VECTOR_RERANK_CANDIDATES", "EMBEDDING_STORAGE_DTYPE",
+                    "HYBRID_ENABLED", "RETRIEVAL_TOP_K", "CHUNK_SIZE", "EMBED_BATCH_SIZE", "EMBED_WORKERS", "OLLAMA_MAX_CONCURRENCY"]
+
+
+# -------------------------
+# Corpus sintético
+# -------------------------
+class Vocabulary:
+    """Pseudo-palavras agrupadas pelo tópico que o fake_ollama atribui a cada uma."""
+
+    def __init__(self, size: int = 20000, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        words = set()
+        while len(words) < size:
+            words.add("".join(rng.choice(SYLLABLES, size=int(rng.integers(2, 5)))))
+        self.words = sorted(words)
+        by_topic = {}
+        for word in self.words:
+            by_topic.setdefault(fake_ollama.topic_of(word), []).append(word)
+        self.topics = [by_topic[t] for t in sorted(by_topic)]
+
+    def text(self, rng, n: int, topic: int = None, off_topic: float = 0.2):
+        """`n` palavras, quase todas do mesmo tópico (sorteado se não vier)."""
+        if topic is None:
+            topic = int(rng.integers(len(self.topics)))
+        pool = self.topics[topic]
+        picks = [pool[i] for i in rng.integers(len(pool), size=n)]
+        for i in np.flatnonzero(rng.random(n) < off_topic):
+            picks[i] = self.words[int(rng.integers(len(self.words)))]
+        return " ".join(picks)
+
+    def unrelated(self, rng, n: int):
+        """Palavras de tópicos diferentes: não deve casar com nada."""
+        return " ".join(self.words[i] for i in rng.integers(len(self.words), size=n))
+
+
+def build_corpus(config, vocab, rng):
+    """Grava trechos e perguntas direto no banco; devolve tempos e amostras para as consultas."""
+    from sqlalchemy import insert
+    from app import database, embedding_codec, migrations, models, utils
+
+    if database.DIALECT != "sqlite":
+        # o PostgreSQL é o mesmo para todos os tamanhos: começa do zero
+        models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+
+    def encode(text):
+        return embedding_codec.encode_embedding(
+            fake_ollama.embed(utils.normalize_text(text), config["dim"]), model=utils.EMBEDDING_MODEL)
+
+    size, batch = config["size"], 2000
+    sample_every = max(1, size // 2000)
+    samples = {"chunks": [], "questions": []}
+    started = time.perf_counter()
+    db = database.SessionLocal()
+    try:
+        for offset in range(0, size, batch):
+            rows = []
+            for i in range(offset, min(size, offset + batch)):
+                content = vocab.text(rng, config["chunk_words"])
+                if i % sample_every == 0:
+                    samples["chunks"].append(content)
+                rows.append({
+                    "source_name": f"synthetic-{i // 100:05d}.pdf",
+                    "content": content,
+                    "embedding": encode(content),
+                    "embedding_model": utils.EMBEDDING_MODEL,
+                    "content_hash": hashlib.sha256(content.encode()).hexdigest(),
+                    "chunk_index": i % 100,
+                    "page_start": (i % 100) * 2 + 1,
+                    "page_end": (i % 100) * 2 + 2,
+                })
+            db.execute(insert(models.DocumentChunk), rows)
+            db.commit()
+        chunk_seconds = time.perf_counter() - started
+
+        questions = config["questions"]
+        sample_every = max(1, questions // 2000)
+        for offset in range(0, questions, batch):
+            texts = [vocab.text(rng, 10, off_topic=0) + "?" for _ in range(offset, min(questions, offset + batch))]
+            ids = db.scalars(insert(models.Question).returning(models.Question.id, sort_by_parameter_order=True),
+                             [{"text": t, "answer": f"Synthetic answer {offset + i}"} for i, t in enumerate(texts)]).all()
+            db.execute(insert(models.QuestionEmbedding), [
+                {"question_id": id, "embedding": encode(t), "embedding_model": utils.EMBEDDING_MODEL}
+                for id, t in zip(ids, texts)
+            ])
+            db.commit()
+            samples["questions"].extend(texts[::sample_every])
+    finally:
+        db.close()
+
+    seconds = time.perf_counter() - started
+    print(f"🧱 Corpus: {size} trechos e {questions} perguntas em {seconds:.1f}s")
+    return {
+        "chunks": size,
+        "questions": questions,
+        "seconds": round(seconds, 3),
+        "chunks_per_sec": round(size / chunk_seconds, 1) if chunk_seconds else None,
+        "db_mb": database_mb(database),
+    }, samples
+
+
+def database_mb(database):
+    if database.DIALECT == "postgresql":
+        with database.engine.connect() as conn:
+            size = conn.exec_driver_sql("SELECT pg_database_size(current_database())").scalar()
+    else:
+        size = os.path.getsize(os.path.join("data", "agent.db"))
+    return round(size / 2 ** 20, 2)
+
+
+def make_queries(vocab, samples, rng, n: int):
+    """(tipo esperado, pergunta), alternando pergunta salva / trecho de PDF / nenhum."""
+    queries = []
+    for i in range(n):
+        kind = QUERY_KINDS[i % len(QUERY_KINDS)]
+        if kind == "question":
+            text = samples["questions"][int(rng.integers(len(samples["questions"])))].upper()
+        elif kind == "pdf":
+            words = samples["chunks"][int(rng.integers(len(samples["chunks"])))].split()
+            text = " ".join(words[j] for j in rng.choice(len(words), size=min(8, len(words)), replace=False))
+        else:
+            text = vocab.unrelated(rng, 8)
+        queries.append((kind, text))
+    return queries
+
+
+def make_pdfs(folder, config, vocab, rng):
+    """PDFs com `pdf_chunks` trechos no total (texto em tópicos, como o corpus)."""
+    import fitz  # PyMuPDF
+    from app import chunking
+
+    os.makedirs(folder, exist_ok=True)
+    pages = max(1, config["pdf_chunks"] * chunking.CHUNK_SIZE // WORDS_PER_PAGE)
+    files = max(1, min(config["pdf_files"], pages))
+    for f in range(files):
+        doc = fitz.open()
+        topic = int(rng.integers(len(vocab.topics)))
+        for _ in range(pages // files + (f < pages % files)):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36),
+                                vocab.text(rng, WORDS_PER_PAGE, topic=topic), fontsize=7)
+        doc.save(os.path.join(folder, f"bench-{f:03d}.pdf"))
+        doc.close()
+    return pages
+
+
+# -------------------------
+# Medidas
+# -------------------------
+def latency_stats(latencies):
+    if not latencies:
+        return {"count": 0}
+    ms = np.asarray(latencies) * 1000
+    return {
+        "count": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p90_ms": round(float(np.percentile(ms, 90)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+def proc_memory(pid="self"):
+    """RSS atual e pico (MB) lidos de /proc; None fora do Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return {"rss_mb": None, "peak_rss_mb": None}
+    mb = lambda key: round(int(fields[key].split()[0]) / 1024, 1) if key in fields else None
+    return {"rss_mb": mb("VmRSS"), "peak_rss_mb": mb("VmHWM")}
+
+
+def answer_path(response: dict):
+    """Qual caminho respondeu: pergunta salva, trechos de PDF ou nenhum."""
+    context = response.get("context_used")
+    if not context:
+        return "none"
+    return "pdf" if context.startswith("Excerpt of the PDF") else "question"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# -------------------------
+# Cenários
+# -------------------------
+def start_server(env, timeout: float = 900):
+    """Sobe a API (uvicorn) em outro processo e espera ela responder."""
+    port = free_port()
+    log = open("server.log", "w")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"a API saiu com código {process.returncode} (veja server.log)")
+        try:
+            if httpx.get(f"{url}/openapi.json", timeout=1).status_code == 200:
+                return process, url, time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("a API não subiu a tempo")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def ask_sequential(url, queries, warmup: int = 10):
+    """Um usuário, uma pergunta por vez: latência por tipo e caminho que respondeu."""
+    latencies = {kind: [] for kind in QUERY_KINDS}
+    paths = {kind: 0 for kind in QUERY_KINDS}
+    errors = 0
+    with httpx.Client(base_url=url, timeout=60) as client:
+        for _, text in queries[:warmup]:
+            client.post("/ask", params={"user_question": text})
+        for kind, text in queries:
+            started = time.perf_counter()
+            response = client.post("/ask", params={"user_question": text})
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies[kind].append(elapsed)
+            paths[answer_path(response.json())] += 1
+    result = {"all": latency_stats([x for kind in QUERY_KINDS for x in latencies[kind]])}
+    result.update({kind: latency_stats(latencies[kind]) for kind in QUERY_KINDS})
+    result["paths"] = paths
+    result["errors"] = errors
+    return result
+
+
+async def ask_concurrent(url, queries, users: int, requests: int):
+    """`users` clientes simultâneos dividindo `requests` perguntas: vazão e latência."""
+    pending = iter([queries[i % len(queries)][1] for i in range(requests)])
+    latencies, errors = [], 0
+
+    async def user(client):
+        nonlocal errors
+        for text in pending:
+            started = time.perf_counter()
+            try:
+                response = await client.post("/ask", params={"user_question": text})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(users)))
+        seconds = time.perf_counter() - started
+    return {
+        "users": users,
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(latencies) / seconds, 2) if seconds else None,
+        "latency": latency_stats(latencies),
+    }
+
+
+def ask_stream(url, queries):
+    """Tempo até o primeiro token e até o fim do /ask/stream."""
+    first_token, total = [], []
+    with httpx.Client(base_url=url, timeout=120) as client:
+        for _, text in queries:
+            started = time.perf_counter()
+            got_token = False
+            with client.stream("POST", "/ask/stream", params={"user_question": text}) as response:
+                for line in response.iter_lines():
+                    if not got_token and line.startswith("event: token"):
+                        first_token.append(time.perf_counter() - started)
+                        got_token = True
+            total.append(time.perf_counter() - started)
+    return {"first_token": latency_stats(first_token), "total": latency_stats(total)}
+
+
+def ingest(folder):
+    """Indexa os PDFs sintéticos com o pdf_indexer, como o comando de linha."""
+    from app import pdf_indexer, vector_index
+
+    started = time.perf_counter()
+    written = 0
+    for name in sorted(os.listdir(folder)):
+        written += pdf_indexer.process_pdf(os.path.join(folder, name)) or 0
+    seconds = time.perf_counter() - started
+    vector_index.save_indexes()
+    return written, seconds
+
+
+# -------------------------
+# Execução de um tamanho (processo filho, dentro do diretório temporário)
+# -------------------------
+def run_size(config):
+    # os módulos do app leem o .env e o caminho do banco (./data) na importação:
+    # por isso só são importados aqui, já dentro do diretório do benchmark
+    os.makedirs("data", exist_ok=True)
+    rng = np.random.default_rng(config["seed"])
+    vocab = Vocabulary(seed=config["seed"])
+    result = {"size": config["size"]}
+
+    result["corpus"], samples = build_corpus(config, vocab, rng)
+    queries = make_queries(vocab, samples, rng, config["queries"])
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.getenv("PYTHONPATH")])))
+    server, url, startup = start_server(env)
+    try:
+        result["startup_seconds"] = round(startup, 3)
+        result["memory"] = {"server_after_startup": proc_memory(server.pid)}
+        print(f"🚀 API no ar em {startup:.1f}s ({result['memory']['server_after_startup']['rss_mb']} MB)")
+
+        result["ask"] = ask_sequential(url, queries)
+        print(f"⏱️ /ask: p50 {result['ask']['all']['p50_ms']} ms, p99 {result['ask']['all']['p99_ms']} ms, "
+              f"caminhos {result['ask']['paths']}")
+
+        result["concurrency"] = []
+        for users in config["concurrency"]:
+            # perguntas novas a cada nível: o embedding (Ollama) entra na medida, não só o cache
+            fresh = make_queries(vocab, samples, rng, config["concurrent_requests"])
+            level = asyncio.run(ask_concurrent(url, fresh, users, config["concurrent_requests"]))
+            result["concurrency"].append(level)
+            print(f"👥 {users} usuários: {level['throughput_rps']} req/s, p99 {level['latency'].get('p99_ms')} ms")
+
+        if config["stream_queries"]:
+            result["ask_stream"] = ask_stream(url, queries[:config["stream_queries"]])
+        result["memory"]["server_end"] = proc_memory(server.pid)
+    finally:
+        stop_server(server)
+
+    if config["pdf_chunks"]:
+        pages = make_pdfs("pdfs", config, vocab, rng)
+        written, seconds = ingest("pdfs")
+        result["ingest"] = {
+            "pages": pages,
+            "chunks": written,
+            "seconds": round(seconds, 3),
+            "chunks_per_sec": round(written / seconds, 1) if seconds else None,
+            "pages_per_sec": round(pages / seconds, 1) if seconds else None,
+        }
+        print(f"📄 Ingestão: {written} trechos em {seconds:.1f}s ({result['ingest']['chunks_per_sec']}/s)")
+    result["memory"]["indexer_peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+# -------------------------
+# Comparação com um resultado anterior
+# -------------------------
+def key_metrics(result):
+    """{nome: (valor, maior_é_melhor)} das métricas acompanhadas entre versões."""
+    metrics = {
+        "ask.p50_ms": (result.get("ask", {}).get("all", {}).get("p50_ms"), False),
+        "ask.p99_ms": (result.get("ask", {}).get("all", {}).get("p99_ms"), False),
+        "startup_seconds": (result.get("startup_seconds"), False),
+        "server_peak_rss_mb": (result.get("memory", {}).get("server_end", {}).get("peak_rss_mb"), False),
+        "ingest.chunks_per_sec": (result.get("ingest", {}).get("chunks_per_sec"), True),
+    }
+    for level in result.get("concurrency", []):
+        metrics[f"concurrency.{level['users']}.throughput_rps"] = (level["throughput_rps"], True)
+    return metrics
+
+
+def compare(previous, current, tolerance: float):
+    """Imprime as diferenças por tamanho; devolve a lista de regressões."""
+    before = {r["size"]: r for r in previous.get("results", []) if "error" not in r}
+    regressions = []
+    for result in current["results"]:
+        if "error" in result or result["size"] not in before:
+            continue
+        print(f"\n📈 {result['size']} trechos (antes -> agora)")
+        old = key_metrics(before[result["size"]])
+        for name, (value, higher_is_better) in key_metrics(result).items():
+            base = old.get(name, (None, None))[0]
+            if value is None or not base:
+                continue
+            change = (value - base) / base
+            worse = -change if higher_is_better else change
+            flag = "❌" if worse > tolerance else "✅"
+            print(f"  {flag} {name}: {base} -> {value} ({change:+.1%})")
+            if worse > tolerance:
+                regressions.append(f"{result['size']}:{name}")
+    return regressions
+
+
+# -------------------------
+# Orquestração
+# -------------------------
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recuperação (/ask) e ingestão de PDFs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="trechos no corpus sintético")
+    parser.add_argument("--questions", type=int, help="perguntas respondidas (padrão: 10%% dos trechos, mín. 100)")
+    parser.add_argument("--chunk-words", type=int, default=120, help="palavras por trecho sintético")
+    parser.add_argument("--queries", type=int, default=300, help="perguntas no teste de latência")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY, help="usuários simultâneos")
+    parser.add_argument("--concurrent-requests", type=int, default=300, help="perguntas por nível de concorrência")
+    parser.add_argument("--stream-queries", type=int, default=50, help="perguntas no /ask/stream (0 desliga)")
+    parser.add_argument("--pdf-chunks", type=int, default=500, help="trechos nos PDFs de ingestão (0 desliga)")
+    parser.add_argument("--pdf-files", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=fake_ollama.DIM, help="dimensão dos embeddings falsos")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="atraso simulado por embedding (s)")
+    parser.add_argument("--embed-text-latency", type=float, default=0.0, help="atraso a mais por texto embedado (s)")
+    parser.add_argument("--embed-parallel", type=int, default=0,
+                        help="embeddings atendidos ao mesmo tempo pelo Ollama falso (1 = Ollama só de CPU)")
+    parser.add_argument("--generate-latency", type=float, default=0.0, help="atraso simulado até o 1º token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="atraso simulado entre tokens (s)")
+    parser.add_argument("--answer-cache", action="store_true", help="mantém o cache de respostas do /ask ligado")
+    parser.add_argument("--database-url", default="sqlite:///./data/agent.db",
+                        help="banco usado pela API (PostgreSQL é esvaziado a cada tamanho)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark.json", help="arquivo JSON do resultado")
+    parser.add_argument("--compare", help="resultado anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="piora aceita no --compare (0.15 = 15%%)")
+    parser.add_argument("--keep", action="store_true", help="não apaga os diretórios temporários")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.child) as f:
+            config = json.load(f)
+        result = run_size(config)
+        with open(config["result"], "w") as f:
+            json.dump(result, f)
+        return
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    server = fake_ollama.start(dim=args.dim, embed_latency=args.embed_latency,
+                               generate_latency=args.generate_latency, token_latency=args.token_latency,
+                               embed_text_latency=args.embed_text_latency, embed_parallel=args.embed_parallel)
+    print(f"🦙 Ollama falso em {server.url}")
+    env = dict(os.environ, LLAMA_URL=server.url, DATABASE_URL=args.database_url,
+               PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.getenv("PYTHONPATH")])))
+    if not args.answer_cache:
+        env["ANSWER_CACHE_SIZE"] = "0"  # mede o caminho completo, não o cache
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": {name: os.getenv(name) for name in TRACKED_SETTINGS},
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ("child", "output", "compare", "keep")},
+        "results": [],
+    }
+
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix=f"agent-bench-{size}-")
+        config = {
+            "size": size,
+            "questions": args.questions if args.questions is not None else max(100, size // 10),
+            "chunk_words": args.chunk_words,
+            "queries": args.queries,
+            "concurrency": args.concurrency,
+            "concurrent_requests": args.concurrent_requests,
+            "stream_queries": args.stream_queries,
+            "pdf_chunks": args.pdf_chunks,
+            "pdf_files": args.pdf_files,
+            "dim": args.dim,
+            "seed": args.seed,
+            "result": os.path.join(workdir, "result.json"),
+        }
+        with open(os.path.join(workdir, "config.json"), "w") as f:
+            json.dump(config, f)
+
+        print(f"\n📊 Corpus de {size} trechos ({workdir})")
+        process = subprocess.run([sys.executable, "-m", "app.benchmark", "--child", os.path.join(workdir, "config.json")],
+                                 cwd=workdir, env=env)
+        if process.returncode == 0:
+            with open(config["result"]) as f:
+                report["results"].append(json.load(f))
+        else:
+            report["results"].append({"size": size, "error": f"exit code {process.returncode}"})
+            print(f"⚠️ Benchmark de {size} trechos falhou (código {process.returncode})")
+        if args.keep:
+            print(f"📁 Arquivos mantidos em {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    server.shutdown()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Resultado salvo em {args.output}")
+
+    if previous is not None:
+        regressions = compare(previous, report, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressões acima de {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ Nenhuma regressão acima da tolerância.")
+
+
+if __name__ == "__main__":
+    main()
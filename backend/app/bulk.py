@@ -0,0 +1,192 @@
+import csv
+import io
+import json
+import os
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from app import database, models, utils, vector_index
+from app.answer_cache import answer_cache
+
+load_dotenv()
+
+# 🔹 Perguntas por chamada de embedding em lote no import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "64"))
+MAX_REPORTED_ERRORS = 200
+FORMATS = ("jsonl", "csv")
+
+
+# -------------------------
+# Leitura (streaming) de JSONL / CSV
+# -------------------------
+def detect_format(content_type: str = None, filename: str = None):
+    content_type = (content_type or "").lower()
+    if "csv" in content_type or (filename or "").lower().endswith(".csv"):
+        return "csv"
+    return "jsonl"
+
+
+def iter_rows(stream, fmt: str):
+    """
+    Gera (número da linha, dict ou mensagem de erro) sem carregar o arquivo
+    inteiro; `stream` é um arquivo binário (ex.: o corpo do upload em disco).
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f"invalid JSON: {e}"
+            continue
+        yield number, row if isinstance(row, dict) else "expected a JSON object"
+
+
+def validate(row):
+    """Retorna (text, answer) ou levanta ValueError com o motivo."""
+    if isinstance(row, str):
+        raise ValueError(row)
+    text = str(row.get("text") or "").strip()
+    answer = str(row.get("answer") or "").strip()
+    if not text:
+        raise ValueError("missing 'text'")
+    if not answer:
+        raise ValueError("missing 'answer'")
+    return text, answer
+
+
+# -------------------------
+# Import em lote
+# -------------------------
+def import_questions(db: Session, rows, on_duplicate: str = "skip", batch_size: int = IMPORT_BATCH_SIZE):
+    """
+    Importa perguntas respondidas a partir de (linha, dict) — de iter_rows ou
+    de uma lista. Os embeddings são pedidos em lote, sem transação aberta;
+    só no fim tudo é gravado numa única transação curta, com inserts em lote
+    (assim o lock de escrita do SQLite não fica preso durante as chamadas ao
+    Ollama). Linhas inválidas (ou sem embedding) entram no relatório sem
+    interromper o resto.
+
+    on_duplicate: "skip" mantém a pergunta já existente (mesmo texto);
+    "update" troca a resposta dela.
+    """
+    report = {"total": 0, "inserted": 0, "updated": 0, "skipped": 0, "failed": 0, "errors": []}
+
+    def fail(number, message):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": number, "error": message})
+
+    existing = {text: id for id, text in db.query(models.Question.id, models.Question.text)}
+    db.commit()  # encerra a leitura: nada fica aberto enquanto os embeddings são gerados
+    seen = set()
+    questions, vectors = [], []  # prontos para gravar (vetores em float32, não listas de floats)
+
+    def embed(batch):
+        if not batch:
+            return
+        for (number, text, answer), vector in zip(batch, utils.get_embeddings([text for _, text, _ in batch])):
+            if not vector:
+                fail(number, "embedding service unavailable")
+                continue
+            questions.append({"text": text, "answer": answer})
+            vectors.append(np.asarray(vector, dtype=np.float32))
+
+    # 1️⃣ Validação e embeddings (sem transação)
+    batch, updates = [], []
+    for number, row in rows:
+        report["total"] += 1
+        try:
+            text, answer = validate(row)
+        except ValueError as e:
+            fail(number, str(e))
+            continue
+
+        if text in existing or text in seen:
+            if on_duplicate == "update" and text in existing:
+                # mesmo texto = mesmo embedding; só a resposta muda
+                updates.append({"id": existing[text], "answer": answer})
+                report["updated"] += 1
+            else:
+                report["skipped"] += 1
+            continue
+        seen.add(text)
+
+        batch.append((number, text, answer))
+        if len(batch) >= batch_size:
+            embed(batch)
+            batch = []
+    embed(batch)
+
+    # 2️⃣ Gravação: uma transação só, sem chamadas externas no meio
+    new_ids = []
+    try:
+        for start in range(0, len(questions), batch_size):
+            ids = db.scalars(
+                insert(models.Question).returning(models.Question.id, sort_by_parameter_order=True),
+                questions[start:start + batch_size],
+            ).all()
+            db.execute(insert(models.QuestionEmbedding), [
+                {"question_id": id, "embedding": utils.serialize_embedding(vector), "embedding_model": utils.EMBEDDING_MODEL}
+                for id, vector in zip(ids, vectors[start:start + batch_size])
+            ])
+            new_ids.extend(ids)
+        if updates:
+            db.execute(update(models.Question), updates)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    report["inserted"] = len(new_ids)
+
+    vector_index.question_index.upsert_many(new_ids, vectors)
+    if new_ids or updates:
+        answer_cache.invalidate()
+    return report
+
+
+# -------------------------
+# Export (streaming)
+# -------------------------
+def export_questions(fmt: str = "jsonl", page_size: int = 1000):
+    """Gera o arquivo em pedaços, página por página, com uma sessão própria."""
+    db = database.SessionLocal()
+    try:
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(["id", "text", "answer"])
+        last_id = 0
+        while True:
+            page = (
+                db.query(models.Question.id, models.Question.text, models.Question.answer)
+                .filter(models.Question.id > last_id)
+                .order_by(models.Question.id)
+                .limit(page_size)
+                .all()
+            )
+            if not page:
+                break
+            if fmt == "csv":
+                writer.writerows(page)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                yield "".join(
+                    json.dumps({"id": id, "text": text, "answer": answer}, ensure_ascii=False) + "\n"
+                    for id, text, answer in page
+                )
+            last_id = page[-1].id
+        if fmt == "csv" and buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
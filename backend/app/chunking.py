@@ -0,0 +1,130 @@
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))            # palavras por bloco
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "0"))        # palavras repetidas entre blocos vizinhos
+CHUNK_SENTENCES = os.getenv("CHUNK_SENTENCES", "false").lower() in ("1", "true", "yes")
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = 8
+
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def signature(chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP, sentences: bool = CHUNK_SENTENCES) -> str:
+    """Identifica a configuração de blocos (mudou? o PDF precisa ser redividido)."""
+    return f"words={chunk_size};overlap={overlap};sentences={int(sentences)}"
+
+
+@dataclass
+class Chunk:
+    index: int        # posição do bloco no documento
+    text: str
+    page_start: int   # páginas de origem (1 = primeira)
+    page_end: int
+
+
+# -------------------------
+# Extração de páginas (paralela entre processos)
+# -------------------------
+def extract_pages(file_path: str, start: int, end: int):
+    """Extrai o texto das páginas [start, end) — roda dentro dos processos do pool."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(file_path) as doc:
+        return [(number + 1, doc[number].get_text("text")) for number in range(start, min(end, doc.page_count))]
+
+
+def iter_pages(file_path: str, page_count: int, pool=None, window: int = PDF_EXTRACT_WORKERS * 2,
+               pages_per_task: int = PAGES_PER_TASK):
+    """
+    Gera (número da página, texto) em ordem. Com um ProcessPoolExecutor, os
+    intervalos de páginas são extraídos em paralelo, mantendo só uma janela
+    de tarefas em andamento para não carregar o documento inteiro na memória.
+    """
+    ranges = [(start, start + pages_per_task) for start in range(0, page_count, pages_per_task)]
+    if pool is None:
+        for start, end in ranges:
+            yield from extract_pages(file_path, start, end)
+        return
+
+    pending = deque()
+    for start, end in ranges:
+        pending.append(pool.submit(extract_pages, file_path, start, end))
+        if len(pending) >= window:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+# -------------------------
+# Divisão em blocos (streaming)
+# -------------------------
+def _units(pages, sentences: bool):
+    """Quebra as páginas em unidades (frases ou palavras), cada uma com sua página."""
+    for page_number, text in pages:
+        if sentences:
+            for sentence in SENTENCE_END.split(text):
+                words = sentence.split()
+                if words:
+                    yield words, page_number
+        else:
+            for word in text.split():
+                yield [word], page_number
+
+
+def iter_chunks(pages, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP,
+                sentences: bool = CHUNK_SENTENCES):
+    """
+    Gera os blocos de um documento à medida que as páginas chegam.
+    Com `sentences`, os cortes caem no fim de uma frase (frases maiores que o
+    bloco são cortadas à força); `overlap` repete as últimas palavras
+    (ou frases inteiras) do bloco anterior no início do próximo.
+    Sem frases e sem overlap, o resultado é igual ao split fixo antigo.
+    """
+    overlap = min(overlap, chunk_size - 1) if chunk_size > 1 else 0
+    buffer = deque()   # (palavras, página)
+    size = 0
+    index = 0
+    fresh = False      # há palavras novas desde o último bloco (além do overlap)?
+
+    def emit():
+        nonlocal index
+        words = [w for unit, _ in buffer for w in unit]
+        chunk = Chunk(index, " ".join(words), buffer[0][1], buffer[-1][1])
+        index += 1
+        return chunk
+
+    def carry_over():
+        # mantém no buffer só o final que vira overlap do próximo bloco
+        nonlocal size
+        kept, kept_size = deque(), 0
+        while buffer and kept_size + len(buffer[-1][0]) <= overlap:
+            unit = buffer.pop()
+            kept.appendleft(unit)
+            kept_size += len(unit[0])
+        buffer.clear()
+        buffer.extend(kept)
+        size = kept_size
+
+    for words, page_number in _units(pages, sentences):
+        # frase maior que um bloco inteiro: corta em pedaços
+        pieces = [words[i:i + chunk_size] for i in range(0, len(words), chunk_size)] if len(words) > chunk_size else [words]
+        for piece in pieces:
+            if size and size + len(piece) > chunk_size:
+                yield emit()
+                carry_over()
+                fresh = False
+                # o overlap não pode sozinho estourar o bloco
+                while size and size + len(piece) > chunk_size:
+                    size -= len(buffer.popleft()[0])
+            buffer.append((piece, page_number))
+            size += len(piece)
+            fresh = True
+
+    if fresh:
+        yield emit()
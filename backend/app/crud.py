@@ -1,29 +1,41 @@
 from sqlalchemy.orm import Session
-from . import models, schemas, utils
-import json
+from . import models, schemas, utils, vector_index
+from .answer_cache import answer_cache
 
 # -------------------------
 # Respondidas
 # -------------------------
-def create_question(db: Session, question: schemas.QuestionCreate):
+def create_question(db: Session, question: schemas.QuestionCreate, embedding=None):
     # Criar pergunta
+    # Criar embedding (a API já manda pronto, gerado pelo cliente assíncrono)
+    if embedding is None:
+        embedding = utils.get_embedding(question.text)
+
+    # Pergunta e embedding na mesma transação (flush só para obter o id)
     db_question = models.Question(text=question.text, answer=question.answer)
     db.add(db_question)
-    db.commit()
-    db.refresh(db_question)
-
-    # Criar embedding
-    embedding = utils.get_embedding(question.text)
+    db.flush()
     db_embedding = models.QuestionEmbedding(
         question_id=db_question.id,
-        embedding=utils.serialize_embedding(embedding)
+        embedding=utils.serialize_embedding(embedding),
+        embedding_model=utils.EMBEDDING_MODEL,
     )
     db.add(db_embedding)
     db.commit()
+    db.refresh(db_question)
+    vector_index.question_index.upsert(db_question.id, embedding)
+    answer_cache.invalidate()
 
     return db_question
 
 
+def discard_shadow(db: Session, question_id: int):
+    db.query(models.ShadowEmbedding).filter(
+        models.ShadowEmbedding.corpus == "questions",
+        models.ShadowEmbedding.item_id == question_id,
+    ).delete(synchronize_session=False)
+
+
 def get_questions(db: Session, skip: int = 0, limit: int = 10):
     return db.query(models.Question).offset(skip).limit(limit).all()
 
@@ -36,29 +48,34 @@ def get_question_by_text(db: Session, text: str):
     return db.query(models.Question).filter(models.Question.text == text).first()
 
 
-def update_question(db: Session, question_id: int, updated: schemas.QuestionCreate):
+def update_question(db: Session, question_id: int, updated: schemas.QuestionCreate, embedding=None):
     db_question = get_question(db, question_id)
     if not db_question:
         return None
+    if embedding is None:
+        embedding = utils.get_embedding(updated.text)
+
+    # Pergunta e embedding na mesma transação, como no create_question
     db_question.text = updated.text
     db_question.answer = updated.answer
-    db.commit()
-    db.refresh(db_question)
-
-    # Atualizar embedding
-    embedding = utils.get_embedding(updated.text)
     db_embedding = db.query(models.QuestionEmbedding).filter(
         models.QuestionEmbedding.question_id == question_id
     ).first()
     if db_embedding:
         db_embedding.embedding = utils.serialize_embedding(embedding)
+        db_embedding.embedding_model = utils.EMBEDDING_MODEL
     else:
-        db_embedding = models.QuestionEmbedding(
+        db.add(models.QuestionEmbedding(
             question_id=question_id,
-            embedding=utils.serialize_embedding(embedding)
-        )
-        db.add(db_embedding)
+            embedding=utils.serialize_embedding(embedding),
+            embedding_model=utils.EMBEDDING_MODEL,
+        ))
+    # vetor de um re-embedding em andamento ficou velho: o job gera de novo
+    discard_shadow(db, question_id)
     db.commit()
+    db.refresh(db_question)
+    vector_index.question_index.upsert(question_id, embedding)
+    answer_cache.invalidate()
 
     return db_question
 
@@ -76,7 +93,10 @@ def delete_question(db: Session, question_id: int):
         db.delete(db_embedding)
 
     db.delete(db_question)
+    discard_shadow(db, question_id)
     db.commit()
+    vector_index.question_index.remove(question_id)
+    answer_cache.invalidate()
     return db_question
 
 # -------------------------
@@ -0,0 +1,227 @@
+import atexit
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from app import embedding_codec, metrics
+
+load_dotenv()
+
+# 🔹 Quantos embeddings manter em memória (LRU) e no arquivo SQLite
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_DISK_MAX = int(os.getenv("EMBEDDING_CACHE_DISK_MAX", "200000"))
+# caminho vazio desliga o nível em disco
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.db")
+
+PRUNE_EVERY = 1000  # gravações entre podas do nível em disco
+WRITE_BATCH = 256          # vetores por commit da thread de gravação
+WRITE_QUEUE_SIZE = 10000   # gravações pendentes; além disso, o vetor fica só na memória
+
+
+def cache_key(model: str, text: str) -> str:
+    """Chave = hash do modelo + texto já normalizado."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+# -------------------------
+# Cache de embeddings em dois níveis
+# -------------------------
+class EmbeddingCache:
+    """
+    Nível 1: LRU em memória (por processo), limitado a max_items.
+    Nível 2: arquivo SQLite compartilhado entre processos (API, pdf_indexer,
+    refresh_embeddings), que sobrevive a reinícios.
+
+    O lock só protege o LRU: a leitura do disco usa uma conexão por thread
+    e a gravação fica com uma thread própria (write-behind, vários vetores
+    por commit), então put() nunca espera o SQLite e uma consulta ao disco
+    não trava quem só precisa da memória.
+    """
+
+    def __init__(self, max_items: int = EMBEDDING_CACHE_SIZE, path: str = EMBEDDING_CACHE_PATH,
+                 disk_max_items: int = EMBEDDING_CACHE_DISK_MAX):
+        self.max_items = max_items
+        self.path = path
+        self.disk_max_items = disk_max_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()  # conexão de leitura de cada thread
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer = None
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ---- nível em disco ----
+    @property
+    def has_disk(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        with self._schema_lock:
+            if not self._schema_ready:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn.execute("PRAGMA journal_mode=WAL;")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+                )
+                # a poda procura o corte por idade: sem índice, ordenaria a tabela inteira
+                conn.execute("CREATE INDEX IF NOT EXISTS embedding_cache_created_at ON embedding_cache (created_at)")
+                conn.commit()
+                self._schema_ready = True
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _disk_get(self, key):
+        try:
+            row = self._reader().execute("SELECT vector FROM embedding_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Cache de embeddings em disco indisponível: {e}")
+            return None
+        return embedding_codec.decode_embedding(row[0]).tolist() if row else None
+
+    def _enqueue(self, key, model, vector):
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="embedding-cache-writer", daemon=True)
+                self._writer.start()
+        try:
+            self._queue.put_nowait((key, model, vector))
+        except queue.Full:
+            pass  # disco atrasado: o vetor fica só na memória (é um cache)
+
+    def _write_loop(self):
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn = conn or self._connect()
+                self._disk_put(conn, batch)
+            except sqlite3.Error as e:
+                print(f"⚠️ Falha ao gravar no cache de embeddings em disco: {e}")
+                if conn is not None:
+                    conn.rollback()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _disk_put(self, conn, batch):
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embedding_cache (key, model, vector, created_at) VALUES (?, ?, ?, ?)",
+            [(key, model, embedding_codec.encode_embedding(vector, model, "float32"), now)
+             for key, model, vector in batch],
+        )
+        before, self._writes = self._writes, self._writes + len(batch)
+        if self.disk_max_items > 0 and before // PRUNE_EVERY != self._writes // PRUNE_EVERY:
+            # descarta os mais antigos quando passa do limite (corte achado pelo índice de created_at;
+            # um lote tem a mesma hora, então o corte é estrito e pode sobrar um pouco acima do limite)
+            row = conn.execute(
+                "SELECT created_at FROM embedding_cache ORDER BY created_at DESC LIMIT 1 OFFSET ?",
+                (self.disk_max_items - 1,),  # o mais antigo que fica
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM embedding_cache WHERE created_at < ?", (row[0],))
+        conn.commit()
+
+    def flush(self):
+        """Espera as gravações pendentes chegarem ao disco (fim do processo, testes)."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.join()
+
+    # ---- nível em memória ----
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    # ---- API ----
+    def get_memory(self, model: str, text: str):
+        """Só o LRU: rápido o bastante para rodar direto no event loop."""
+        key = cache_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is None:
+                return None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return list(vector)
+
+    def get_disk(self, model: str, text: str):
+        """Só o arquivo SQLite (E/S bloqueante: numa thread, fora do event loop)."""
+        key = cache_key(model, text)
+        vector = self._disk_get(key) if self.has_disk else None
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self._remember(key, vector)
+            self.disk_hits += 1
+        return list(vector)
+
+    def get(self, model: str, text: str):
+        """Retorna o embedding (lista de floats) ou None se não estiver em cache."""
+        vector = self.get_memory(model, text)
+        return vector if vector is not None else self.get_disk(model, text)
+
+    def put(self, model: str, text: str, vector):
+        """Guarda na memória na hora; o disco é gravado em segundo plano."""
+        if not vector:
+            return
+        key = cache_key(model, text)
+        vector = list(vector)
+        with self._lock:
+            self._remember(key, vector)
+        if self.has_disk:
+            self._enqueue(key, model, vector)
+
+    def clear(self):
+        self.flush()
+        with self._lock:
+            self._memory.clear()
+        if self.has_disk:
+            conn = self._reader()
+            conn.execute("DELETE FROM embedding_cache")
+            conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "memory_max_items": self.max_items,
+        }
+
+
+# Cache global do processo
+embedding_cache = EmbeddingCache()
+atexit.register(embedding_cache.flush)  # pdf_indexer/refresh_embeddings: grava o que ficou na fila
+
+metrics.collector("embedding_cache_lookups_total", "counter", "Embedding cache lookups by result",
+                  lambda: {"memory_hit": embedding_cache.memory_hits, "disk_hit": embedding_cache.disk_hits,
+                           "miss": embedding_cache.misses}, labels=("result",))
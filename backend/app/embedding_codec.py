@@ -0,0 +1,125 @@
+import json
+import os
+import struct
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+load_dotenv()
+
+# -------------------------
+# Formato binário dos embeddings
+# -------------------------
+# Cabeçalho (little-endian), seguido do nome do modelo e do vetor cru:
+#   magic "QAE1" | dtype (b"f" float32, b"e" float16) | len(modelo) u8 | dim u32
+MAGIC = b"QAE1"
+HEADER = struct.Struct("<4scBI")
+DTYPES = {b"f": np.dtype("<f4"), b"e": np.dtype("<f2")}
+DTYPE_CODES = {"float32": b"f", "float16": b"e"}
+
+# float16 reduz o banco pela metade, com perda de precisão desprezível para cosseno
+STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+
+
+def encode_embedding(vector, model: str = "", dtype: str = None) -> bytes:
+    """Converte um vetor (lista ou ndarray) no blob binário armazenado no banco."""
+    code = DTYPE_CODES[dtype or STORAGE_DTYPE]
+    array = np.asarray(vector, dtype=DTYPES[code]).ravel()
+    model_bytes = model.encode("utf-8")[:255]
+    return HEADER.pack(MAGIC, code, len(model_bytes), array.shape[0]) + model_bytes + array.tobytes()
+
+
+def is_legacy(value) -> bool:
+    """Embeddings antigos eram strings JSON (ex.: '[0.1, 0.2, ...]')."""
+    if isinstance(value, str):
+        return True
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:1]) in (b"[", b"n")
+
+
+def read_header(blob):
+    """Retorna (dtype, dim, modelo, offset do payload) de um blob binário."""
+    magic, code, model_len, dim = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError("Embedding em formato desconhecido.")
+    model = bytes(blob[HEADER.size:HEADER.size + model_len]).decode("utf-8")
+    return DTYPES[code], dim, model, HEADER.size + model_len
+
+
+def decode_embedding(value) -> np.ndarray:
+    """
+    Lê um embedding do banco como ndarray, sem passar por listas Python
+    (o vetor é uma view sobre o próprio blob). Aceita também o JSON legado.
+    """
+    if value is None:
+        return None
+    if is_legacy(value):
+        data = json.loads(value)
+        return np.asarray(data, dtype=np.float32) if data else None
+    dtype, dim, _, offset = read_header(value)
+    return np.frombuffer(value, dtype=dtype, count=dim, offset=offset)
+
+
+def embedding_model(value) -> str:
+    """Nome do modelo que gerou o embedding ('' para o formato JSON legado)."""
+    if value is None or is_legacy(value):
+        return ""
+    return read_header(value)[2]
+
+
+def decode_many(ids, values):
+    """
+    Decodifica vários blobs direto para uma matriz float32 pré-alocada.
+    Linhas vazias ou com dimensão diferente da primeira são descartadas.
+    Retorna (ids, matriz).
+    """
+    ids = list(ids)
+    values = list(values)
+    dim = 0
+    for value in values:
+        vector = decode_embedding(value)
+        if vector is not None and len(vector):
+            dim = len(vector)
+            break
+
+    matrix = np.empty((len(values), dim), dtype=np.float32)
+    kept = []
+    for item_id, value in zip(ids, values):
+        vector = decode_embedding(value)
+        if vector is None or len(vector) != dim or not dim:
+            continue
+        matrix[len(kept)] = vector
+        kept.append(item_id)
+
+    return np.array(kept, dtype=np.int64), matrix[:len(kept)]
+
+
+# -------------------------
+# Tipo da coluna de embedding
+# -------------------------
+class EmbeddingColumn(TypeDecorator):
+    """
+    No SQLite, o blob binário acima (LargeBinary). No PostgreSQL, uma coluna
+    `vector` do pgvector, que permite índice ANN e busca por similaridade no
+    próprio SQL. O resto do código continua lendo e gravando blobs: a
+    conversão acontece aqui, na entrada e na saída do banco.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            from pgvector.sqlalchemy import Vector  # só necessário com PostgreSQL
+            return dialect.type_descriptor(Vector())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "postgresql":
+            return value
+        return decode_embedding(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name != "postgresql":
+            return value
+        # o modelo fica na coluna embedding_model; o vetor volta sem perda (float32)
+        return encode_embedding(value, dtype="float32")
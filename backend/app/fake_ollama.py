@@ -0,0 +1,209 @@
+"""
+Servidor Ollama falso e determinístico, para benchmarks e testes locais.
+
+Responde /api/embeddings, /api/embed (lote) e /api/generate (com e sem
+stream) sem carregar nenhum modelo. Os embeddings são "bag of words" com
+tópicos: cada palavra tem um vetor fixo (derivado do hash dela) puxado na
+direção do vetor do seu tópico. Textos com palavras do mesmo tópico ficam
+próximos e textos sem relação ficam distantes, como num modelo de verdade,
+e o mesmo texto sempre gera o mesmo vetor.
+
+Com --embed-parallel 1 e --embed-text-latency, simula o Ollama só de CPU:
+uma chamada de embedding por vez, com custo fixo por chamada mais um custo
+por texto, como no servidor real.
+
+    cd backend
+    python -m app.fake_ollama --port 11434 --embed-latency 0.005
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+DIM = 768
+TOPICS = 256
+TOPIC_WEIGHT = 0.35  # quanto do vetor da palavra vem do tópico (o resto é ruído próprio)
+TOKEN = re.compile(r"\w+")
+
+
+# -------------------------
+# Embeddings determinísticos
+# -------------------------
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def topic_of(word: str) -> int:
+    return _seed(word) % TOPICS
+
+
+@lru_cache(maxsize=TOPICS)
+def _topic_vector(topic: int, dim: int):
+    vector = np.random.default_rng(topic).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@lru_cache(maxsize=200_000)
+def _word_vector(word: str, dim: int):
+    noise = np.random.default_rng(_seed(word)).standard_normal(dim).astype(np.float32)
+    noise /= np.linalg.norm(noise)
+    vector = TOPIC_WEIGHT * _topic_vector(topic_of(word), dim) + (1 - TOPIC_WEIGHT ** 2) ** 0.5 * noise
+    vector.flags.writeable = False
+    return vector
+
+
+def embed(text: str, dim: int = DIM):
+    """Vetor normalizado do texto (soma dos vetores das palavras)."""
+    words = TOKEN.findall(text.lower())
+    if not words:
+        vector = _word_vector("", dim).copy()
+    else:
+        vector = np.add.reduce([_word_vector(w, dim) for w in words])
+    return vector / np.linalg.norm(vector)
+
+
+# -------------------------
+# Servidor HTTP
+# -------------------------
+class FakeOllama(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dim: int = DIM, embed_latency: float = 0.0,
+                 generate_latency: float = 0.0, token_latency: float = 0.0,
+                 embed_text_latency: float = 0.0, embed_parallel: int = 0):
+        super().__init__(address, Handler)
+        self.dim = dim
+        self.embed_latency = embed_latency        # segundos por chamada de embedding
+        self.embed_text_latency = embed_text_latency  # segundos a mais por texto da chamada
+        # chamadas de embedding atendidas ao mesmo tempo (0 = sem limite)
+        self.embed_slots = threading.Semaphore(embed_parallel) if embed_parallel > 0 else None
+        self.generate_latency = generate_latency  # segundos até o 1º token
+        self.token_latency = token_latency        # segundos entre tokens
+        self.requests = 0
+        self.embedded_texts = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, texts: int = 0):
+        with self._lock:
+            self.requests += 1
+            self.embedded_texts += texts
+
+    def embed_delay(self, texts: int):
+        delay = self.embed_latency + self.embed_text_latency * texts
+        if self.embed_slots is None:
+            time.sleep(delay)
+            return
+        with self.embed_slots:
+            time.sleep(delay)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, payload: dict):
+        line = (json.dumps(payload) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            return self._json(200, {"models": []})
+        if self.path == "/api/stats":
+            return self._json(200, {"requests": self.server.requests, "embedded_texts": self.server.embedded_texts})
+        self._json(200, {"status": "Ollama is running"})
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError:
+            return self._json(400, {"error": "invalid JSON"})
+        server = self.server
+
+        if self.path == "/api/embeddings":
+            server.count(1)
+            server.embed_delay(1)
+            return self._json(200, {"embedding": embed(str(body.get("prompt", "")), server.dim).tolist()})
+
+        if self.path == "/api/embed":
+            texts = body.get("input", [])
+            texts = [texts] if isinstance(texts, str) else texts
+            server.count(len(texts))
+            server.embed_delay(len(texts))
+            return self._json(200, {"embeddings": [embed(str(t), server.dim).tolist() for t in texts]})
+
+        if self.path == "/api/generate":
+            server.count()
+            # resposta fixa a partir do fim do prompt (o texto da pergunta)
+            words = TOKEN.findall(str(body.get("prompt", "")))[-12:]
+            tokens = ["Answer", ":"] + [f" {w}" for w in words] + ["."]
+            time.sleep(server.generate_latency)
+            if not body.get("stream", True):
+                time.sleep(server.token_latency * len(tokens))
+                return self._json(200, {"response": "".join(tokens), "done": True})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                self._chunk({"response": token, "done": False})
+                time.sleep(server.token_latency)
+            self._chunk({"response": "", "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        self._json(404, {"error": f"unknown path {self.path}"})
+
+
+def start(host: str = "127.0.0.1", port: int = 0, **options) -> FakeOllama:
+    """Sobe o servidor numa thread daemon; `server.url` tem o endereço."""
+    server = FakeOllama((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor Ollama falso e determinístico")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dim", type=int, default=DIM, help="dimensão dos embeddings")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="segundos por chamada de embedding")
+    parser.add_argument("--embed-text-latency", type=float, default=0.0, help="segundos a mais por texto embedado")
+    parser.add_argument("--embed-parallel", type=int, default=0,
+                        help="chamadas de embedding atendidas ao mesmo tempo (0 = sem limite)")
+    parser.add_argument("--generate-latency", type=float, default=0.0, help="segundos até o primeiro token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="segundos entre tokens")
+    args = parser.parse_args()
+
+    server = FakeOllama((args.host, args.port), dim=args.dim, embed_latency=args.embed_latency,
+                        generate_latency=args.generate_latency, token_latency=args.token_latency,
+                        embed_text_latency=args.embed_text_latency, embed_parallel=args.embed_parallel)
+    print(f"🦙 Ollama falso em {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Relatório de recall x latência dos backends de busca vetorial.
+
+Usa os embeddings já salvos no banco: sorteia vetores do próprio corpus como
+consultas (com um pouco de ruído, para não serem cópias exatas), compara o
+top-k de cada backend com a busca exata (numpy) e mede tempo de construção,
+latência por consulta (p50/p99), memória dos vetores e recall@k.
+
+O backend comprimido (numpy-int8) é medido em cada combinação de dimensão,
+método de redução e número de candidatos re-ranqueados (0 = só a 1ª
+passada aproximada), para ver quanto recall cada economia custa:
+
+    cd backend
+    python -m app.index_report --corpus chunks --k 10 --queries 200
+    python -m app.index_report --backends numpy numpy-int8 --reduce-dims 128 256 768 --rerank 0 50 200
+"""
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from app import database, models, embedding_codec, vector_index
+
+BACKENDS = ["numpy", "numpy-int8", "faiss-flat", "faiss-ivf", "faiss-hnsw"]
+
+
+def load_corpus(corpus: str):
+    db = database.SessionLocal()
+    try:
+        if corpus == "questions":
+            rows = db.query(models.QuestionEmbedding.question_id, models.QuestionEmbedding.embedding).all()
+        else:
+            rows = db.query(models.DocumentChunk.id, models.DocumentChunk.embedding).all()
+    finally:
+        db.close()
+    return embedding_codec.decode_many((r[0] for r in rows), (r[1] for r in rows))
+
+
+def variants(backend, args):
+    """(rótulo, índice) de cada configuração a medir do backend."""
+    if backend != "numpy-int8":
+        yield backend, lambda: vector_index.create_index(f"report-{backend}", backend)
+        return
+    for method in args.methods:
+        for dim in args.reduce_dims:
+            for rerank in args.rerank:
+                label = f"numpy-int8/{method}-{dim}/rerank-{rerank}"
+                yield label, lambda m=method, d=dim, r=rerank: vector_index.QuantizedVectorIndex(
+                    "report", reduce_dim=d, method=m, rerank=r, rerank_source="memory")
+
+
+def evaluate(backend, make_index, ids, matrix, queries, k, truth):
+    with tempfile.TemporaryDirectory() as tmp:
+        index = make_index()
+        if hasattr(index, "directory"):
+            index.directory = tmp
+        if not backend.startswith(index.backend):
+            return None  # faiss ausente
+
+        start = time.perf_counter()
+        index.build(ids, matrix)
+        build_s = time.perf_counter() - start
+
+        nbytes = getattr(index, "nbytes", None)
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            hits = index.search(query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len({h[0] for h in hits} & expected) / max(1, len(expected)))
+
+    return {
+        "backend": backend,
+        "build_s": round(build_s, 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mb": round(nbytes / 2 ** 20, 2) if nbytes is not None else None,
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall x latência dos backends de busca vetorial")
+    parser.add_argument("--corpus", choices=["chunks", "questions"], default="chunks")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="desvio do ruído somado às consultas")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS)
+    parser.add_argument("--reduce-dims", type=int, nargs="+", default=[vector_index.VECTOR_REDUCE_DIM],
+                        help="dimensões da 1ª passada do numpy-int8")
+    parser.add_argument("--methods", nargs="+", choices=["pca", "truncate"], default=[vector_index.VECTOR_REDUCE_METHOD])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, vector_index.VECTOR_RERANK_CANDIDATES],
+                        help="candidatos re-ranqueados com float32 (0 = sem re-ranking)")
+    parser.add_argument("--json", help="grava o relatório neste arquivo")
+    args = parser.parse_args()
+
+    ids, matrix = load_corpus(args.corpus)
+    if not len(ids):
+        print("⚠️ Nenhum embedding encontrado no banco.")
+        return
+
+    rng = np.random.default_rng(42)
+    sample = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+    queries = vector_index.normalize(matrix[sample])
+    queries = queries + rng.normal(0, args.noise, queries.shape).astype(np.float32)
+
+    exact = vector_index.VectorIndex("exact")
+    exact.build(ids, matrix)
+    truth = [{h[0] for h in exact.search(q, args.k)} for q in queries]
+
+    print(f"📊 {args.corpus}: {len(ids)} vetores de dimensão {matrix.shape[1]}, {len(queries)} consultas, k={args.k}\n")
+    results = []
+    for backend in args.backends:
+        for label, make_index in variants(backend, args):
+            result = evaluate(label, make_index, ids, matrix, queries, args.k, truth)
+            if result is None:
+                print(f"⚠️ {backend}: faiss não instalado, ignorado.")
+                break
+            results.append(result)
+            print("  ".join(f"{key}={value}" for key, value in result.items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"corpus": args.corpus, "size": int(len(ids)), "dim": int(matrix.shape[1]),
+                       "k": args.k, "results": results}, f, indent=2)
+        print(f"\n💾 Relatório salvo em {args.json}")
+
+
+if __name__ == "__main__":
+    main()
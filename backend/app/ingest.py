@@ -0,0 +1,432 @@
+"""
+Fila de ingestão de PDFs.
+
+Os PDFs enviados por POST /admin/pdfs são gravados em UPLOAD_FOLDER, um
+arquivo por envio, e viram jobs na tabela ingest_jobs. Um job indexa sempre
+o seu arquivo (um reenvio com o mesmo nome nunca troca o PDF no meio da
+extração) e, ao terminar, o publica em PDF_FOLDER com o nome original. Um pool de threads próprio (INGEST_WORKERS por
+processo da API, fora do threadpool que atende as requisições) pega os jobs
+em ordem de chegada e roda o process_pdf do pdf_indexer, gravando o
+progresso no job. Os lotes de embedding da indexação cedem a vez ao /ask e
+desaceleram quando o Ollama satura (ver ollama_client.PriorityLimiter).
+
+A fila fica no banco: sobrevive a reinícios, e vários processos (workers do
+uvicorn ou o comando abaixo) consomem a mesma fila, porque cada job é pego
+com um UPDATE condicional.
+
+    cd backend
+    python -m app.ingest enqueue pdfs   # enfileira os PDFs da pasta
+    python -m app.ingest work           # processa a fila fora da API
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from app import database, metrics, models, pdf_indexer
+from app.ollama_client import priority
+
+load_dotenv()
+
+# 🔹 Pasta onde os PDFs enviados são gravados (a mesma do pdf_indexer)
+PDF_FOLDER = os.getenv("PDF_FOLDER", "pdfs")
+# envios ainda não indexados, um arquivo por upload (fora da listagem de *.pdf da pasta)
+UPLOAD_FOLDER = os.path.join(PDF_FOLDER, ".uploads")
+# 🔹 Threads de ingestão por processo da API (0 = a API só enfileira)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+# 🔹 Jobs pendentes acima dos quais o upload responde 429
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "100"))
+INGEST_MAX_UPLOAD_MB = float(os.getenv("INGEST_MAX_UPLOAD_MB", "200"))
+# 🔹 Tentativas por job (com espera crescente) e quando um job "running" sem sinal volta para a fila
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_RETRY_DELAY = float(os.getenv("INGEST_RETRY_DELAY", "30"))
+INGEST_STALE_SECONDS = float(os.getenv("INGEST_STALE_SECONDS", "120"))
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "2"))
+PROGRESS_INTERVAL = 1.0  # segundos entre gravações de progresso
+# sinal de vida do job (thread própria, independente do progresso) e busca por jobs sem sinal
+HEARTBEAT_INTERVAL = INGEST_STALE_SECONDS / 4
+STALE_CHECK_INTERVAL = INGEST_STALE_SECONDS / 4
+
+ACTIVE = ("queued", "running", "cancelling")
+STATUSES = ACTIVE + ("done", "failed", "cancelled")
+
+_stop = threading.Event()
+_wake = threading.Event()
+_threads = []
+_stale_checked = 0.0
+_stale_lock = threading.Lock()
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+class IngestStopped(Exception):
+    """O processo está desligando: o job volta para a fila sem gastar tentativa."""
+
+
+class IngestLost(Exception):
+    """O job foi devolvido à fila e pego por outro worker: este para sem gravar nada nele."""
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def safe_name(filename: str):
+    """Nome do arquivo sem diretórios, com extensão .pdf (o que o pdf_indexer procura); None se inválido."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    stem, ext = os.path.splitext(name)
+    if not stem or stem.startswith(".") or ext.lower() != ".pdf":
+        return None
+    return stem + ".pdf"
+
+
+# -------------------------
+# Fila
+# -------------------------
+def pending(db: Session) -> int:
+    return db.query(func.count(models.IngestJob.id)).filter(models.IngestJob.status.in_(ACTIVE)).scalar()
+
+
+def has_capacity(db: Session) -> bool:
+    return pending(db) < INGEST_MAX_QUEUED
+
+
+def staged(file_path: str) -> bool:
+    """Arquivo de um envio (em UPLOAD_FOLDER), e não um PDF já publicado na pasta."""
+    return os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(UPLOAD_FOLDER)
+
+
+def _discard(file_path: str):
+    if file_path and staged(file_path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+def enqueue(db: Session, source_name: str, file_path: str) -> models.IngestJob:
+    """Cria o job (ou troca o arquivo do que ainda espera na fila para o mesmo nome) e acorda os workers."""
+    job = db.query(models.IngestJob).filter(
+        models.IngestJob.source_name == source_name, models.IngestJob.status == "queued"
+    ).first()
+    if job is not None:
+        previous = job.file_path
+        # condicional: se um worker pegou o job nesse meio-tempo, ele segue com o arquivo dele
+        replaced = db.query(models.IngestJob).filter(
+            models.IngestJob.id == job.id, models.IngestJob.status == "queued"
+        ).update({"file_path": file_path, "available_at": None}, synchronize_session=False)
+        pdf_indexer.safe_commit(db)
+        if replaced:
+            if previous != file_path:
+                _discard(previous)  # envio anterior que nunca foi indexado
+            _wake.set()
+            db.refresh(job)
+            return job
+    job = models.IngestJob(source_name=source_name, file_path=file_path, status="queued",
+                           attempts=0, pages_done=0, chunks_written=0, created_at=time.time())
+    db.add(job)
+    pdf_indexer.safe_commit(db)
+    _wake.set()
+    return job
+
+
+def _publish(job: models.IngestJob):
+    """PDF indexado com sucesso: passa a ser o arquivo da pasta (o que o pdf_indexer e o /admin/pdfs enxergam)."""
+    if not staged(job.file_path):
+        return
+    target = os.path.join(PDF_FOLDER, job.source_name)
+    try:
+        os.replace(job.file_path, target)
+    except OSError as e:
+        print(f"⚠️ Não foi possível publicar '{job.source_name}' em {PDF_FOLDER}: {e}")
+
+
+def _recover_stale(db: Session):
+    """Jobs de processos que morreram no meio: voltam para a fila (ou terminam, se estavam sendo cancelados)."""
+    limit = time.time() - INGEST_STALE_SECONDS
+    stale = (models.IngestJob.heartbeat_at < limit) | models.IngestJob.heartbeat_at.is_(None)
+    requeued = db.query(models.IngestJob).filter(models.IngestJob.status == "running", stale).update(
+        {"status": "queued", "worker": None}, synchronize_session=False
+    )
+    cancelled = db.query(models.IngestJob).filter(models.IngestJob.status == "cancelling", stale).update(
+        {"status": "cancelled", "finished_at": time.time()}, synchronize_session=False
+    )
+    if requeued or cancelled:
+        pdf_indexer.safe_commit(db)
+    else:
+        db.rollback()
+    if requeued:
+        print(f"🔁 {requeued} jobs de ingestão sem sinal voltaram para a fila.")
+
+
+def _check_stale(db: Session):
+    """Procura jobs sem sinal de tempos em tempos, não a cada poll de cada worker."""
+    global _stale_checked
+    with _stale_lock:
+        if time.monotonic() - _stale_checked < STALE_CHECK_INTERVAL:
+            return
+        _stale_checked = time.monotonic()
+    _recover_stale(db)
+
+
+def claim(db: Session):
+    """Pega o job mais antigo disponível; o UPDATE condicional garante um único dono."""
+    _check_stale(db)
+    now = time.time()
+    busy = {row[0] for row in db.query(models.IngestJob.source_name).filter(
+        models.IngestJob.status.in_(("running", "cancelling")))}
+    candidates = db.query(models.IngestJob.id, models.IngestJob.source_name).filter(
+        models.IngestJob.status == "queued",
+        or_(models.IngestJob.available_at.is_(None), models.IngestJob.available_at <= now),
+    ).order_by(models.IngestJob.id).limit(10).all()
+    for job_id, source_name in candidates:
+        if source_name in busy:
+            continue  # o mesmo arquivo já está sendo indexado: espera terminar
+        claimed = db.query(models.IngestJob).filter(
+            models.IngestJob.id == job_id, models.IngestJob.status == "queued"
+        ).update({
+            "status": "running", "worker": worker_id(), "attempts": models.IngestJob.attempts + 1,
+            "started_at": now, "heartbeat_at": now, "finished_at": None, "error": None,
+        }, synchronize_session=False)
+        pdf_indexer.safe_commit(db)
+        if claimed:
+            return db.get(models.IngestJob, job_id)
+    return None
+
+
+def _owned(job_id: int, attempt: int):
+    """Filtro do job enquanto ele ainda é desta execução (mesmo worker, mesma tentativa)."""
+    return (
+        models.IngestJob.id == job_id,
+        models.IngestJob.worker == worker_id(),
+        models.IngestJob.attempts == attempt,
+        models.IngestJob.status.in_(("running", "cancelling")),
+    )
+
+
+@contextmanager
+def _heartbeat(job_id: int, attempt: int):
+    """Renova o heartbeat_at numa thread própria: um lote de embedding lento não faz o job parecer morto."""
+    done = threading.Event()
+
+    def beat():
+        while not done.wait(HEARTBEAT_INTERVAL):
+            try:
+                with database.SessionLocal() as db:
+                    db.query(models.IngestJob).filter(*_owned(job_id, attempt)).update(
+                        {"heartbeat_at": time.time()}, synchronize_session=False
+                    )
+                    pdf_indexer.safe_commit(db)
+            except Exception as e:
+                print(f"⚠️ Falha ao renovar o heartbeat do job {job_id}: {e}")
+
+    thread = threading.Thread(target=beat, name=f"ingest-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def _finish(db: Session, job: models.IngestJob, attempt: int, **values) -> bool:
+    """Grava o resultado só se o job ainda é desta execução; senão, outro worker já cuida dele."""
+    updated = db.query(models.IngestJob).filter(*_owned(job.id, attempt)).update(values, synchronize_session=False)
+    pdf_indexer.safe_commit(db)
+    db.expire(job)
+    if not updated:
+        print(f"⚠️ Job {job.id} foi retomado por outro worker; resultado desta execução descartado.")
+    return bool(updated)
+
+
+def _reporter(job_id: int, attempt: int):
+    """Callback de progresso do process_pdf: grava o avanço (no máximo 1x/s) e atende cancelamentos."""
+    last = 0.0
+
+    def report(pages_done, page_count, written):
+        nonlocal last
+        if _stop.is_set():
+            raise IngestStopped("shutting down")
+        now = time.time()
+        if pages_done < page_count and now - last < PROGRESS_INTERVAL:
+            return
+        last = now
+        with database.SessionLocal() as db:
+            job = db.get(models.IngestJob, job_id)
+            if job is None or job.status == "cancelling":
+                raise IngestCancelled("cancelled by an admin")
+            if job.worker != worker_id() or job.attempts != attempt or job.status != "running":
+                raise IngestLost(f"job {job_id} was taken over by {job.worker}")
+            job.page_count, job.pages_done, job.chunks_written = page_count, pages_done, written
+            job.heartbeat_at = now
+            pdf_indexer.safe_commit(db)
+
+    return report
+
+
+def run(db: Session, job: models.IngestJob):
+    """Indexa o PDF do job e registra o resultado (com nova tentativa em falhas transitórias)."""
+    started = time.perf_counter()
+    attempt, source_name = job.attempts, job.source_name
+    try:
+        with _heartbeat(job.id, attempt):
+            written = pdf_indexer.process_pdf(job.file_path, on_progress=_reporter(job.id, attempt),
+                                              raise_errors=True, source_name=source_name)
+        record = db.query(models.IndexedDocument).filter_by(source_name=source_name).first()
+        if record is None or record.status != "complete":
+            raise RuntimeError("some chunks could not be embedded")
+    except IngestLost as e:
+        db.rollback()
+        print(f"⚠️ Ingestão de '{source_name}' abandonada: {e}")
+        return job
+    except IngestStopped:
+        db.rollback()
+        _finish(db, job, attempt, status="queued", worker=None, attempts=max(0, attempt - 1))
+        return job
+    except IngestCancelled:
+        db.rollback()
+        if _finish(db, job, attempt, status="cancelled", finished_at=time.time()):
+            _discard(job.file_path)
+        print(f"🛑 Ingestão de '{source_name}' cancelada.")
+        return job
+    except Exception as e:
+        db.rollback()
+        values = {"error": str(e)}
+        if not isinstance(e, FileNotFoundError) and attempt < INGEST_MAX_ATTEMPTS:
+            values.update(status="queued", worker=None,
+                          available_at=time.time() + INGEST_RETRY_DELAY * 2 ** (attempt - 1))
+        else:
+            values.update(status="failed", finished_at=time.time())
+        if _finish(db, job, attempt, **values) and values.get("status") == "failed":
+            _discard(job.file_path)
+        print(f"⚠️ Ingestão de '{source_name}' falhou (tentativa {attempt}/{INGEST_MAX_ATTEMPTS}): {e}")
+        return job
+
+    if _finish(db, job, attempt, status="done", page_count=record.page_count, pages_done=record.page_count,
+               chunks_written=written, finished_at=time.time()):
+        _publish(job)
+        metrics.record_stage("ingest.job", time.perf_counter() - started)
+    return job
+
+
+def cancel(db: Session, job_id: int):
+    """Na fila: cancela na hora. Rodando: o worker para no próximo lote. Devolve o job (None se não existe)."""
+    job = db.get(models.IngestJob, job_id)
+    if job is None:
+        return None
+    discard = job.status == "queued"
+    if job.status == "queued":
+        job.status, job.finished_at = "cancelled", time.time()
+    elif job.status == "running":
+        job.status = "cancelling"
+    pdf_indexer.safe_commit(db)
+    if discard:
+        _discard(job.file_path)
+    return job
+
+
+def list_jobs(db: Session, status: str = None, skip: int = 0, limit: int = 20):
+    query = db.query(models.IngestJob)
+    if status:
+        query = query.filter(models.IngestJob.status == status)
+    return query.order_by(models.IngestJob.id.desc()).offset(skip).limit(limit).all()
+
+
+def counts(db: Session) -> dict:
+    rows = db.query(models.IngestJob.status, func.count(models.IngestJob.id)).group_by(models.IngestJob.status)
+    return {status: count for status, count in rows}
+
+
+def status(db: Session) -> dict:
+    return {
+        "jobs": counts(db),
+        "max_queued": INGEST_MAX_QUEUED,
+        "workers": sum(thread.is_alive() for thread in _threads),
+        "ollama": priority.stats(),
+    }
+
+
+# -------------------------
+# Pool de workers
+# -------------------------
+def _work(poll: float):
+    while not _stop.is_set():
+        try:
+            with database.SessionLocal() as db:
+                job = claim(db)
+                if job is not None:
+                    run(db, job)
+                    continue
+        except Exception as e:
+            print(f"⚠️ Falha na fila de ingestão: {e}")
+        _wake.wait(poll)
+        _wake.clear()
+
+
+def start_workers(workers: int = INGEST_WORKERS, poll: float = INGEST_POLL_INTERVAL) -> int:
+    """Sobe as threads de ingestão deste processo (no máximo uma vez)."""
+    if workers <= 0 or any(thread.is_alive() for thread in _threads):
+        return 0
+    os.makedirs(PDF_FOLDER, exist_ok=True)
+    _stop.clear()
+    _threads.clear()
+    for number in range(workers):
+        thread = threading.Thread(target=_work, args=(poll,), name=f"ingest-{number}", daemon=True)
+        thread.start()
+        _threads.append(thread)
+    return workers
+
+
+def stop_workers(timeout: float = 10.0):
+    """Pede para as threads pararem; um job no meio volta para a fila e continua de onde parou."""
+    _stop.set()
+    _wake.set()
+    deadline = time.monotonic() + timeout
+    for thread in _threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+
+def _job_counts():
+    with database.SessionLocal() as db:
+        return counts(db)
+
+
+metrics.collector("ingest_jobs", "gauge", "Ingestion jobs by status", _job_counts, labels=("status",))
+
+
+if __name__ == "__main__":
+    from app import migrations, refresh_embeddings
+
+    parser = argparse.ArgumentParser(description="Fila de ingestão de PDFs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue_parser = commands.add_parser("enqueue", help="enfileira os PDFs de uma pasta")
+    enqueue_parser.add_argument("folder", nargs="?", default=PDF_FOLDER, help="pasta onde estão os PDFs")
+    work_parser = commands.add_parser("work", help="processa a fila até ser interrompido")
+    work_parser.add_argument("--workers", type=int, default=max(1, INGEST_WORKERS), help="jobs em paralelo")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+
+    if args.command == "enqueue":
+        with database.SessionLocal() as session:
+            names = sorted(f for f in os.listdir(args.folder) if f.endswith(".pdf"))
+            for filename in names:
+                enqueue(session, filename, os.path.join(args.folder, filename))
+        print(f"📥 {len(names)} PDFs enfileirados a partir de '{args.folder}'.")
+    else:
+        with database.SessionLocal() as session:
+            refresh_embeddings.apply_active_model(session)
+        start_workers(args.workers)
+        print(f"👷 {args.workers} workers de ingestão rodando (Ctrl+C para parar).")
+        try:
+            while any(thread.is_alive() for thread in _threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stop_workers()
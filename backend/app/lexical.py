@@ -0,0 +1,128 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# -------------------------
+# Índice lexical (SQLite FTS5 / BM25 ou full-text do PostgreSQL)
+# -------------------------
+# Tabelas FTS "external content": o texto fica só na tabela original e os
+# triggers mantêm o índice em dia a cada INSERT/UPDATE/DELETE. No PostgreSQL,
+# um índice GIN sobre to_tsvector faz o mesmo papel, sem tabela extra.
+FTS_TABLES = {
+    "questions": ("questions_fts", "questions", "text"),
+    "chunks": ("document_chunks_fts", "document_chunks", "content"),
+}
+
+# IDs como "GLI-11", "3.2.1" ou "CH-04" viram uma frase exata ("gli 11")
+TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "of", "on", "or", "the", "to", "what", "when", "where", "which", "who", "why",
+    "with", "o", "os", "as", "de", "da", "do", "das", "dos", "e", "em", "um", "uma", "que", "para",
+    "com", "no", "na", "por", "se",
+}
+
+_available = None
+_dialect = None
+
+
+def create_fts(engine: Engine):
+    """Cria as tabelas FTS5 e os triggers (SQLite) ou os índices GIN (PostgreSQL)."""
+    global _available, _dialect
+    _dialect = engine.dialect.name
+    if _dialect == "postgresql":
+        with engine.begin() as conn:
+            for fts, table, column in FTS_TABLES.values():
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {fts} ON {table} USING gin (to_tsvector('simple', {column}))"
+                ))
+        _available = True
+        return
+    if _dialect != "sqlite":
+        _available = False
+        return
+    with engine.begin() as conn:
+        for fts, table, column in FTS_TABLES.values():
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}
+            ).first()
+            try:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                    f"{column}, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+                ))
+            except Exception as e:
+                print(f"⚠️ SQLite sem FTS5, busca lexical desativada: {e}")
+                _available = False
+                return
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+                f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END"
+            ))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+                print(f"🔎 Índice lexical '{fts}' criado.")
+    _available = True
+
+
+def fts_query(question: str):
+    """Monta uma consulta FTS5 segura (termos entre aspas, unidos por OR)."""
+    terms = []
+    for token in TOKEN.findall(question.lower()):
+        parts = re.findall(r"\w+", token)
+        if len(parts) > 1:
+            terms.append('"' + " ".join(parts) + '"')
+        elif len(token) > 1 and token not in STOPWORDS:
+            terms.append(f'"{token}"')
+    return " OR ".join(dict.fromkeys(terms)) or None
+
+
+def tsquery(question: str):
+    """Mesma consulta para o to_tsquery do PostgreSQL ('gli' <-> '11' | 'payout')."""
+    terms = []
+    for token in TOKEN.findall(question.lower()):
+        parts = re.findall(r"\w+", token)
+        if len(parts) > 1:
+            terms.append("(" + " <-> ".join(f"'{part}'" for part in parts) + ")")
+        elif len(token) > 1 and token not in STOPWORDS:
+            terms.append(f"'{token}'")
+    return " | ".join(dict.fromkeys(terms)) or None
+
+
+def search(db: Session, corpus: str, question: str, k: int = 50):
+    """Retorna os ids do corpus ("questions" ou "chunks") em ordem de relevância (BM25 / ts_rank)."""
+    if not _available:
+        return []
+    fts, table, column = FTS_TABLES[corpus]
+    query = tsquery(question) if _dialect == "postgresql" else fts_query(question)
+    if not query:
+        return []
+    if _dialect == "postgresql":
+        sql = (
+            f"SELECT id FROM {table}, to_tsquery('simple', :query) q "
+            f"WHERE to_tsvector('simple', {column}) @@ q "
+            f"ORDER BY ts_rank_cd(to_tsvector('simple', {column}), q) DESC LIMIT :k"
+        )
+    else:
+        sql = f"SELECT rowid FROM {fts} WHERE {fts} MATCH :query ORDER BY rank LIMIT :k"
+    try:
+        if _dialect == "postgresql":
+            # um erro no PostgreSQL invalida a transação inteira: isola a busca num savepoint
+            with db.begin_nested():
+                rows = db.execute(text(sql), {"query": query, "k": k}).all()
+        else:
+            rows = db.execute(text(sql), {"query": query, "k": k}).all()
+    except Exception as e:
+        print(f"⚠️ Falha na busca lexical: {e}")
+        return []
+    return [row[0] for row in rows]
@@ -1,18 +1,84 @@
 from fastapi import FastAPI, Depends, HTTPException, Header, Request
 from sqlalchemy.orm import Session
-from . import models, schemas, crud, database, utils
+from . import models, schemas, crud, database, utils, vector_index, retrieval, bulk, refresh_embeddings, metrics, unanswered, ingest, warmup, maintenance
+from .embedding_cache import embedding_cache
+from .answer_cache import answer_cache
+from .ollama_client import ollama
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
+import tempfile
 
 # 🔹 Carregar variáveis do .env
 load_dotenv()
 
-# Criar as tabelas no banco
-models.Base.metadata.create_all(bind=database.engine)
+# 🔹 Quantos trechos de PDF entram na resposta do /ask e no prompt do /ask/stream
+ASK_CONTEXT_CHUNKS = int(os.getenv("ASK_CONTEXT_CHUNKS", "3"))
+ANSWER_MAX_CHARS = int(os.getenv("ANSWER_MAX_CHARS", "1500"))  # tamanho da resposta montada com os trechos
+# 🔹 De quanto em quanto tempo conferir se um refresh_embeddings (em outro processo) trocou o modelo
+EMBEDDING_MODEL_CHECK_INTERVAL = float(os.getenv("EMBEDDING_MODEL_CHECK_INTERVAL", "15"))
 
-app = FastAPI()
+NO_ANSWER = "❓ I don’t have this answer now. Please check with one of the leads."
+
+def sync_embedding_model():
+    db = database.SessionLocal()
+    try:
+        return refresh_embeddings.sync_active_model(db)
+    finally:
+        db.close()
+
+async def watch_embedding_model():
+    # troca para os vetores novos assim que um job concluído em outro processo é ativado
+    while True:
+        await asyncio.sleep(EMBEDDING_MODEL_CHECK_INTERVAL)
+        try:
+            await run_in_threadpool(sync_embedding_model)
+        except Exception as e:
+            print("⚠️ Falha ao verificar o modelo de embeddings:", e)
+
+def backfill_unanswered():
+    db = database.SessionLocal()
+    try:
+        unanswered.backfill(db)
+    except Exception as e:
+        print("⚠️ Falha ao agrupar perguntas pendentes antigas:", e)
+    finally:
+        db.close()
+
+async def start_background_jobs(jobs: list):
+    # o que mexe nos índices começa depois que eles carregaram
+    await warmup.wait_for("index")
+    jobs.append(asyncio.create_task(watch_embedding_model()))
+    # PDFs enviados pelo /admin/pdfs: threads próprias, fora do threadpool das requisições
+    ingest.start_workers()
+    # backup, checkpoint, limpeza e VACUUM do SQLite, em passos pequenos
+    maintenance.start_scheduler()
+    # perguntas pendentes gravadas antes do agrupamento (precisam do Ollama para o embedding)
+    await warmup.wait_for("embedding_model")
+    jobs.append(asyncio.create_task(run_in_threadpool(backfill_unanswered)))
+
+# 🔹 Subida: só o banco antes de aceitar conexões; índices e modelos aquecem em segundo plano (ver /ready)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warmup.start_database()
+    jobs = []
+    jobs.append(asyncio.create_task(warmup.warm_up()))
+    jobs.append(asyncio.create_task(start_background_jobs(jobs)))
+    yield
+    for job in jobs:
+        job.cancel()
+    await run_in_threadpool(ingest.stop_workers)
+    await run_in_threadpool(maintenance.stop_scheduler)
+    if warmup.is_done("index"):  # índice pela metade não vira snapshot
+        vector_index.save_indexes()
+    await ollama.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # 🔹 Permitir acesso do frontend local
 app.add_middleware(
@@ -21,7 +87,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# 🔹 Tempo por rota e por etapa (/metrics e cabeçalho Server-Timing)
+if metrics.METRICS_ENABLED or metrics.TIMING_HEADER != "off":
+    app.add_middleware(metrics.TimingMiddleware)
 
 # 🔹 Dependência para abrir/fechar sessão
 def get_db():
@@ -31,6 +101,11 @@ def get_db():
     finally:
         db.close()
 
+# 🔹 Rotas de busca esperam o índice carregar (logo depois de subir)
+async def index_ready():
+    if not await warmup.wait_for("index", warmup.STARTUP_WAIT_TIMEOUT):
+        raise HTTPException(status_code=503, detail="Search index is still loading", headers={"Retry-After": "5"})
+
 # 🔹 Verificação do ADMIN_KEY
 async def verify_admin(request: Request, admin_key: str = Header(None)):
     # aceita Admin-Key, admin_key, ou adminkey
@@ -49,82 +124,43 @@ async def verify_admin(request: Request, admin_key: str = Header(None)):
 def read_root():
     return {"message": "Agent API is running with embeddings ready!"}
 
-@app.post("/ask")
-def ask_question(user_question: str, db: Session = Depends(get_db)):
+# 🔥 Prontidão: 200 só com o índice carregado e o modelo de embeddings quente (healthcheck/balanceador)
+@app.get("/ready")
+def readiness():
+    return JSONResponse(warmup.status(), status_code=200 if warmup.is_ready() else 503)
+
+@app.post("/ask", dependencies=[Depends(index_ready)])
+async def ask_question(user_question: str, db: Session = Depends(get_db)):
     try:
-        # 1️⃣ Gera embedding da pergunta do usuário
-        user_embedding = utils.get_embedding(user_question)
+        # 0️⃣ Pergunta repetida: devolve a resposta já calculada
+        cache_key = utils.normalize_text(user_question)
+        with metrics.stage("answer_cache"):
+            cached = answer_cache.get(cache_key)
+        if cached is not None:
+            # sem resposta: o vetor é para registrar a pendente (pelo cliente assíncrono, fora do threadpool)
+            user_embedding = await utils.get_embedding_async(user_question) if cached["context_used"] is None else None
+            return await run_in_threadpool(cached_answer, db, user_question, cached, user_embedding)
+        generation = answer_cache.generation
+
+        # 1️⃣ Gera embedding da pergunta do usuário (sem prender uma thread enquanto o Ollama responde)
+        user_embedding = await utils.get_embedding_async(user_question)
         if not user_embedding:
             raise Exception("Fail to generate embedding for the question.")
 
-        # --------------------------
-        # 2️⃣ Busca nas perguntas do banco
-        # --------------------------
-        all_embeddings = db.query(models.QuestionEmbedding).all()
-        question_match = None
-        question_score = -1.0
-
-        if all_embeddings:
-            similarities = []
-            for emb in all_embeddings:
-                score = utils.cosine_similarity(user_embedding, json.loads(emb.embedding))
-                similarities.append((emb, score))
-
-            best_match, best_score = max(similarities, key=lambda x: x[1])
-            if best_score >= 0.85:  # limiar de confiança
-                question_match = db.query(models.Question).filter(models.Question.id == best_match.question_id).first()
-                question_score = best_score
-
-        # --------------------------
-        # 3️⃣ Busca nos documentos (PDFs)
-        # --------------------------
-        pdf_match = None
-        pdf_score = -1.0
-
-        all_chunks = db.query(models.DocumentChunk).all()
-        if all_chunks:
-            similarities = []
-            for chunk in all_chunks:
-                score = utils.cosine_similarity(user_embedding, json.loads(chunk.embedding))
-                similarities.append((chunk, score))
-            #--score, chunk in similarities:
-            best_chunk, best_chunk_score = max(similarities, key=lambda x: x[1])
-            if best_chunk_score >= 0.85:
-                pdf_match = best_chunk
-                pdf_score = best_chunk_score
-
-        # --------------------------
-        # 4️⃣ Define qual resposta usar
-        # --------------------------
-        # Caso 1: encontrou pergunta no banco
-        if question_match and question_score >= 0.85:
-            return {
-                "context_match_score": round(question_score, 3),
-                "context_used": question_match.text,
-                "ai_answer": question_match.answer,
-            }
+        with metrics.stage("answer_cache"):
+            cached = answer_cache.get_similar(user_embedding)
+        if cached is not None:
+            return await run_in_threadpool(cached_answer, db, user_question, cached, user_embedding)
 
-        # Caso 2: encontrou resposta em PDF
-        elif pdf_match and pdf_score >= 0.45:
-            return {
-                "context_match_score": round(pdf_score, 3),
-                "context_used": f"Excerpt of the PDF: {pdf_match.source_name}",
-                "ai_answer": pdf_match.content[:1000] + "..."  # limita o tamanho da resposta
-            }
-
-        # Caso 3: nada encontrado
-        unanswered = models.UnansweredQuestion(text=user_question)
-        db.add(unanswered)
-        db.commit()
-
-        return {
-            "context_match_score": 0,
-            "context_used": None,
-            "ai_answer": "❓ I don’t have this answer now. Please check with one of the leads.",
-        }
+        # A busca e o acesso ao banco são síncronos: rodam no threadpool
+        response = await run_in_threadpool(answer_from_index, db, user_question, user_embedding)
+        answer_cache.put(cache_key, response, user_embedding, generation)
+        metrics.ASK_TOTAL.inc(endpoint="ask", path=match_path(response))
+        return response
 
     except Exception as e:
         print("Erro interno:", e)
+        metrics.ASK_TOTAL.inc(endpoint="ask", path="error")
         return {
             "context_match_score": 0,
             "context_used": None,
@@ -132,6 +168,210 @@ def ask_question(user_question: str, db: Session = Depends(get_db)):
         }
 
 
+def match_path(response: dict):
+    """De onde veio a resposta: pergunta cadastrada, trechos de PDF ou nenhum."""
+    if response["context_used"] is None:
+        return "unanswered"
+    return "pdf" if response["context_used"].startswith("Excerpt of the PDF") else "question"
+
+
+def cached_answer(db: Session, user_question: str, response: dict, user_embedding):
+    # sem resposta: continua registrando a pergunta para os leads
+    if response["context_used"] is None:
+        with metrics.stage("unanswered"):
+            response = record_unanswered(db, user_question, user_embedding) or response
+    metrics.ASK_TOTAL.inc(endpoint="ask", path="cache")
+    return response
+
+
+def record_unanswered(db: Session, user_question: str, user_embedding):
+    """
+    Põe a pergunta no grupo de pendentes parecidas. Se os leads já
+    responderam o grupo, devolve essa resposta (senão, None).
+    """
+    if not user_embedding:
+        crud.create_unanswered(db, user_question)  # sem vetor: agrupada depois pelo backfill
+        return None
+    question, score = unanswered.record(db, user_question, user_embedding)
+    if question is None:
+        return None
+    return {
+        "context_match_score": round(score, 3),
+        "context_used": question.text,
+        "ai_answer": question.answer,
+        "sources": [{"source": "question", "id": question.id, "score": round(score, 4), "text": question.text,
+                     "lexical": False, "answer": question.answer}],
+    }
+
+
+def answer_from_index(db: Session, user_question: str, user_embedding):
+    # --------------------------
+    # 2️⃣ Pergunta do banco acima do limiar: sempre vence (busca separada, sem MMR,
+    # para os trechos de PDF não a tirarem do top-k — igual ao /ask/stream)
+    # --------------------------
+    with metrics.stage("search"):
+        questions = retrieval.search(db, user_question, user_embedding, k=1, sources=("questions",), diversity=False)
+    if questions:
+        best = questions[0]
+        return {
+            "context_match_score": round(best.score, 3),
+            "context_used": best.text,
+            "ai_answer": best.answer,
+            "sources": [best.as_dict(max_chars=200)],
+        }
+
+    # --------------------------
+    # 3️⃣ Top-k nos PDFs (vetores + BM25, MMR): trechos de seções diferentes
+    # --------------------------
+    with metrics.stage("search"):
+        results = retrieval.search(db, user_question, user_embedding,
+                                   k=max(retrieval.RETRIEVAL_TOP_K, ASK_CONTEXT_CHUNKS), sources=("chunks",))
+    excerpts = results[:ASK_CONTEXT_CHUNKS]
+    sources = [r.as_dict(max_chars=200) for r in results]
+
+    if excerpts:
+        names = ", ".join(dict.fromkeys(r.source_name for r in excerpts))
+        per_excerpt = max(200, ANSWER_MAX_CHARS // len(excerpts))
+        return {
+            "context_match_score": round(max(r.score for r in excerpts), 3),
+            "context_used": f"Excerpt of the PDF: {names}",
+            "ai_answer": "\n\n".join(
+                r.text if len(r.text) <= per_excerpt else r.text[:per_excerpt] + "..."
+                for r in excerpts
+            ),
+            "sources": sources,
+        }
+
+    # Caso 3: nada encontrado — a não ser que os leads já tenham respondido uma pergunta parecida
+    with metrics.stage("unanswered"):
+        clustered = record_unanswered(db, user_question, user_embedding)
+    if clustered is not None:
+        return clustered
+
+    return {
+        "context_match_score": 0,
+        "context_used": None,
+        "ai_answer": NO_ANSWER,
+        "sources": [],
+    }
+
+
+# -------------------------
+# 🌊 Resposta gerada pelo modelo, em streaming (SSE)
+# -------------------------
+def sse(event: str, data: dict):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def retrieve_context(db: Session, user_question: str, user_embedding):
+    """
+    Pergunta cadastrada acima do limiar: resposta pronta, sem gerar nada.
+    Senão, os melhores trechos de PDF (diversificados) viram o contexto do prompt.
+    """
+    with metrics.stage("search"):
+        questions = retrieval.search(db, user_question, user_embedding, k=1, sources=("questions",), diversity=False)
+    if questions:
+        best = questions[0]
+        return {"score": best.score, "question": best.text, "answer": best.answer}
+
+    with metrics.stage("search"):
+        chunks = retrieval.search(db, user_question, user_embedding, k=ASK_CONTEXT_CHUNKS, sources=("chunks",))
+    if not chunks:
+        with metrics.stage("unanswered"):
+            clustered = record_unanswered(db, user_question, user_embedding)
+        if clustered is None:
+            return None
+        return {"score": clustered["context_match_score"], "question": clustered["context_used"],
+                "answer": clustered["ai_answer"]}
+
+    return {
+        "score": max(r.score for r in chunks),
+        "context": [r.text for r in chunks],
+        "sources": [
+            {
+                "source_name": r.source_name,
+                "chunk_index": r.chunk_index,
+                "page_start": r.page_start,
+                "page_end": r.page_end,
+                "score": round(r.score, 3),
+            }
+            for r in chunks
+        ],
+    }
+
+
+@app.post("/ask/stream", dependencies=[Depends(index_ready)])
+async def ask_question_stream(user_question: str, db: Session = Depends(get_db)):
+    # a recuperação roda antes do streaming: o 1º evento sai logo após a busca
+    try:
+        user_embedding = await utils.get_embedding_async(user_question)
+        if not user_embedding:
+            raise Exception("Fail to generate embedding for the question.")
+        found = await run_in_threadpool(retrieve_context, db, user_question, user_embedding)
+    except Exception as e:
+        print("Erro interno:", e)
+        found, error = None, e
+    else:
+        error = None
+
+    path = "error" if error is not None else "unanswered" if found is None else "question" if "answer" in found else "pdf"
+    metrics.ASK_TOTAL.inc(endpoint="ask_stream", path=path)
+
+    async def events():
+        if error is not None:
+            yield sse("error", {"ai_answer": f"⚠️ Internal Error: {str(error)}"})
+            return
+        if found is None:
+            yield sse("meta", {"context_match_score": 0, "context_used": None, "sources": []})
+            yield sse("token", {"text": NO_ANSWER})
+            yield sse("done", {"ai_answer": NO_ANSWER})
+            return
+        if "answer" in found:
+            yield sse("meta", {"context_match_score": round(found["score"], 3), "context_used": found["question"], "sources": []})
+            yield sse("token", {"text": found["answer"]})
+            yield sse("done", {"ai_answer": found["answer"]})
+            return
+
+        names = ", ".join(dict.fromkeys(source["source_name"] for source in found["sources"]))
+        yield sse("meta", {
+            "context_match_score": round(found["score"], 3),
+            "context_used": f"Excerpt of the PDF: {names}",
+            "sources": found["sources"],
+        })
+        answer = []
+        try:
+            async for token in utils.query_local_ai_stream(user_question, found["context"]):
+                answer.append(token)
+                yield sse("token", {"text": token})
+        except Exception as e:
+            print("⚠️ Erro ao consultar modelo local:", e)
+            yield sse("error", {"ai_answer": "⚠️ Erro interno ao consultar o modelo local."})
+            return
+        yield sse("done", {"ai_answer": "".join(answer).strip()})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# -------------------------
+# 🔎 Busca (top-k) sem montar resposta
+# -------------------------
+@app.post("/retrieve", dependencies=[Depends(index_ready)])
+async def retrieve(user_question: str, k: int = retrieval.RETRIEVAL_TOP_K, source: str = "all",
+                   diversity: bool = True, db: Session = Depends(get_db)):
+    if source not in ("all", *retrieval.INDEXES):
+        raise HTTPException(status_code=400, detail="source must be 'all', 'questions' or 'chunks'")
+    k = max(1, min(k, retrieval.HYBRID_CANDIDATES))
+    user_embedding = await utils.get_embedding_async(user_question)
+    if not user_embedding:
+        raise HTTPException(status_code=503, detail="Embedding service unavailable")
+    sources = tuple(retrieval.INDEXES) if source == "all" else (source,)
+    results = await run_in_threadpool(retrieval.search, db, user_question, user_embedding, k, sources, diversity)
+    return {"hits": [r.as_dict() for r in results]}
+
 
 @app.get("/questions/", response_model=list[schemas.Question])
 def read_questions(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
@@ -147,18 +387,56 @@ def read_question(question_id: int, db: Session = Depends(get_db)):
 # -------------------------
 # 🔑 Admin - Respondidas
 # -------------------------
-@app.post("/admin/questions/", response_model=schemas.Question, dependencies=[Depends(verify_admin)])
-def create_question_admin(question: schemas.QuestionCreate, db: Session = Depends(get_db)):
-    return crud.create_question(db=db, question=question)
+@app.post("/admin/questions/", response_model=schemas.Question, dependencies=[Depends(verify_admin), Depends(index_ready)])
+async def create_question_admin(question: schemas.QuestionCreate, db: Session = Depends(get_db)):
+    embedding = await utils.get_embedding_async(question.text)
+    if not embedding:
+        raise HTTPException(status_code=503, detail="Embedding service unavailable")
+    return await run_in_threadpool(crud.create_question, db, question, embedding)
+
+@app.post("/admin/questions/batch", response_model=schemas.ImportReport, dependencies=[Depends(verify_admin), Depends(index_ready)])
+def create_questions_batch(questions: list[schemas.QuestionCreate], on_duplicate: str = "skip", db: Session = Depends(get_db)):
+    if on_duplicate not in ("skip", "update"):
+        raise HTTPException(status_code=400, detail="on_duplicate must be 'skip' or 'update'")
+    rows = ((number, {"text": q.text, "answer": q.answer}) for number, q in enumerate(questions, start=1))
+    return bulk.import_questions(db, rows, on_duplicate)
+
+@app.post("/admin/questions/import", response_model=schemas.ImportReport, dependencies=[Depends(verify_admin), Depends(index_ready)])
+async def import_questions_admin(request: Request, format: str = None, on_duplicate: str = "skip", db: Session = Depends(get_db)):
+    # corpo cru (JSONL ou CSV): vai para um arquivo temporário conforme chega
+    fmt = format or bulk.detect_format(request.headers.get("content-type"))
+    if fmt not in bulk.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'jsonl' or 'csv'")
+    if on_duplicate not in ("skip", "update"):
+        raise HTTPException(status_code=400, detail="on_duplicate must be 'skip' or 'update'")
+
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        return await run_in_threadpool(bulk.import_questions, db, bulk.iter_rows(upload, fmt), on_duplicate)
+
+@app.get("/admin/questions/export", dependencies=[Depends(verify_admin)])
+def export_questions_admin(format: str = "jsonl"):
+    if format not in bulk.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'jsonl' or 'csv'")
+    return StreamingResponse(
+        bulk.export_questions(format),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="questions.{format}"'},
+    )
 
-@app.put("/admin/questions/{question_id}", response_model=schemas.Question, dependencies=[Depends(verify_admin)])
-def update_question_admin(question_id: int, updated: schemas.QuestionCreate, db: Session = Depends(get_db)):
-    db_question = crud.update_question(db, question_id, updated)
+@app.put("/admin/questions/{question_id}", response_model=schemas.Question, dependencies=[Depends(verify_admin), Depends(index_ready)])
+async def update_question_admin(question_id: int, updated: schemas.QuestionCreate, db: Session = Depends(get_db)):
+    embedding = await utils.get_embedding_async(updated.text)
+    if not embedding:
+        raise HTTPException(status_code=503, detail="Embedding service unavailable")
+    db_question = await run_in_threadpool(crud.update_question, db, question_id, updated, embedding)
     if not db_question:
         raise HTTPException(status_code=404, detail="Question not found")
     return db_question
 
-@app.delete("/admin/questions/{question_id}", dependencies=[Depends(verify_admin)])
+@app.delete("/admin/questions/{question_id}", dependencies=[Depends(verify_admin), Depends(index_ready)])
 def delete_question_admin(question_id: int, db: Session = Depends(get_db)):
     db_question = crud.delete_question(db, question_id)
     if not db_question:
@@ -172,9 +450,171 @@ def delete_question_admin(question_id: int, db: Session = Depends(get_db)):
 def read_unanswered(db: Session = Depends(get_db), skip: int = 0, limit: int = 10):
     return crud.get_unanswered(db, skip=skip, limit=limit)
 
+@app.get("/admin/unanswered/clusters", response_model=list[schemas.UnansweredCluster], dependencies=[Depends(verify_admin)])
+def read_unanswered_clusters(status: str = "open", skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
+    # paráfrases agrupadas: os leads respondem uma vez por grupo
+    if status not in ("open", "answered", "all"):
+        raise HTTPException(status_code=400, detail="status must be 'open', 'answered' or 'all'")
+    return unanswered.list_clusters(db, status=status, skip=skip, limit=limit)
+
+@app.post("/admin/unanswered/clusters/{cluster_id}/answer", response_model=schemas.Question, dependencies=[Depends(verify_admin), Depends(index_ready)])
+async def answer_unanswered_cluster(cluster_id: int, body: schemas.ClusterAnswer, db: Session = Depends(get_db)):
+    cluster = db.get(models.UnansweredCluster, cluster_id)
+    if cluster is None:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    embedding = await utils.get_embedding_async(body.text or cluster.text)
+    if not embedding:
+        raise HTTPException(status_code=503, detail="Embedding service unavailable")
+    return await run_in_threadpool(unanswered.answer_cluster, db, cluster_id, body, embedding)
+
+@app.delete("/admin/unanswered/clusters/{cluster_id}", dependencies=[Depends(verify_admin)])
+def delete_unanswered_cluster(cluster_id: int, db: Session = Depends(get_db)):
+    if not unanswered.delete_cluster(db, cluster_id):
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    return {"message": f"Cluster {cluster_id} deleted successfully"}
+
 @app.delete("/admin/unanswered/{unanswered_id}", dependencies=[Depends(verify_admin)])
 def delete_unanswered(unanswered_id: int, db: Session = Depends(get_db)):
-    db_question = crud.delete_unanswered(db, unanswered_id)
+    db_question = unanswered.delete_member(db, unanswered_id)
     if not db_question:
         raise HTTPException(status_code=404, detail="Unanswered question not found")
     return {"message": f"Unanswered question {unanswered_id} deleted successfully"}
+
+# -------------------------
+# 🔑 Admin - Índice vetorial
+# -------------------------
+@app.post("/admin/index/reload", dependencies=[Depends(verify_admin), Depends(index_ready)])
+def reload_index(full: bool = False, db: Session = Depends(get_db)):
+    # útil depois de rodar o pdf_indexer ou o refresh_embeddings em outro processo;
+    # full=true relê todos os vetores (pega embeddings alterados, não só ids novos)
+    # se um refresh_embeddings ativou outro modelo, troca tudo de uma vez
+    if not refresh_embeddings.sync_active_model(db):
+        vector_index.load_indexes(db, full=full, model=utils.EMBEDDING_MODEL)
+    answer_cache.invalidate()
+    return {
+        "questions": len(vector_index.question_index),
+        "chunks": len(vector_index.chunk_index),
+    }
+
+# -------------------------
+# 🔑 Admin - Upload de PDFs (fila de ingestão)
+# -------------------------
+@app.post("/admin/pdfs", response_model=schemas.IngestJob, status_code=202, dependencies=[Depends(verify_admin)])
+async def upload_pdf(request: Request, filename: str, db: Session = Depends(get_db)):
+    source_name = ingest.safe_name(filename)
+    if source_name is None:
+        raise HTTPException(status_code=400, detail="filename must be a .pdf file name")
+    # fila cheia: recusa antes de receber o arquivo
+    if not await run_in_threadpool(ingest.has_capacity, db):
+        raise HTTPException(status_code=429, detail="Ingestion queue is full, try again later",
+                            headers={"Retry-After": "60"})
+
+    # corpo cru: gravado num arquivo só deste envio (um job rodando com o mesmo nome segue com o dele)
+    os.makedirs(ingest.UPLOAD_FOLDER, exist_ok=True)
+    max_bytes = int(ingest.INGEST_MAX_UPLOAD_MB * 1024 * 1024)
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=ingest.UPLOAD_FOLDER, prefix="upload-", suffix=f"-{source_name}.part",
+                                     delete=False) as upload:
+        try:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"PDF larger than {ingest.INGEST_MAX_UPLOAD_MB:g} MB")
+                if size == len(chunk) and not chunk.startswith(b"%PDF-"):
+                    raise HTTPException(status_code=400, detail="Body is not a PDF file")
+                upload.write(chunk)
+        except BaseException:
+            upload.close()
+            os.unlink(upload.name)
+            raise
+    if size == 0:
+        os.unlink(upload.name)
+        raise HTTPException(status_code=400, detail="Empty body")
+    file_path = upload.name[:-len(".part")]
+    os.replace(upload.name, file_path)
+    return await run_in_threadpool(ingest.enqueue, db, source_name, file_path)
+
+@app.get("/admin/ingest", dependencies=[Depends(verify_admin)])
+def ingest_status(db: Session = Depends(get_db)):
+    return ingest.status(db)
+
+@app.get("/admin/ingest/jobs", response_model=list[schemas.IngestJob], dependencies=[Depends(verify_admin)])
+def read_ingest_jobs(status: str = None, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
+    if status is not None and status not in ingest.STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of: {', '.join(ingest.STATUSES)}")
+    return ingest.list_jobs(db, status=status, skip=skip, limit=limit)
+
+@app.get("/admin/ingest/jobs/{job_id}", response_model=schemas.IngestJob, dependencies=[Depends(verify_admin)])
+def read_ingest_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.get(models.IngestJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/admin/ingest/jobs/{job_id}/cancel", response_model=schemas.IngestJob, dependencies=[Depends(verify_admin)])
+def cancel_ingest_job(job_id: int, db: Session = Depends(get_db)):
+    job = ingest.cancel(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in ("cancelled", "cancelling"):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return job
+
+# -------------------------
+# 🔑 Admin - Re-embedding (troca de modelo)
+# -------------------------
+@app.post("/admin/embeddings/refresh", dependencies=[Depends(verify_admin), Depends(index_ready)])
+def start_refresh_embeddings(model: str = None, corpus: str = "all"):
+    if corpus not in ("all", *refresh_embeddings.CORPORA):
+        raise HTTPException(status_code=400, detail="corpus must be 'all', 'questions' or 'chunks'")
+    corpora = tuple(refresh_embeddings.CORPORA) if corpus == "all" else (corpus,)
+    if model and model != utils.EMBEDDING_MODEL and corpus != "all":
+        raise HTTPException(status_code=400, detail="Switching models requires corpus=all")
+    if not refresh_embeddings.start_background(model, corpora):
+        raise HTTPException(status_code=409, detail="A re-embedding job is already running")
+    return {"message": "Re-embedding started", "model": model or utils.EMBEDDING_MODEL}
+
+@app.get("/admin/embeddings/refresh", dependencies=[Depends(verify_admin)])
+def refresh_embeddings_status(db: Session = Depends(get_db)):
+    return refresh_embeddings.status(db)
+
+# -------------------------
+# 🔑 Admin - Manutenção do banco (backup, checkpoint, limpeza, VACUUM)
+# -------------------------
+@app.get("/admin/maintenance", dependencies=[Depends(verify_admin)])
+def maintenance_status(db: Session = Depends(get_db)):
+    return maintenance.status(db)
+
+@app.post("/admin/maintenance/{task}", status_code=202, dependencies=[Depends(verify_admin)])
+def run_maintenance(task: str):
+    if task not in maintenance.available():
+        raise HTTPException(status_code=404, detail=f"Unknown task; available: {', '.join(maintenance.available())}")
+    if not maintenance.start_background(task):
+        raise HTTPException(status_code=409, detail="This task is already running")
+    return {"message": f"Maintenance task '{task}' started", "task": task}
+
+# -------------------------
+# 📈 Métricas (formato texto do Prometheus)
+# -------------------------
+@app.get("/metrics")
+def prometheus_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# -------------------------
+# 🔑 Admin - Estatísticas
+# -------------------------
+@app.get("/admin/stats/embedding-cache", dependencies=[Depends(verify_admin)])
+def embedding_cache_stats():
+    # quantas chamadas ao Ollama o cache evitou
+    return embedding_cache.stats()
+
+@app.get("/admin/stats/answer-cache", dependencies=[Depends(verify_admin)])
+def answer_cache_stats():
+    return answer_cache.stats()
+
+@app.delete("/admin/answer-cache", dependencies=[Depends(verify_admin)])
+def clear_answer_cache():
+    answer_cache.invalidate()
+    return {"message": "Answer cache cleared"}
@@ -0,0 +1,509 @@
+"""
+Manutenção do banco SQLite com a API no ar.
+
+- backup: cópia consistente pela API de backup online do SQLite, em passos de
+  MAINTENANCE_STEP_PAGES páginas com uma pausa entre eles (no modo WAL, ler
+  não bloqueia quem escreve). Se escritas de outros processos reiniciarem a
+  cópia várias vezes, o resto sai num passo só (uma transação de leitura).
+  A cópia passa por um quick_check antes de ganhar o nome final, e só as
+  BACKUP_KEEP mais recentes ficam em BACKUP_DIR;
+- checkpoint: devolve o WAL ao banco (PASSIVE, sem esperar ninguém) e, se
+  tudo foi copiado, zera o arquivo -wal;
+- cleanup: apaga em lotes os embeddings órfãos (pergunta já apagada) e os
+  vetores sombra de jobs de re-embedding que já terminaram;
+- optimize: ANALYZE limitado (PRAGMA optimize) e devolução das páginas
+  livres ao disco aos poucos (incremental_vacuum);
+- vacuum: VACUUM completo, só com mais de VACUUM_MIN_FREE do arquivo em
+  páginas livres. Ele bloqueia as escritas enquanto roda (por isso o
+  intervalo longo) e liga o auto_vacuum incremental usado pelo optimize.
+
+As tarefas rodam numa thread da API; cada execução é reservada na tabela
+maintenance_tasks com um UPDATE condicional, então com vários workers só um
+roda cada tarefa. Também pelo terminal:
+
+    cd backend
+    python -m app.maintenance backup
+    python -m app.maintenance run        # tudo o que estiver vencido
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from sqlalchemy import and_, exists, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import database, metrics, models, pdf_indexer, vector_index
+from app.ingest import worker_id
+
+load_dotenv()
+
+# 🔹 Liga o agendador dentro da API (as tarefas continuam disponíveis pelo terminal e pelo /admin)
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "true").lower() in ("1", "true", "yes")
+# 🔹 Intervalos em segundos (0 = não agenda): checkpoint/cleanup/optimize, backup e VACUUM completo
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "3600"))
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL", "86400"))
+VACUUM_INTERVAL = float(os.getenv("VACUUM_INTERVAL", "604800"))
+# 🔹 Onde ficam os backups e quantos manter (0 = todos)
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+# 🔹 Fração de páginas livres a partir da qual o VACUUM completo compensa
+VACUUM_MIN_FREE = float(os.getenv("VACUUM_MIN_FREE", "0.25"))
+# 🔹 Ritmo: páginas por passo (backup, incremental_vacuum), pausa entre passos e linhas por DELETE
+MAINTENANCE_STEP_PAGES = int(os.getenv("MAINTENANCE_STEP_PAGES", "1000"))
+MAINTENANCE_STEP_SLEEP = float(os.getenv("MAINTENANCE_STEP_SLEEP", "0.05"))
+MAINTENANCE_DELETE_BATCH = int(os.getenv("MAINTENANCE_DELETE_BATCH", "500"))
+
+LOCK_TIMEOUT = 0.2          # segundos que checkpoint/optimize esperam por um lock (depois, fica para a próxima)
+VACUUM_LOCK_TIMEOUT = 5.0   # o VACUUM espera a escrita em andamento terminar
+BACKUP_MAX_RESTARTS = 3     # reinícios da cópia em passos antes de copiar o resto de uma vez
+LEASE_SECONDS = 3600        # um processo que morreu no meio libera a tarefa depois disso
+FAILED_RETRY_DELAY = 600    # tarefa que falhou tenta de novo antes do intervalo
+POLL_INTERVAL = 60
+
+AUTO_VACUUM = {0: "none", 1: "full", 2: "incremental"}
+
+_stop = threading.Event()
+_scheduler = None
+
+
+class MaintenanceStopped(Exception):
+    """O processo está desligando: a tarefa para no próximo passo."""
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _pause():
+    """Pausa entre passos (o /ask usa o banco nesse meio-tempo); interrompe no desligamento."""
+    if _stop.wait(MAINTENANCE_STEP_SLEEP):
+        raise MaintenanceStopped()
+
+
+def database_path():
+    """Arquivo do banco SQLite (None no PostgreSQL ou em memória)."""
+    name = database.engine.url.database
+    if database.DIALECT != "sqlite" or not name or name == ":memory:":
+        return None
+    return name
+
+
+def _connect(path: str = None, timeout: float = LOCK_TIMEOUT):
+    conn = sqlite3.connect(path or database_path(), timeout=timeout, check_same_thread=False)
+    conn.isolation_level = None  # autocommit: nenhuma transação fica aberta entre os passos
+    return conn
+
+
+def _pragma(conn, name: str):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def configure(conn):
+    """
+    Na subida, antes de criar as tabelas: modo WAL (leituras e backup não
+    bloqueiam escritas) e auto_vacuum incremental, que só pega em banco vazio;
+    num banco existente, passa a valer no próximo VACUUM.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+
+# -------------------------
+# Tarefas
+# -------------------------
+def backup(path: str = None, dest_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+           pages: int = MAINTENANCE_STEP_PAGES) -> dict:
+    path = path or database_path()
+    os.makedirs(dest_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for name in os.listdir(dest_dir):
+        if name.startswith(stem + "_") and name.endswith(".part"):
+            os.remove(os.path.join(dest_dir, name))  # sobra de uma cópia interrompida
+    target = os.path.join(dest_dir, f"{stem}_{time.strftime('%Y-%m-%d_%H-%M-%S')}.db")
+    part = target + ".part"
+
+    steps = restarts = total = 0
+    last = None
+
+    def progress(status, remaining, pagecount):
+        nonlocal steps, restarts, total, last
+        steps += 1
+        total = pagecount
+        if last is not None and remaining > last:
+            restarts += 1  # outro processo escreveu no banco: a cópia recomeçou
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        last = remaining
+        _pause()
+
+    source = _connect(path)
+    dest = sqlite3.connect(part)
+    try:
+        try:
+            source.backup(dest, pages=pages, progress=progress)
+        except _BackupRestarted:
+            # escritas constantes: o resto numa transação de leitura só (no WAL, as escritas seguem)
+            source.backup(dest)
+        dest.execute("PRAGMA journal_mode=DELETE")  # o backup é um arquivo só, sem -wal
+        check = _pragma(dest, "quick_check")
+        if check != "ok":
+            raise sqlite3.DatabaseError(f"cópia inválida: {check}")
+    except BaseException:
+        dest.close()
+        os.remove(part)
+        raise
+    finally:
+        source.close()
+    dest.close()
+    os.replace(part, target)
+
+    removed = 0
+    if keep > 0:
+        backups = sorted(n for n in os.listdir(dest_dir) if n.startswith(stem + "_") and n.endswith(".db"))
+        for name in backups[:-keep]:
+            os.remove(os.path.join(dest_dir, name))
+            removed += 1
+    return {"file": os.path.basename(target), "bytes": _file_size(target), "pages": total,
+            "steps": steps, "restarts": restarts, "removed": removed}
+
+
+def checkpoint(path: str = None) -> dict:
+    path = path or database_path()
+    conn = _connect(path)
+    try:
+        busy, frames, copied = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        truncated = False
+        if not busy and frames > 0 and frames == copied:
+            # tudo já está no banco: TRUNCATE só zera o -wal (espera no máximo LOCK_TIMEOUT)
+            busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            truncated = not busy
+    finally:
+        conn.close()
+    return {"wal_frames": frames, "checkpointed": copied, "truncated": truncated,
+            "wal_bytes": _file_size(path + "-wal")}
+
+
+def _delete_batches(db: Session, table, condition, batch_size: int, key=None) -> list:
+    """Apaga em lotes (um commit curto por lote, com pausa) para não segurar a escrita do banco."""
+    columns = (table.id,) if key is None else (table.id, key)
+    keys = []
+    while True:
+        rows = db.query(*columns).filter(condition).order_by(table.id).limit(batch_size).all()
+        if not rows:
+            return keys
+        db.query(table).filter(table.id.in_([row[0] for row in rows])).delete(synchronize_session=False)
+        pdf_indexer.safe_commit(db)
+        keys.extend(row[-1] for row in rows)
+        _pause()
+
+
+def cleanup(db: Session, batch_size: int = MAINTENANCE_DELETE_BATCH) -> dict:
+    orphan = or_(
+        models.QuestionEmbedding.question_id.is_(None),
+        ~exists().where(models.Question.id == models.QuestionEmbedding.question_id),
+    )
+    question_ids = _delete_batches(db, models.QuestionEmbedding, orphan, batch_size,
+                                   key=models.QuestionEmbedding.question_id)
+    vector_index.question_index.remove_many([i for i in question_ids if i is not None])
+
+    # vetores sombra de jobs que já ativaram, foram substituídos ou apagados
+    building = select(models.EmbeddingJob.id).where(models.EmbeddingJob.status == "building")
+    shadows = _delete_batches(db, models.ShadowEmbedding, ~models.ShadowEmbedding.job_id.in_(building), batch_size)
+    return {"question_embeddings": len(question_ids), "shadow_embeddings": len(shadows)}
+
+
+def optimize(path: str = None, pages: int = MAINTENANCE_STEP_PAGES) -> dict:
+    conn = _connect(path)
+    try:
+        # ANALYZE só do que mudou bastante, lendo no máximo ~1000 linhas por índice
+        conn.execute("PRAGMA analysis_limit=1000")
+        conn.execute("PRAGMA optimize")
+        freed = 0
+        if _pragma(conn, "auto_vacuum") == 2:
+            free = _pragma(conn, "freelist_count")
+            while free:
+                conn.execute(f"PRAGMA incremental_vacuum({min(pages, free)})").fetchall()
+                remaining = _pragma(conn, "freelist_count")
+                if remaining >= free:
+                    break
+                freed += free - remaining
+                free = remaining
+                _pause()
+        return {"freed_pages": freed, "free_pages": _pragma(conn, "freelist_count")}
+    finally:
+        conn.close()
+
+
+def vacuum(path: str = None, min_free: float = VACUUM_MIN_FREE) -> dict:
+    path = path or database_path()
+    conn = _connect(path, timeout=VACUUM_LOCK_TIMEOUT)
+    try:
+        page_count, free = _pragma(conn, "page_count"), _pragma(conn, "freelist_count")
+        ratio = free / page_count if page_count else 0.0
+        if ratio < min_free:
+            return {"skipped": True, "free_ratio": round(ratio, 3)}
+        before = _file_size(path)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # daqui em diante, o optimize devolve o espaço aos poucos
+        conn.execute("VACUUM")
+        return {"skipped": False, "free_ratio": round(ratio, 3), "bytes_before": before, "bytes_after": _file_size(path)}
+    finally:
+        conn.close()
+
+
+TASKS = {
+    "checkpoint": lambda db: checkpoint(),
+    "cleanup": cleanup,
+    "optimize": lambda db: optimize(),
+    "backup": lambda db: backup(),
+    "vacuum": lambda db: vacuum(),
+}
+
+
+def available() -> tuple:
+    """Tarefas que valem para o banco atual (no PostgreSQL, só a limpeza; o resto é do autovacuum/pg_dump)."""
+    if database_path() is None:
+        return ("cleanup",)
+    return tuple(TASKS)
+
+
+def interval(name: str) -> float:
+    return {"backup": BACKUP_INTERVAL, "vacuum": VACUUM_INTERVAL}.get(name, MAINTENANCE_INTERVAL)
+
+
+# -------------------------
+# Agendamento (uma execução por vez entre todos os processos)
+# -------------------------
+def _ensure_row(db: Session, name: str):
+    if db.query(models.MaintenanceTask.id).filter(models.MaintenanceTask.name == name).first():
+        return
+    db.add(models.MaintenanceTask(name=name))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # outro processo criou ao mesmo tempo
+
+
+def claim(db: Session, name: str, force: bool = False) -> bool:
+    """Reserva a tarefa se ninguém a estiver rodando e (sem `force`) se ela estiver vencida."""
+    _ensure_row(db, name)
+    now = time.time()
+    task = models.MaintenanceTask
+    conditions = [task.name == name, or_(task.lease_until.is_(None), task.lease_until < now)]
+    if not force:
+        conditions.append(or_(
+            task.last_finished.is_(None),
+            task.last_finished <= now - interval(name),
+            and_(task.last_status == "failed", task.last_finished <= now - FAILED_RETRY_DELAY),
+        ))
+    claimed = db.query(task).filter(*conditions).update(
+        {"worker": worker_id(), "lease_until": now + LEASE_SECONDS, "last_started": now},
+        synchronize_session=False,
+    )
+    pdf_indexer.safe_commit(db)
+    return bool(claimed)
+
+
+def _execute(db: Session, name: str):
+    started = time.perf_counter()
+    values = {"lease_until": None}
+    try:
+        detail = TASKS[name](db)
+    except MaintenanceStopped:
+        detail = None  # desligando: só libera a reserva, a tarefa continua vencida
+        print(f"⏹️ Manutenção '{name}' interrompida.")
+    except Exception as e:
+        db.rollback()
+        detail = {"error": str(e)}
+        values.update(last_status="failed", last_finished=time.time(), last_detail=json.dumps(detail),
+                      last_seconds=round(time.perf_counter() - started, 3))
+        print(f"⚠️ Manutenção '{name}' falhou: {e}")
+    else:
+        seconds = time.perf_counter() - started
+        metrics.record_stage(f"maintenance.{name}", seconds)
+        values.update(last_status="ok", last_finished=time.time(), last_detail=json.dumps(detail),
+                      last_seconds=round(seconds, 3))
+        print(f"🧹 Manutenção '{name}' concluída em {seconds:.1f}s: {detail}")
+    db.query(models.MaintenanceTask).filter(models.MaintenanceTask.name == name).update(
+        values, synchronize_session=False
+    )
+    pdf_indexer.safe_commit(db)
+    return detail
+
+
+def run_task(name: str, force: bool = False):
+    """Roda a tarefa agora se conseguir reservá-la; None se outro processo já a está rodando (ou não venceu)."""
+    with database.SessionLocal() as db:
+        if not claim(db, name, force):
+            return None
+        return _execute(db, name)
+
+
+def run_due() -> dict:
+    """Roda, em ordem, as tarefas agendadas que venceram."""
+    done = {}
+    for name in available():
+        if _stop.is_set():
+            break
+        if interval(name) > 0:
+            detail = run_task(name)
+            if detail is not None:
+                done[name] = detail
+    return done
+
+
+def start_background(name: str) -> bool:
+    """Roda a tarefa numa thread, fora do agendamento (admin); False se ela já está rodando."""
+    with database.SessionLocal() as db:
+        if not claim(db, name, force=True):
+            return False
+
+    def work():
+        with database.SessionLocal() as db:
+            _execute(db, name)
+
+    threading.Thread(target=work, name=f"maintenance-{name}", daemon=True).start()
+    return True
+
+
+def _loop(poll: float):
+    while not _stop.is_set():
+        try:
+            run_due()
+        except Exception as e:
+            print(f"⚠️ Falha no agendador de manutenção: {e}")
+        _stop.wait(poll)
+
+
+def start_scheduler(poll: float = POLL_INTERVAL) -> bool:
+    """Sobe a thread do agendador deste processo (no máximo uma vez)."""
+    global _scheduler
+    if not MAINTENANCE_ENABLED or (_scheduler is not None and _scheduler.is_alive()):
+        return False
+    _stop.clear()
+    _scheduler = threading.Thread(target=_loop, args=(poll,), name="maintenance", daemon=True)
+    _scheduler.start()
+    return True
+
+
+def stop_scheduler(timeout: float = 10.0):
+    """Para o agendador; uma tarefa no meio para no próximo passo e libera a reserva."""
+    _stop.set()
+    if _scheduler is not None:
+        _scheduler.join(timeout)
+
+
+# -------------------------
+# Consultas
+# -------------------------
+def database_stats() -> dict:
+    path = database_path()
+    if path is None:
+        return {"dialect": database.DIALECT}
+    conn = _connect(path)
+    try:
+        page_count, free = _pragma(conn, "page_count"), _pragma(conn, "freelist_count")
+        return {
+            "dialect": "sqlite",
+            "bytes": _file_size(path),
+            "wal_bytes": _file_size(path + "-wal"),
+            "page_size": _pragma(conn, "page_size"),
+            "page_count": page_count,
+            "free_pages": free,
+            "free_ratio": round(free / page_count, 3) if page_count else 0.0,
+            "journal_mode": _pragma(conn, "journal_mode"),
+            "auto_vacuum": AUTO_VACUUM.get(_pragma(conn, "auto_vacuum")),
+        }
+    finally:
+        conn.close()
+
+
+def list_backups(dest_dir: str = BACKUP_DIR) -> list:
+    path = database_path()
+    if path is None or not os.path.isdir(dest_dir):
+        return []
+    stem = os.path.splitext(os.path.basename(path))[0]
+    names = sorted((n for n in os.listdir(dest_dir) if n.startswith(stem + "_") and n.endswith(".db")), reverse=True)
+    return [{"file": n, "bytes": _file_size(os.path.join(dest_dir, n)),
+             "created_at": os.path.getmtime(os.path.join(dest_dir, n))} for n in names]
+
+
+def status(db: Session) -> dict:
+    rows = {task.name: task for task in db.query(models.MaintenanceTask)}
+    now = time.time()
+    tasks = []
+    for name in available():
+        task = rows.get(name)
+        tasks.append({
+            "name": name,
+            "interval": interval(name),
+            "running": bool(task and task.lease_until and task.lease_until > now),
+            "worker": task.worker if task else None,
+            "last_started": task.last_started if task else None,
+            "last_finished": task.last_finished if task else None,
+            "last_status": task.last_status if task else None,
+            "last_seconds": task.last_seconds if task else None,
+            "last_detail": json.loads(task.last_detail) if task and task.last_detail else None,
+        })
+    return {"enabled": MAINTENANCE_ENABLED, "database": database_stats(), "tasks": tasks, "backups": list_backups()}
+
+
+def _database_bytes():
+    path = database_path()
+    if path is None:
+        return {}
+    return {"main": _file_size(path), "wal": _file_size(path + "-wal")}
+
+
+def _last_finished():
+    with database.SessionLocal() as db:
+        rows = db.query(models.MaintenanceTask.name, models.MaintenanceTask.last_status,
+                        models.MaintenanceTask.last_finished).filter(models.MaintenanceTask.last_finished.isnot(None))
+        return {(name, task_status): finished for name, task_status, finished in rows}
+
+
+metrics.collector("database_bytes", "gauge", "SQLite database and WAL file sizes", _database_bytes, labels=("file",))
+metrics.collector("maintenance_last_finished_timestamp", "gauge", "Unix time of the last run of each maintenance task",
+                  _last_finished, labels=("task", "status"))
+
+
+if __name__ == "__main__":
+    from app import migrations
+
+    parser = argparse.ArgumentParser(description="Backup e manutenção do banco")
+    parser.add_argument("task", choices=(*TASKS, "run", "status"),
+                        help="tarefa a rodar agora; 'run' roda as vencidas, 'status' mostra o estado")
+    parser.add_argument("--loop", action="store_true", help="com 'run': continua agendando até Ctrl+C")
+    args = parser.parse_args()
+
+    with database.engine.begin() as connection:
+        configure(connection)
+        models.Base.metadata.create_all(bind=connection)
+    migrations.upgrade(database.engine)
+
+    if args.task == "status":
+        with database.SessionLocal() as session:
+            print(json.dumps(status(session), indent=2))
+    elif args.task == "run" and args.loop:
+        print("🗓️ Agendador de manutenção rodando (Ctrl+C para parar).")
+        try:
+            _loop(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+    elif args.task == "run":
+        print(f"✅ Tarefas executadas: {', '.join(run_due()) or 'nenhuma vencida'}.")
+    elif args.task not in available():
+        parser.error(f"'{args.task}' só vale para SQLite")
+    elif run_task(args.task, force=True) is None:
+        print(f"⏳ '{args.task}' já está rodando em outro processo.")
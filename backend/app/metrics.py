@@ -0,0 +1,223 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 🔹 Métricas no formato texto do Prometheus (GET /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# cabeçalho Server-Timing com o tempo de cada etapa: "request" (só quando o
+# cliente manda X-Debug-Timing: 1), "always" ou "off"
+TIMING_HEADER = os.getenv("TIMING_HEADER", "request").lower()
+
+PREFIX = "agentqa_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# a busca em memória leva menos de 1 ms; o Ollama, segundos
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = []
+# etapas da requisição atual (preenchido pelo TimingMiddleware)
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# -------------------------
+# Tipos de métrica
+# -------------------------
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(zip(self.labels, key))} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [contagem por bucket, soma, total]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if position < len(self.buckets):
+                entry[0][position] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def totals(self) -> dict:
+        """{labels: (contagem, soma em segundos)}."""
+        with self._lock:
+            return {key: (entry[2], entry[1]) for key, entry in self._values.items()}
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        for key, counts, total, count in values:
+            pairs = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(pairs + [('le', _number(bound))])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_format_labels(pairs)} {_number(total)}"
+            yield f"{self.name}_count{_format_labels(pairs)} {count}"
+
+
+def collector(name: str, kind: str, help: str, fn, labels=()):
+    """
+    Métrica lida na hora do scrape: `fn()` devolve {valores dos labels: número}.
+    Serve para o que o módulo já conta (tamanho do índice, acertos de cache).
+    """
+    _collectors.append((PREFIX + name, kind, help, tuple(labels), fn))
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.collect())
+    for name, kind, help, labels, fn in _collectors:
+        try:
+            values = fn()
+        except Exception as e:
+            print(f"⚠️ Falha ao coletar {name}: {e}")
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{name}{_format_labels(zip(labels, key))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------
+# Métricas da aplicação
+# -------------------------
+STAGE_SECONDS = Histogram("stage_seconds", "Duration of each processing stage", ("stage",))
+REQUEST_SECONDS = Histogram("http_request_seconds", "HTTP request duration, until the response is sent",
+                            ("route", "method", "status"))
+ASK_TOTAL = Counter("ask_total", "Answered questions by the path that produced the answer", ("endpoint", "path"))
+PDF_CHUNKS_TOTAL = Counter("pdf_chunks_total", "PDF chunks processed by the indexer", ("result",))
+EMBED_BATCH_TEXTS = Histogram("embed_batch_texts", "Texts per micro-batched embedding call from the API",
+                              buckets=(1, 2, 4, 8, 16, 32, 64))
+EMBED_COALESCED_TOTAL = Counter("embed_coalesced_total", "Embedding requests served by an identical in-flight call")
+
+
+# -------------------------
+# Etapas
+# -------------------------
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = _trace.get()
+    if trace is not None:
+        trace[name] = trace.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Mede o bloco como a etapa `name` (histograma + cabeçalho de debug da requisição)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def stage_summary(prefix: str = "") -> str:
+    """Ex.: 'pdf.embed 3.2s (40x) · pdf.write 0.4s (3x)', para os comandos de linha."""
+    totals = sorted((key[0], count, total) for key, (count, total) in STAGE_SECONDS.totals().items()
+                    if key[0].startswith(prefix))
+    return " · ".join(f"{name} {total:.2f}s ({count}x)" for name, count, total in totals)
+
+
+def server_timing(trace: dict) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in trace.items())
+
+
+class TimingMiddleware:
+    """
+    Middleware ASGI: mede a requisição inteira (por rota) e junta as etapas
+    registradas durante ela; com TIMING_HEADER, devolve tudo no Server-Timing.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = {}
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        headers = dict(scope.get("headers") or [])
+        debug = TIMING_HEADER == "always" or (
+            TIMING_HEADER == "request" and headers.get(b"x-debug-timing", b"").lower() in (b"1", b"true", b"yes")
+        )
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if debug:
+                    trace["total"] = time.perf_counter() - started
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", server_timing(trace).encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=scope["method"], status=status)
+            _trace.reset(token)
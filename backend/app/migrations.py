@@ -0,0 +1,133 @@
+import json
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from app import database, embedding_codec, lexical, models, utils
+
+BATCH_SIZE = 500
+
+
+# -------------------------
+# Embeddings JSON -> binário
+# -------------------------
+def convert_json_embeddings(engine: Engine, table: str, batch_size: int = BATCH_SIZE):
+    """
+    Converte, no próprio arquivo, os embeddings ainda salvos como texto JSON
+    para o formato binário. Cada lote é uma transação curta, então a migração
+    pode ser interrompida e retomada sem problemas.
+    """
+    if engine.dialect.name != "sqlite":
+        return 0  # o formato JSON só existiu nos bancos SQLite antigos
+    converted = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    f"SELECT id, embedding FROM {table} "
+                    "WHERE id > :last_id AND typeof(embedding) = 'text' "
+                    "ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": batch_size},
+            ).all()
+            if not rows:
+                break
+
+            updates = []
+            for row in rows:
+                try:
+                    vector = json.loads(row.embedding)
+                except ValueError:
+                    print(f"⚠️ {table}.id={row.id}: embedding JSON inválido, mantido como está.")
+                    continue
+                if not vector:
+                    continue
+                updates.append({
+                    "id": row.id,
+                    # o formato antigo não guardava o modelo; assume o configurado
+                    "embedding": embedding_codec.encode_embedding(vector, utils.EMBEDDING_MODEL),
+                })
+
+            if updates:
+                conn.execute(text(f"UPDATE {table} SET embedding = :embedding WHERE id = :id"), updates)
+            converted += len(updates)
+            last_id = rows[-1].id
+
+    if converted:
+        print(f"🔁 {table}: {converted} embeddings convertidos para o formato binário.")
+    return converted
+
+
+# -------------------------
+# Modelo de cada embedding (coluna embedding_model)
+# -------------------------
+def backfill_embedding_model(engine: Engine, table: str, batch_size: int = BATCH_SIZE):
+    """Preenche embedding_model a partir do cabeçalho do blob (JSON legado = modelo configurado)."""
+    filled = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    f"SELECT id, embedding FROM {table} "
+                    "WHERE id > :last_id AND embedding_model IS NULL AND embedding IS NOT NULL "
+                    "ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": batch_size},
+            ).all()
+            if not rows:
+                break
+            updates = [
+                {"id": row.id, "model": embedding_codec.embedding_model(row.embedding) or utils.EMBEDDING_MODEL}
+                for row in rows
+            ]
+            conn.execute(text(f"UPDATE {table} SET embedding_model = :model WHERE id = :id"), updates)
+            filled += len(updates)
+            last_id = rows[-1].id
+
+    if filled:
+        print(f"🔁 {table}: modelo registrado em {filled} embeddings.")
+    return filled
+
+
+# -------------------------
+# Colunas novas em tabelas existentes
+# -------------------------
+def add_missing_columns(engine: Engine):
+    """
+    O create_all só cria tabelas que não existem; aqui as colunas (e índices)
+    adicionadas aos modelos depois são criadas nas tabelas antigas.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                print(f"🔁 {table.name}: coluna '{column.name}' adicionada.")
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def upgrade(engine: Engine = database.engine):
+    """Aplica as migrações pendentes (idempotente, roda na subida da API)."""
+    add_missing_columns(engine)
+    convert_json_embeddings(engine, "question_embeddings")
+    convert_json_embeddings(engine, "document_chunks")
+    backfill_embedding_model(engine, "question_embeddings")
+    backfill_embedding_model(engine, "document_chunks")
+    lexical.create_fts(engine)
+
+
+if __name__ == "__main__":
+    models.Base.metadata.create_all(bind=database.engine)
+    upgrade()
+    # devolve ao disco o espaço liberado pelos textos JSON
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM"))
+    print("✅ Migração concluída.")
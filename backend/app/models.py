@@ -1,5 +1,9 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, Float, UniqueConstraint, DDL, event
 from .database import Base
+from .embedding_codec import EmbeddingColumn
+
+# No PostgreSQL, o tipo `vector` vem da extensão pgvector (criada antes das tabelas)
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS vector").execute_if(dialect="postgresql"))
 
 # -------------------------
 # Perguntas respondidas
@@ -19,6 +23,25 @@ class UnansweredQuestion(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     text = Column(String, index=True)
+    embedding = Column(EmbeddingColumn)                     # o mesmo vetor usado na busca do /ask
+    embedding_model = Column(String)
+    cluster_id = Column(Integer, ForeignKey("unanswered_clusters.id"), index=True)
+    created_at = Column(Float)
+
+
+class UnansweredCluster(Base):
+    """Grupo de perguntas pendentes parecidas (paráfrases), respondido uma vez só."""
+    __tablename__ = "unanswered_clusters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    text = Column(String)                                   # pergunta representante (a mais central)
+    representative_id = Column(Integer)                     # UnansweredQuestion.id da representante
+    count = Column(Integer, default=0)                      # vezes que foi perguntada
+    centroid = Column(EmbeddingColumn)                      # soma dos vetores normalizados (a direção é o centróide)
+    embedding_model = Column(String, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), index=True)  # resposta dada pelos leads
+    first_seen = Column(Float)
+    last_seen = Column(Float, index=True)
 
 # -------------------------
 # Embeddings (para busca semântica)
@@ -28,7 +51,8 @@ class QuestionEmbedding(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     question_id = Column(Integer, ForeignKey("questions.id"), unique=True)
-    embedding = Column(String)  # será uma string JSON com os números do vetor
+    embedding = Column(EmbeddingColumn)  # blob binário ou vector do pgvector (ver embedding_codec)
+    embedding_model = Column(String, index=True)  # modelo que gerou o vetor
 
 # -------------------------
 # Trechos de documentos (PDFs)
@@ -39,4 +63,93 @@ class DocumentChunk(Base):
     id = Column(Integer, primary_key=True, index=True)
     source_name = Column(String, nullable=False)       # nome do PDF
     content = Column(Text, nullable=False)             # texto do trecho
-    embedding = Column(Text, nullable=False)           # embedding JSON
\ No newline at end of file
+    embedding = Column(EmbeddingColumn, nullable=False)  # blob binário ou vector do pgvector
+    embedding_model = Column(String, index=True)       # modelo que gerou o vetor
+    content_hash = Column(String, index=True)          # sha256 do texto (reindexação incremental)
+    chunk_index = Column(Integer)                      # posição do trecho no documento
+    page_start = Column(Integer)                       # primeira página do trecho (1 = primeira)
+    page_end = Column(Integer)                         # última página do trecho
+
+# -------------------------
+# Registro dos PDFs já indexados
+# -------------------------
+class IndexedDocument(Base):
+    __tablename__ = "indexed_documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_name = Column(String, unique=True, nullable=False)  # nome do PDF (= DocumentChunk.source_name)
+    file_hash = Column(String)                                  # sha256 do arquivo
+    file_size = Column(Integer)
+    mtime = Column(Float)
+    page_count = Column(Integer)
+    chunk_count = Column(Integer)
+    embedding_model = Column(String)
+    chunking = Column(String)                                   # configuração usada (chunking.signature)
+    status = Column(String, default="indexing")                 # "indexing" até o último commit, depois "complete"
+    indexed_at = Column(Float)
+
+# -------------------------
+# Re-embedding (troca de modelo sem downtime)
+# -------------------------
+class EmbeddingJob(Base):
+    __tablename__ = "embedding_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    model = Column(String, nullable=False)
+    corpora = Column(String, nullable=False)                    # "questions,chunks"
+    status = Column(String, default="building", index=True)     # building -> active (depois retired) | superseded
+    question_cursor = Column(Integer, default=0)                # checkpoint: último id já processado
+    chunk_cursor = Column(Integer, default=0)
+    embedded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    started_at = Column(Float)
+    finished_at = Column(Float)
+
+
+class ShadowEmbedding(Base):
+    __tablename__ = "shadow_embeddings"
+    __table_args__ = (UniqueConstraint("job_id", "corpus", "item_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("embedding_jobs.id"), index=True)
+    corpus = Column(String, nullable=False)     # "questions" ou "chunks"
+    item_id = Column(Integer, nullable=False)   # Question.id ou DocumentChunk.id
+    embedding = Column(EmbeddingColumn, nullable=False)
+
+# -------------------------
+# Fila de ingestão (PDFs enviados pela API)
+# -------------------------
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_name = Column(String, nullable=False, index=True)   # nome do PDF (= DocumentChunk.source_name)
+    file_path = Column(String, nullable=False)
+    status = Column(String, default="queued", index=True)      # queued -> running -> done | failed; cancelling -> cancelled
+    attempts = Column(Integer, default=0)
+    available_at = Column(Float)                                # nova tentativa só a partir daqui
+    worker = Column(String)                                     # host:pid que pegou o job
+    page_count = Column(Integer)
+    pages_done = Column(Integer, default=0)
+    chunks_written = Column(Integer, default=0)
+    error = Column(Text)
+    created_at = Column(Float)
+    started_at = Column(Float)
+    heartbeat_at = Column(Float)                                # sem sinal por INGEST_STALE_SECONDS: volta para a fila
+    finished_at = Column(Float)
+
+# -------------------------
+# Manutenção do banco (backup, checkpoint, limpeza, VACUUM)
+# -------------------------
+class MaintenanceTask(Base):
+    __tablename__ = "maintenance_tasks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)          # backup, checkpoint, cleanup, optimize, vacuum
+    worker = Column(String)                                     # host:pid que está rodando (ou rodou por último)
+    lease_until = Column(Float)                                 # enquanto no futuro, nenhum outro processo roda a tarefa
+    last_started = Column(Float)
+    last_finished = Column(Float)
+    last_status = Column(String)                                # ok | failed
+    last_seconds = Column(Float)
+    last_detail = Column(Text)                                  # resumo (JSON) ou o erro
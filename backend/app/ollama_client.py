@@ -0,0 +1,369 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+import httpx
+from dotenv import load_dotenv
+from app import metrics
+
+load_dotenv()
+
+LLAMA_URL = os.getenv("LLAMA_URL", "http://localhost:11434")
+# 🔹 Limites da conexão com o Ollama
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "30"))
+OLLAMA_GENERATE_TIMEOUT = float(os.getenv("OLLAMA_GENERATE_TIMEOUT", "120"))
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+OLLAMA_BACKOFF = float(os.getenv("OLLAMA_BACKOFF", "0.5"))
+# 🔹 Lotes de indexação (PDFs, re-embedding): quantos em paralelo no máximo, a partir de quantos
+# segundos um lote conta como lento, pausa depois de uma falha e espera máxima por /ask em andamento
+OLLAMA_BULK_CONCURRENCY = int(os.getenv("OLLAMA_BULK_CONCURRENCY", "4"))
+OLLAMA_BULK_SLOW_SECONDS = float(os.getenv("OLLAMA_BULK_SLOW_SECONDS", "10"))
+OLLAMA_BULK_PAUSE = float(os.getenv("OLLAMA_BULK_PAUSE", "5"))
+OLLAMA_BULK_MAX_WAIT = float(os.getenv("OLLAMA_BULK_MAX_WAIT", "30"))
+# 🔹 Embeddings do /ask: janela (ms) para juntar chamadas concorrentes num lote, e tamanho máximo do lote
+OLLAMA_EMBED_BATCH_WINDOW = float(os.getenv("OLLAMA_EMBED_BATCH_WINDOW_MS", "5")) / 1000
+OLLAMA_EMBED_MAX_BATCH = int(os.getenv("OLLAMA_EMBED_MAX_BATCH", "32"))
+
+# 🔹 Quanto tempo o Ollama mantém o modelo carregado depois da última chamada
+# (ex.: "30m"; "-1" = para sempre; vazio = padrão do servidor, 5 minutos)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "")
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def with_keep_alive(payload: dict) -> dict:
+    """Acrescenta o keep_alive configurado (número = segundos, texto = duração do Go)."""
+    if not OLLAMA_KEEP_ALIVE:
+        return payload
+    try:
+        keep_alive = float(OLLAMA_KEEP_ALIVE)
+    except ValueError:
+        keep_alive = OLLAMA_KEEP_ALIVE
+    return {**payload, "keep_alive": keep_alive}
+
+
+class OllamaError(Exception):
+    pass
+
+
+# -------------------------
+# Prioridade: chamadas interativas antes dos lotes
+# -------------------------
+class PriorityLimiter:
+    """
+    Divide o Ollama entre as chamadas interativas (embedding do /ask) e os
+    lotes de indexação do mesmo processo. Um lote novo só sai quando não há
+    chamada interativa em andamento (ou depois de esperar `max_wait`
+    segundos, para a indexação não parar de vez sob tráfego contínuo).
+
+    O número de lotes simultâneos se ajusta sozinho: cai pela metade quando
+    um lote demora mais que `slow` segundos ou falha (e, na falha, os lotes
+    param por `pause` segundos), e sobe de um em um enquanto o Ollama
+    responde rápido, até `max_bulk`.
+    """
+
+    def __init__(self, max_bulk: int = OLLAMA_BULK_CONCURRENCY, slow: float = OLLAMA_BULK_SLOW_SECONDS,
+                 pause: float = OLLAMA_BULK_PAUSE, max_wait: float = OLLAMA_BULK_MAX_WAIT):
+        self.max_bulk = max(1, max_bulk)
+        self.limit = self.max_bulk
+        self.slow = slow
+        self.pause = pause
+        self.max_wait = max_wait
+        self.interactive = 0    # chamadas interativas em andamento
+        self.bulk = 0           # lotes em andamento
+        self.waiting = 0        # lotes esperando a vez
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def interactive_call(self):
+        """Marca uma chamada interativa (não espera nada; só segura os lotes novos)."""
+        with self._cond:
+            self.interactive += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.interactive -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def bulk_call(self):
+        """Espera a vez de um lote (bloqueia a thread) e ajusta o limite pelo resultado."""
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    yielded = self.interactive == 0 or (self.max_wait > 0 and now >= deadline)
+                    if self.bulk < self.limit and now >= self._paused_until and yielded:
+                        break
+                    self._cond.wait(timeout=min(max(self._paused_until - now, 0.05), 1.0))
+            finally:
+                self.waiting -= 1
+            self.bulk += 1
+
+        started = time.monotonic()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self.bulk -= 1
+                if failed or elapsed > self.slow:
+                    self.limit = max(1, self.limit // 2)
+                    if failed:
+                        self._paused_until = time.monotonic() + self.pause
+                else:
+                    self.limit = min(self.max_bulk, self.limit + 1)
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "interactive": self.interactive,
+                "bulk": self.bulk,
+                "bulk_waiting": self.waiting,
+                "bulk_limit": self.limit,
+                "paused": time.monotonic() < self._paused_until,
+            }
+
+
+# -------------------------
+# Cliente assíncrono do Ollama
+# -------------------------
+class OllamaClient:
+    """
+    Um único httpx.AsyncClient por processo (pool de conexões keep-alive),
+    com no máximo `max_concurrency` chamadas simultâneas ao Ollama, timeout
+    por chamada e novas tentativas com backoff exponencial em erros transitórios.
+    """
+
+    def __init__(self, base_url: str = LLAMA_URL, max_concurrency: int = OLLAMA_MAX_CONCURRENCY,
+                 timeout: float = OLLAMA_TIMEOUT, retries: int = OLLAMA_RETRIES, backoff: float = OLLAMA_BACKOFF):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._client = None
+        self._semaphore = None
+        self._batch_endpoint = True  # servidores antigos não têm /api/embed
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # criado sob demanda, dentro do event loop que vai usá-lo
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency * 2,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _post(self, path: str, payload: dict, timeout: float = None) -> dict:
+        client = self._get_client()
+        last_error = None
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    response = await client.post(path, json=with_keep_alive(payload), timeout=timeout or self.timeout)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                last_error = OllamaError(f"Ollama respondeu {response.status_code}")
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                last_error = e
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random() * 0.25))
+        raise OllamaError(f"Falha ao chamar {path} após {self.retries + 1} tentativas: {last_error}")
+
+    async def embed(self, text: str, model: str) -> list:
+        data = await self._post("/api/embeddings", {"model": model, "prompt": text})
+        return data.get("embedding", [])
+
+    async def embed_batch(self, texts: list, model: str) -> list:
+        """Vários textos numa chamada só (/api/embed); sem o endpoint, um /api/embeddings por texto."""
+        if self._batch_endpoint:
+            try:
+                data = await self._post("/api/embed", {"model": model, "input": texts},
+                                        timeout=self.timeout + len(texts))
+                return data.get("embeddings", [])
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 404:
+                    raise
+                print("ℹ️ Ollama sem /api/embed; usando /api/embeddings um a um.")
+                self._batch_endpoint = False
+        return list(await asyncio.gather(*(self.embed(text, model) for text in texts)))
+
+    async def generate(self, prompt: str, model: str = "llama3") -> str:
+        data = await self._post(
+            "/api/generate",
+            {"model": model, "prompt": prompt, "stream": False},
+            timeout=OLLAMA_GENERATE_TIMEOUT,
+        )
+        return data.get("response", "").strip()
+
+    async def generate_stream(self, prompt: str, model: str = "llama3"):
+        """
+        Gera os tokens à medida que o Ollama os produz ("stream": true, NDJSON).
+        Só repete a chamada se a falha acontecer antes do primeiro token.
+        """
+        client = self._get_client()
+        payload = with_keep_alive({"model": model, "prompt": prompt, "stream": True})
+        # o timeout vale entre dois pedaços da resposta, não para a geração inteira
+        timeout = httpx.Timeout(OLLAMA_GENERATE_TIMEOUT, connect=5.0)
+        last_error = None
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                async with self._semaphore:
+                    async with client.stream("POST", "/api/generate", json=payload, timeout=timeout) as response:
+                        if response.status_code in RETRY_STATUS:
+                            last_error = OllamaError(f"Ollama respondeu {response.status_code}")
+                        else:
+                            response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                if not line.strip():
+                                    continue
+                                data = json.loads(line)
+                                if data.get("error"):
+                                    raise OllamaError(data["error"])
+                                token = data.get("response", "")
+                                if token:
+                                    started = True
+                                    yield token
+                                if data.get("done"):
+                                    return
+                            return
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if started:
+                    raise OllamaError(f"Geração interrompida: {e}")
+                last_error = e
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random() * 0.25))
+        raise OllamaError(f"Falha ao chamar /api/generate após {self.retries + 1} tentativas: {last_error}")
+
+    async def load(self, model: str):
+        """Carrega o modelo de geração sem gerar nada (prompt vazio)."""
+        await self._post("/api/generate", {"model": model, "prompt": "", "stream": False},
+                         timeout=OLLAMA_GENERATE_TIMEOUT)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# -------------------------
+# Embeddings concorrentes: single-flight + micro-lotes
+# -------------------------
+class EmbeddingDispatcher:
+    """
+    Junta as chamadas de embedding concorrentes do processo (no event loop da API):
+    - um texto igual a outro que já está a caminho do Ollama espera a mesma
+      resposta, sem nova chamada (single-flight);
+    - com o Ollama ocioso, o texto sai na hora (só junta o que chegou no mesmo
+      ciclo do event loop); enquanto um lote está em andamento, os textos novos
+      se acumulam e saem juntos num único /api/embed quando ele volta (ou depois
+      de `window` segundos, ou ao juntar `max_batch`). No Ollama só de CPU, um
+      lote custa bem menos que as mesmas chamadas separadas esperando na fila.
+    """
+
+    def __init__(self, client: OllamaClient, window: float = OLLAMA_EMBED_BATCH_WINDOW,
+                 max_batch: int = OLLAMA_EMBED_MAX_BATCH):
+        self.client = client
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._loop = None
+        self._inflight = {}   # (modelo, texto) -> Future com o vetor
+        self._pending = {}    # modelo -> textos esperando o próximo lote
+        self._timers = {}     # modelo -> flush agendado
+        self._sending = {}    # modelo -> lotes em andamento
+        self._tasks = set()
+
+    def _reset(self, loop):
+        # outro event loop (ex.: testes): o que ficou do anterior não serve mais
+        self._loop = loop
+        self._inflight, self._pending, self._timers, self._sending = {}, {}, {}, {}
+
+    async def embed(self, text: str, model: str) -> list:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._reset(loop)
+        key = (model, text)
+        future = self._inflight.get(key)
+        if future is not None:
+            metrics.EMBED_COALESCED_TOTAL.inc()
+        else:
+            future = self._inflight[key] = loop.create_future()
+            future.add_done_callback(_consume_exception)
+            pending = self._pending.setdefault(model, [])
+            pending.append(text)
+            if len(pending) >= self.max_batch:
+                self._flush(model)
+            elif model not in self._timers:
+                delay = self.window if self._sending.get(model) else 0
+                self._timers[model] = loop.call_later(delay, self._flush, model)
+        # shield: quem desiste (cliente desconectou) não cancela a espera dos outros
+        return await asyncio.shield(future)
+
+    def _flush(self, model: str):
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        texts = self._pending.pop(model, None)
+        if texts:
+            self._sending[model] = self._sending.get(model, 0) + 1
+            task = asyncio.ensure_future(self._send(model, texts))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, model: str, texts: list):
+        metrics.EMBED_BATCH_TEXTS.observe(len(texts))
+        try:
+            vectors, error = await self.client.embed_batch(texts, model), None
+        except Exception as e:
+            vectors, error = [], e
+        finally:
+            self._sending[model] = self._sending.get(model, 1) - 1
+        if self._pending.get(model) and not self._sending[model]:
+            self._flush(model)  # o que se acumulou durante este lote sai agora
+        for position, text in enumerate(texts):
+            future = self._inflight.pop((model, text), None)
+            if future is None or future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            elif position < len(vectors) and vectors[position]:
+                future.set_result(vectors[position])
+            else:
+                future.set_exception(OllamaError("Ollama não devolveu o embedding"))
+
+
+def _consume_exception(future):
+    # a exceção é entregue a quem espera; sem ninguém esperando, não vira aviso no log
+    if not future.cancelled():
+        future.exception()
+
+
+# Cliente global do processo
+ollama = OllamaClient()
+priority = PriorityLimiter()
+dispatcher = EmbeddingDispatcher(ollama)
+
+metrics.collector("ollama_inflight", "gauge", "Ollama embedding calls in flight by priority",
+                  lambda: {"interactive": priority.interactive, "bulk": priority.bulk, "bulk_waiting": priority.waiting},
+                  labels=("priority",))
+metrics.collector("ollama_bulk_limit", "gauge", "Concurrent bulk embedding calls currently allowed",
+                  lambda: {(): priority.limit})
@@ -1,26 +1,63 @@
-import fitz  # PyMuPDF
+import argparse
+import hashlib
 import os
-import json
 import time
 import sqlite3
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app import database, models, utils
-from tqdm import tqdm
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dotenv import load_dotenv
+from sqlalchemy.exc import OperationalError
+from app import database, models, utils, vector_index, migrations, chunking, refresh_embeddings, metrics
+from app.answer_cache import answer_cache
 
-CHUNK_SIZE = 500  # número de palavras por bloco
+load_dotenv()
 
+CHUNK_SIZE = chunking.CHUNK_SIZE  # número de palavras por bloco
+# 🔹 Pipeline de embeddings: lotes enviados ao Ollama, quantos em paralelo, e tamanho do lote gravado no banco
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "16"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "256"))
 
-def safe_commit(db, retries=5, delay=1):
-    """Evita o erro 'database is locked' com tentativas automáticas."""
+
+class _NoProgress:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def update(self, n=1):
+        pass
+
+
+def progress_bar(enabled: bool, **options):
+    """Barra do tqdm no terminal; na fila da API (ou sem o tqdm instalado), nada."""
+    if enabled:
+        try:
+            from tqdm import tqdm
+            return tqdm(**options)
+        except ImportError:
+            pass
+    return _NoProgress()
+
+
+def safe_commit(db, retries=5, delay=1, objects=None):
+    """
+    Evita o erro 'database is locked' com tentativas automáticas.
+    Depois de um rollback os objetos pendentes saem da sessão, então
+    `objects` são adicionados de novo antes de cada nova tentativa.
+    """
     for attempt in range(retries):
         try:
             db.commit()
             return
-        except sqlite3.OperationalError as e:
+        except (sqlite3.OperationalError, OperationalError) as e:
             if "database is locked" in str(e).lower():
                 print(f"⚠️ Banco bloqueado, aguardando {delay}s (tentativa {attempt + 1}/{retries})...")
+                db.rollback()
                 time.sleep(delay)
+                if objects:
+                    db.add_all(objects)
             else:
                 raise
     raise RuntimeError("❌ Falha ao gravar no banco após múltiplas tentativas.")
@@ -28,70 +65,308 @@ def safe_commit(db, retries=5, delay=1):
 
 def split_text(text, chunk_size=CHUNK_SIZE):
     """Divide o texto em blocos de tamanho fixo."""
-    words = text.split()
-    return [" ".join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size)]
+    return [chunk.text for chunk in chunking.iter_chunks([(1, text)], chunk_size, 0, False)]
+
+
+def ordered_map(pool, fn, items, window):
+    """Como pool.map, mas consome `items` aos poucos (no máximo `window` tarefas em voo)."""
+    pending = deque()
+    for item in items:
+        pending.append((item, pool.submit(fn, item)))
+        if len(pending) >= window:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
 
 
-def process_pdf(file_path: str):
-    """Extrai texto do PDF e salva os embeddings no banco, isoladamente por arquivo."""
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def delete_chunks(db, chunk_ids):
+    """Apaga trechos do banco e do índice vetorial, em lotes."""
+    chunk_ids = list(chunk_ids)
+    for start in range(0, len(chunk_ids), 500):
+        batch = chunk_ids[start:start + 500]
+        db.query(models.DocumentChunk).filter(models.DocumentChunk.id.in_(batch)).delete(synchronize_session=False)
+    vector_index.chunk_index.remove_many(chunk_ids)
+    answer_cache.invalidate()
+
+
+def process_pdf(file_path: str, batch_size: int = EMBED_BATCH_SIZE, workers: int = EMBED_WORKERS,
+                write_batch_size: int = WRITE_BATCH_SIZE, force: bool = False, extract_pool=None,
+                on_progress=None, raise_errors: bool = False, source_name: str = None):
+    """
+    Extrai texto do PDF e salva os embeddings no banco, isoladamente por arquivo.
+    Os blocos vão ao Ollama em lotes de `batch_size`, com até `workers` lotes
+    em paralelo, e são gravados em lotes de `write_batch_size`. Com `extract_pool`
+    (um ProcessPoolExecutor), as páginas são extraídas em paralelo em outros processos.
+
+    Reindexação incremental: arquivos sem mudança (tamanho/mtime ou hash) são
+    pulados; nos alterados só os blocos com hash novo são embedados e os que
+    sumiram são apagados. Como o registro só vira "complete" no fim, uma
+    execução interrompida continua de onde parou.
+
+    `on_progress(páginas lidas, total de páginas, blocos gravados)` é chamado
+    a cada lote (usado pela fila de ingestão; pode levantar exceção para
+    interromper). Com `raise_errors`, erros são repassados em vez de só impressos.
+    `source_name` (padrão: o nome do arquivo) é o nome do documento, para a
+    fila indexar um envio guardado com outro nome de arquivo.
+    Retorna o número de blocos gravados.
+    """
+    import fitz  # PyMuPDF (importado aqui: a API só precisa dele quando indexa)
+
     db = database.SessionLocal()
 
     # 🔧 Ativa o modo WAL com retry (evita travamentos do SQLite)
-    for attempt in range(5):
+    for attempt in range(5 if database.DIALECT == "sqlite" else 0):
         try:
             db.connection().connection.execute("PRAGMA journal_mode=WAL;")
             break
-        except sqlite3.OperationalError as e:
+        except (sqlite3.OperationalError, OperationalError) as e:
             if "locked" in str(e).lower():
                 print(f"⚠️ Banco bloqueado, tentando novamente em 2s... (tentativa {attempt + 1}/5)")
                 time.sleep(2)
             else:
                 raise
 
+    written = 0
     try:
-        doc = fitz.open(file_path)
-        all_text = ""
+        source_name = source_name or os.path.basename(file_path)
+        stat = os.stat(file_path)
+        record = db.query(models.IndexedDocument).filter_by(source_name=source_name).first()
+        # sem registro = PDF indexado antes do registro existir; os blocos antigos são reaproveitados pelo hash
+        same_model = record is None or record.embedding_model == utils.EMBEDDING_MODEL
+        unchanged = (
+            not force and record is not None and same_model and record.status == "complete"
+            and record.chunking in (None, chunking.signature())
+        )
 
-        for page in doc:
-            all_text += page.get_text("text") + "\n"
+        # 1️⃣ Nada mudou? (primeiro pelo tamanho/mtime, depois pelo hash do arquivo)
+        if unchanged and record.file_size == stat.st_size and record.mtime == stat.st_mtime:
+            print(f"⏭️ '{source_name}' sem alterações, pulando.")
+            return 0
+        file_hash = file_sha256(file_path)
+        if unchanged and record.file_hash == file_hash:
+            record.mtime, record.file_size = stat.st_mtime, stat.st_size
+            safe_commit(db)
+            print(f"⏭️ '{source_name}' sem alterações (mesmo hash), pulando.")
+            return 0
 
-        chunks = split_text(all_text)
-        source_name = os.path.basename(file_path)
+        if record is None:
+            record = models.IndexedDocument(source_name=source_name)
+            db.add(record)
+        record.file_hash = file_hash
+        record.embedding_model = utils.EMBEDDING_MODEL
+        record.chunking = chunking.signature()
+        record.status = "indexing"
+        safe_commit(db)
 
-        print(f"📘 Indexando '{source_name}' com {len(chunks)} blocos...")
+        # 2️⃣ Blocos já gravados (de uma versão anterior ou de uma execução interrompida)
+        existing = defaultdict(list)
+        if same_model and not force:
+            rows = db.query(
+                models.DocumentChunk.id, models.DocumentChunk.content_hash, models.DocumentChunk.content
+            ).filter(models.DocumentChunk.source_name == source_name).all()
+            for row in rows:
+                existing[row.content_hash or chunk_sha256(row.content)].append(row.id)
+        else:
+            rows = db.query(models.DocumentChunk.id).filter(models.DocumentChunk.source_name == source_name).all()
+            existing[None] = [row.id for row in rows]
 
-        for chunk in tqdm(chunks, desc=f"Gerando embeddings → {source_name}"):
-            embedding = utils.get_embedding(chunk)
-            if not embedding:
-                print(f"⚠️ Falha ao gerar embedding para um bloco em {source_name}")
-                continue
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count
 
-            db_chunk = models.DocumentChunk(
-                source_name=source_name,
-                content=chunk,
-                embedding=json.dumps(embedding)
-            )
-            db.add(db_chunk)
+        print(f"📘 Indexando '{source_name}' ({page_count} páginas)...")
+        start = time.perf_counter()
+        kept = []
+        total = 0
+        pages_read = 0
+        pending, pending_embeddings = [], []
+        if on_progress:
+            on_progress(0, page_count, 0)
 
+        # 3️⃣ Extrai as páginas e gera os blocos em streaming; só os blocos com hash novo vão para o Ollama
+        def new_chunk_batches():
+            nonlocal total, pages_read
+            batch = []
+            pages = chunking.iter_pages(file_path, page_count, extract_pool)
+            extracting = time.perf_counter()  # conta só o tempo de extração, não o de quem consome
+            for chunk in chunking.iter_chunks(pages):
+                total += 1
+                pages_read = chunk.page_end
+                chunk_hash = chunk_sha256(chunk.text)
+                provenance = {"chunk_index": chunk.index, "page_start": chunk.page_start, "page_end": chunk.page_end}
+                if existing.get(chunk_hash):
+                    kept.append({"id": existing[chunk_hash].pop(), "content_hash": chunk_hash, **provenance})
+                    continue
+                batch.append((chunk, chunk_hash, provenance))
+                if len(batch) == batch_size:
+                    metrics.record_stage("pdf.extract", time.perf_counter() - extracting)
+                    yield batch
+                    extracting = time.perf_counter()
+                    batch = []
+            metrics.record_stage("pdf.extract", time.perf_counter() - extracting)
+            if batch:
+                yield batch
+
+        def flush():
+            nonlocal written
+            if not pending:
+                return
+            with metrics.stage("pdf.write"):
+                db.add_all(pending)
+                safe_commit(db, objects=pending)
+                # Mantém o índice em memória sincronizado (quando rodando dentro da API)
+                vector_index.chunk_index.upsert_many([c.id for c in pending], pending_embeddings)
+            answer_cache.invalidate()
+            metrics.PDF_CHUNKS_TOTAL.inc(len(pending), result="written")
+            written += len(pending)
+            pending.clear()
+            pending_embeddings.clear()
+
+        def embed(batch):
+            with metrics.stage("pdf.embed"):
+                return utils.get_embeddings([chunk.text for chunk, _, _ in batch])
+
+        # 4️⃣ Embeda com até `workers` lotes em voo, gravando em lotes
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool, \
+                progress_bar(on_progress is None, desc=f"Gerando embeddings → {source_name}", unit="bloco") as progress:
+            for batch, embeddings in ordered_map(pool, embed, new_chunk_batches(), workers):
+                for (chunk, chunk_hash, provenance), embedding in zip(batch, embeddings):
+                    if not embedding:
+                        failed += 1
+                        print(f"⚠️ Falha ao gerar embedding para um bloco em {source_name}")
+                        continue
+                    pending.append(models.DocumentChunk(
+                        source_name=source_name,
+                        content=chunk.text,
+                        embedding=utils.serialize_embedding(embedding),
+                        embedding_model=utils.EMBEDDING_MODEL,
+                        content_hash=chunk_hash,
+                        **provenance,
+                    ))
+                    pending_embeddings.append(embedding)
+                progress.update(len(batch))
+                if len(pending) >= write_batch_size:
+                    flush()
+                if on_progress:
+                    on_progress(pages_read, page_count, written)
+        flush()
+
+        # 5️⃣ Atualiza posição/páginas dos blocos reaproveitados e apaga os que sumiram
+        stale = [chunk_id for ids in existing.values() for chunk_id in ids]
+        if stale:
+            delete_chunks(db, stale)
+        if kept:
+            db.bulk_update_mappings(models.DocumentChunk, kept)
+        safe_commit(db)
+        vector_index.chunk_index.save(force=True)
+
+        # 6️⃣ Só marca como completo se todos os blocos foram gravados
+        record.file_size = stat.st_size
+        record.mtime = stat.st_mtime
+        record.page_count = page_count
+        record.chunk_count = total - failed
+        record.status = "complete" if not failed else "indexing"
+        record.indexed_at = time.time()
         safe_commit(db)
-        print(f"✅ Indexação completa para {source_name}!")
+        if on_progress:
+            on_progress(page_count, page_count, written)
+
+        elapsed = time.perf_counter() - start
+        rate = written / elapsed if elapsed else 0.0
+        metrics.record_stage("pdf.file", elapsed)
+        metrics.PDF_CHUNKS_TOTAL.inc(len(kept), result="reused")
+        metrics.PDF_CHUNKS_TOTAL.inc(failed, result="failed")
+        metrics.PDF_CHUNKS_TOTAL.inc(len(stale), result="removed")
+        print(f"✅ Indexação completa para {source_name}! {total} blocos ({len(kept)} reaproveitados, "
+              f"{written} novos, {len(stale)} removidos) em {elapsed:.1f}s ({rate:.1f} blocos/s)")
 
     except Exception as e:
         print(f"❌ Erro ao processar {file_path}: {e}")
+        if raise_errors:
+            raise
 
     finally:
         db.close()
 
+    return written
+
+
+def prune_missing(present: set):
+    """Apaga blocos e registros de PDFs que não estão mais na pasta."""
+    db = database.SessionLocal()
+    try:
+        indexed = {row[0] for row in db.query(models.DocumentChunk.source_name).distinct()}
+        indexed |= {row[0] for row in db.query(models.IndexedDocument.source_name)}
+        # envios ainda na fila de ingestão só chegam à pasta quando o job termina
+        present = present | {row[0] for row in db.query(models.IngestJob.source_name).filter(
+            models.IngestJob.status.in_(("queued", "running", "cancelling")))}
+        for source_name in sorted(indexed - present):
+            chunk_ids = [row[0] for row in db.query(models.DocumentChunk.id).filter_by(source_name=source_name)]
+            delete_chunks(db, chunk_ids)
+            db.query(models.IndexedDocument).filter_by(source_name=source_name).delete()
+            safe_commit(db)
+            print(f"🗑️ '{source_name}' removido da pasta: {len(chunk_ids)} blocos apagados.")
+        vector_index.chunk_index.save(force=True)
+    finally:
+        db.close()
+
 
 if __name__ == "__main__":
-    folder = "pdfs"  # pasta onde estão os PDFs
+    parser = argparse.ArgumentParser(description="Indexa os PDFs da pasta em DocumentChunk")
+    parser.add_argument("folder", nargs="?", default="pdfs", help="pasta onde estão os PDFs")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="blocos por chamada ao Ollama")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS, help="chamadas simultâneas ao Ollama")
+    parser.add_argument("--write-batch-size", type=int, default=WRITE_BATCH_SIZE, help="blocos por commit")
+    parser.add_argument("--extract-workers", type=int, default=chunking.PDF_EXTRACT_WORKERS,
+                        help="processos para extrair o texto das páginas")
+    parser.add_argument("--force", action="store_true", help="reembeda tudo, mesmo sem alterações")
+    parser.add_argument("--no-prune", action="store_true", help="não apaga blocos de PDFs removidos da pasta")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+    # usa o modelo ativado pelo último refresh_embeddings (se houver)
+    with database.SessionLocal() as db:
+        refresh_embeddings.apply_active_model(db)
+
+    folder = args.folder
     os.makedirs(folder, exist_ok=True)
 
     pdf_files = [f for f in os.listdir(folder) if f.endswith(".pdf")]
     print(f"📁 Encontrados {len(pdf_files)} PDFs na pasta '{folder}'.")
 
-    for filename in pdf_files:
-        file_path = os.path.join(folder, filename)
-        process_pdf(file_path)
+    total = 0
+    started = time.perf_counter()
+    extract_pool = ProcessPoolExecutor(args.extract_workers) if args.extract_workers > 1 else None
+    try:
+        for filename in pdf_files:
+            file_path = os.path.join(folder, filename)
+            total += process_pdf(file_path, args.batch_size, args.workers, args.write_batch_size,
+                                 args.force, extract_pool)
+    finally:
+        if extract_pool is not None:
+            extract_pool.shutdown()
+
+    if not args.no_prune:
+        prune_missing(set(pdf_files))
 
-    print("🎯 Indexação finalizada para todos os PDFs!")
+    elapsed = time.perf_counter() - started
+    print(f"🎯 Indexação finalizada para todos os PDFs! {total} blocos em {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:.1f} blocos/s)")
+    if total:
+        # extração e embedding correm em paralelo: as somas passam do tempo total
+        print(f"⏱️ Etapas: {metrics.stage_summary('pdf.')}")
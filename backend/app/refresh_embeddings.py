@@ -1,36 +1,385 @@
-import json
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert, or_, select, text, update
 from sqlalchemy.orm import Session
-from app import database, models, utils
+from app import database, models, utils, vector_index
+from app.answer_cache import answer_cache
 
-# Cria as tabelas se não existirem
-models.Base.metadata.create_all(bind=database.engine)
+load_dotenv()
 
-# Abre conexão com o banco
-db: Session = database.SessionLocal()
+# 🔹 Re-embedding: textos por chamada ao Ollama, chamadas em paralelo e itens por commit (checkpoint)
+REFRESH_BATCH_SIZE = int(os.getenv("REFRESH_BATCH_SIZE", "16"))
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", "4"))
+REFRESH_COMMIT_EVERY = int(os.getenv("REFRESH_COMMIT_EVERY", "512"))
 
-print("🔄 Atualizando embeddings das perguntas existentes...\n")
+# corpus -> (tabela, coluna de texto, coluna de checkpoint no job)
+CORPORA = {
+    "questions": (models.Question, models.Question.text, "question_cursor"),
+    "chunks": (models.DocumentChunk, models.DocumentChunk.content, "chunk_cursor"),
+}
 
-questions = db.query(models.Question).all()
-updated = 0
+# Job rodando dentro da API (no máximo um por processo)
+_thread = None
+# Job ativo cujos vetores este processo carregou (cada troca cria um job novo, mesmo com o mesmo modelo)
+_active_job_id = None
 
-for q in questions:
-    print(f"➡️ Gerando embedding para: '{q.text}'")
-    emb = utils.get_embedding(q.text)
 
-    if not emb:
-        print(f"⚠️ Falha ao gerar embedding para '{q.text}'")
-        continue
+# -------------------------
+# Modelo ativo
+# -------------------------
+def active_job(db: Session):
+    """Último job ativado (None se nenhum refresh_embeddings terminou)."""
+    return (
+        db.query(models.EmbeddingJob)
+        .filter(models.EmbeddingJob.status == "active")
+        .order_by(models.EmbeddingJob.finished_at.desc())
+        .first()
+    )
 
-    # Verifica se já existe registro de embedding
-    existing = db.query(models.QuestionEmbedding).filter_by(question_id=q.id).first()
-    if existing:
-        existing.embedding = json.dumps(emb)
-    else:
-        new_emb = models.QuestionEmbedding(question_id=q.id, embedding=json.dumps(emb))
-        db.add(new_emb)
 
-    updated += 1
+def active_model(db: Session) -> str:
+    """Modelo do último job ativado; sem job, o EMBEDDING_MODEL configurado."""
+    job = active_job(db)
+    return job.model if job else utils.EMBEDDING_MODEL
+
+
+def apply_active_model(db: Session) -> bool:
+    """Usa neste processo o modelo ativo no banco (sem recarregar índices)."""
+    global _active_job_id
+    job = active_job(db)
+    _active_job_id = job.id if job else None  # os índices carregados em seguida já têm os vetores dele
+    model = job.model if job else utils.EMBEDDING_MODEL
+    if model == utils.EMBEDDING_MODEL:
+        return False
+    print(f"ℹ️ Modelo de embeddings ativo: '{model}' (ativado pelo refresh_embeddings; EMBEDDING_MODEL={utils.EMBEDDING_MODEL}).")
+    utils.EMBEDDING_MODEL = model
+    return True
+
+
+def activate(db: Session, model: str, job_id: int = None):
+    """
+    Troca o processo atual para o modelo novo: índices novos montados à parte
+    e trocados de uma vez, consultas passam a usar o modelo novo, e o que foi
+    gravado com o modelo antigo durante a troca é re-embedado.
+    """
+    global _active_job_id
+    _active_job_id = job_id
+    vector_index.swap_indexes(db, model)
+    utils.EMBEDDING_MODEL = model
+    reconcile(db, model, update_index=True)
+    answer_cache.invalidate()
+
+
+def sync_active_model(db: Session) -> bool:
+    """
+    Chamado periodicamente pela API: se outro processo ativou um job, troca
+    para os vetores dele — também num re-embedding com o mesmo modelo, em que
+    os vetores mudaram no banco mas o nome do modelo não.
+    """
+    job = active_job(db)
+    if job is None or job.id == _active_job_id:
+        return False
+    if job.model == utils.EMBEDDING_MODEL:
+        print(f"🔄 Job {job.id} re-embedou com o mesmo modelo '{job.model}': recarregando os índices.")
+    activate(db, job.model, job.id)
+    return True
+
+
+# -------------------------
+# Job de re-embedding (vetores "sombra")
+# -------------------------
+def start_job(db: Session, model: str, corpora) -> models.EmbeddingJob:
+    """Retoma o job em andamento do mesmo modelo ou cria um novo (descartando os outros)."""
+    corpora = ",".join(corpora)
+    building = (
+        db.query(models.EmbeddingJob)
+        .filter(models.EmbeddingJob.status == "building")
+        .order_by(models.EmbeddingJob.id.desc())
+        .all()
+    )
+    for job in building:
+        if job.model == model and job.corpora == corpora:
+            print(f"⏯️ Retomando job {job.id} ({job.model}): {job.embedded} vetores já gerados.")
+            return job
+        job.status = "superseded"
+        db.execute(delete(models.ShadowEmbedding).where(models.ShadowEmbedding.job_id == job.id))
+
+    job = models.EmbeddingJob(
+        model=model, corpora=corpora, status="building", question_cursor=0, chunk_cursor=0,
+        embedded=0, failed=0, started_at=time.time(),
+    )
+    db.add(job)
+    db.commit()
+    print(f"🆕 Job {job.id}: re-embedding de {corpora} com '{model}'.")
+    return job
+
+
+def _embed_rows(pool, rows, model: str, batch_size: int):
+    """Gera os vetores de [(id, texto)] em lotes paralelos; devolve (id, texto, vetor), com None nas falhas."""
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+    results = pool.map(lambda batch: utils.get_embeddings([row[1] for row in batch], model), batches)
+    return [(row[0], row[1], vector) for batch, vectors in zip(batches, results) for row, vector in zip(batch, vectors)]
+
+
+def _write_shadow(db: Session, job, corpus: str, results):
+    """
+    Grava os vetores sombra de [(id, texto, vetor)]. Um item editado (ou
+    apagado) durante a chamada ao Ollama tem vetor do texto antigo e o
+    discard_shadow do CRUD não achou o que apagar: fica sem sombra e volta
+    na 2ª passada, com o texto novo.
+    """
+    ok = [(item_id, embedded_text, vector) for item_id, embedded_text, vector in results if vector]
+    if not ok:
+        return 0, len(results)
+    table, text_column, _ = CORPORA[corpus]
+    ids = [item_id for item_id, _, _ in ok]
+    # o DELETE pega o lock de escrita (SQLite) antes de reler os textos; no PostgreSQL, FOR UPDATE
+    # segura a edição concorrente até o commit, quando o discard_shadow dela já vê a sombra nova
+    db.execute(delete(models.ShadowEmbedding).where(
+        models.ShadowEmbedding.job_id == job.id,
+        models.ShadowEmbedding.corpus == corpus,
+        models.ShadowEmbedding.item_id.in_(ids),
+    ))
+    current = dict(db.execute(select(table.id, text_column).where(table.id.in_(ids)).with_for_update()).all())
+    fresh = [(item_id, vector) for item_id, embedded_text, vector in ok if current.get(item_id) == embedded_text]
+    if fresh:
+        db.execute(insert(models.ShadowEmbedding), [
+            {"job_id": job.id, "corpus": corpus, "item_id": item_id,
+             "embedding": utils.serialize_embedding(vector, job.model)}
+            for item_id, vector in fresh
+        ])
+    if len(fresh) < len(ok):
+        print(f"   {corpus}: {len(ok) - len(fresh)} itens editados durante o re-embedding, refeitos na 2ª passada")
+    return len(fresh), len(results) - len(ok)
+
+
+def _missing(db: Session, job, corpus: str, after: int, limit: int):
+    """Itens ainda sem vetor sombra (criados ou editados depois de o cursor passar)."""
+    table, text_column, _ = CORPORA[corpus]
+    has_shadow = select(models.ShadowEmbedding.id).where(
+        models.ShadowEmbedding.job_id == job.id,
+        models.ShadowEmbedding.corpus == corpus,
+        models.ShadowEmbedding.item_id == table.id,
+    ).exists()
+    return (
+        db.query(table.id, text_column)
+        .filter(table.id > after, ~has_shadow)
+        .order_by(table.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def _embed_corpus(db: Session, pool, job, corpus: str, batch_size: int, page_size: int):
+    table, text_column, cursor_attr = CORPORA[corpus]
+
+    # 1ª passada: em ordem de id, com checkpoint a cada página
+    while True:
+        cursor = getattr(job, cursor_attr) or 0
+        rows = db.query(table.id, text_column).filter(table.id > cursor).order_by(table.id).limit(page_size).all()
+        if not rows:
+            break
+        done, failed = _write_shadow(db, job, corpus, _embed_rows(pool, rows, job.model, batch_size))
+        setattr(job, cursor_attr, rows[-1][0])
+        job.embedded += done
+        job.failed += failed
+        db.commit()
+        print(f"   {corpus}: até id {rows[-1][0]} — {job.embedded} vetores, {job.failed} falhas")
+
+    # 2ª passada: o que mudou enquanto o job rodava (ou falhou antes)
+    after, remaining = 0, 0
+    while True:
+        rows = _missing(db, job, corpus, after, page_size)
+        if not rows:
+            break
+        done, failed = _write_shadow(db, job, corpus, _embed_rows(pool, rows, job.model, batch_size))
+        job.embedded += done
+        remaining += failed
+        after = rows[-1][0]
+        db.commit()
+    return remaining
+
+
+def _switch(db: Session, job):
+    """Copia os vetores sombra para as tabelas e ativa o job — tudo numa transação."""
+    params = {"job": job.id, "model": job.model}
+    corpora = job.corpora.split(",")
+    if database.DIALECT == "postgresql":
+        # o índice HNSW é por dimensão: o da dimensão antiga rejeitaria os vetores novos
+        dim = db.execute(text(
+            "SELECT vector_dims(embedding) FROM shadow_embeddings WHERE job_id = :job LIMIT 1"
+        ), params).scalar()
+        for corpus in corpora:
+            table = vector_index.CORPUS_COLUMNS[corpus]()[0].table.name
+            vector_index.drop_ann_indexes(db.connection(), table, keep=f"{table}_embedding_hnsw_{dim}")
+    if "questions" in corpora:
+        db.execute(text(
+            "UPDATE question_embeddings SET embedding_model = :model, embedding = ("
+            "SELECT s.embedding FROM shadow_embeddings s WHERE s.job_id = :job AND s.corpus = 'questions' "
+            "AND s.item_id = question_embeddings.question_id) "
+            "WHERE question_id IN (SELECT item_id FROM shadow_embeddings WHERE job_id = :job AND corpus = 'questions')"
+        ), params)
+        db.execute(text(
+            "INSERT INTO question_embeddings (question_id, embedding, embedding_model) "
+            "SELECT s.item_id, s.embedding, :model FROM shadow_embeddings s JOIN questions q ON q.id = s.item_id "
+            "WHERE s.job_id = :job AND s.corpus = 'questions' "
+            "AND NOT EXISTS (SELECT 1 FROM question_embeddings e WHERE e.question_id = s.item_id)"
+        ), params)
+    if "chunks" in corpora:
+        db.execute(text(
+            "UPDATE document_chunks SET embedding_model = :model, embedding = ("
+            "SELECT s.embedding FROM shadow_embeddings s WHERE s.job_id = :job AND s.corpus = 'chunks' "
+            "AND s.item_id = document_chunks.id) "
+            "WHERE id IN (SELECT item_id FROM shadow_embeddings WHERE job_id = :job AND corpus = 'chunks')"
+        ), params)
+        # o pdf_indexer não deve achar que os PDFs precisam ser re-embedados
+        db.execute(update(models.IndexedDocument).values(embedding_model=job.model))
+
+    db.query(models.EmbeddingJob).filter(models.EmbeddingJob.status == "active").update(
+        {"status": "retired"}, synchronize_session=False
+    )
+    job.status = "active"
+    job.finished_at = time.time()
+    db.commit()
+
+    db.execute(delete(models.ShadowEmbedding).where(models.ShadowEmbedding.job_id == job.id))
     db.commit()
 
-print(f"\n✅ {updated} embeddings atualizados com sucesso.")
-db.close()
+
+def run_job(db: Session, model: str = None, corpora=tuple(CORPORA), batch_size: int = REFRESH_BATCH_SIZE,
+            workers: int = REFRESH_WORKERS, page_size: int = REFRESH_COMMIT_EVERY) -> models.EmbeddingJob:
+    """
+    Re-embeda os corpora com `model` em vetores sombra (o /ask continua usando
+    os atuais) e, quando tudo tiver vetor, troca numa única transação.
+    Interrompido, retoma do último checkpoint na próxima execução.
+    """
+    model = model or active_model(db)
+    corpora = [c for c in CORPORA if c in corpora]
+    if model != active_model(db) and corpora != list(CORPORA):
+        raise ValueError("Trocar de modelo exige re-embedar perguntas e trechos de PDF (todos os corpora).")
+
+    job = start_job(db, model, corpora)
+    started = time.perf_counter()
+    remaining = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for corpus in corpora:
+            remaining += _embed_corpus(db, pool, job, corpus, batch_size, page_size)
+
+    if remaining:
+        print(f"⚠️ {remaining} itens sem vetor; o job {job.id} continua pendente (rode de novo para retomar).")
+        return job
+
+    _switch(db, job)
+    elapsed = time.perf_counter() - started
+    print(f"✅ Job {job.id} ativado: {job.embedded} vetores com '{model}' em {elapsed:.1f}s "
+          f"({job.embedded / elapsed if elapsed else 0:.1f} vetores/s).")
+    return job
+
+
+def reconcile(db: Session, model: str, batch_size: int = REFRESH_BATCH_SIZE, update_index: bool = False) -> int:
+    """
+    Re-embeda vetores gravados com outro modelo (escritas feitas durante a
+    troca); `update_index` também atualiza os índices deste processo (API).
+    """
+    fixed = 0
+    targets = (
+        (models.QuestionEmbedding, models.QuestionEmbedding.question_id, models.Question.text,
+         models.Question.id == models.QuestionEmbedding.question_id, vector_index.question_index),
+        (models.DocumentChunk, models.DocumentChunk.id, models.DocumentChunk.content, None, vector_index.chunk_index),
+    )
+    for table, item_column, text_column, join_on, index in targets:
+        query = db.query(table.id, item_column, text_column)
+        if join_on is not None:
+            query = query.join(models.Question, join_on)
+        rows = query.filter(or_(table.embedding_model != model, table.embedding_model.is_(None))).all()
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            vectors = utils.get_embeddings([row[2] for row in batch], model)
+            done = [(row, vector) for row, vector in zip(batch, vectors) if vector]
+            if not done:
+                continue
+            db.execute(update(table), [
+                {"id": row[0], "embedding": utils.serialize_embedding(vector, model), "embedding_model": model}
+                for row, vector in done
+            ])
+            db.commit()
+            if update_index:
+                index.upsert_many([row[1] for row, _ in done], [vector for _, vector in done])
+            fixed += len(done)
+    if fixed:
+        print(f"🔁 {fixed} vetores gravados durante a troca foram re-embedados com '{model}'.")
+    return fixed
+
+
+# -------------------------
+# Job dentro da API (endpoints admin)
+# -------------------------
+def start_background(model: str = None, corpora=tuple(CORPORA)) -> bool:
+    """Roda o job numa thread e ativa o modelo novo neste processo ao terminar."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return False
+
+    def work():
+        db = database.SessionLocal()
+        try:
+            job = run_job(db, model, corpora)
+            if job.status == "active":
+                activate(db, job.model, job.id)
+        except Exception as e:
+            print(f"⚠️ Falha no re-embedding: {e}")
+        finally:
+            db.close()
+
+    _thread = threading.Thread(target=work, name="refresh-embeddings", daemon=True)
+    _thread.start()
+    return True
+
+
+def status(db: Session) -> dict:
+    job = db.query(models.EmbeddingJob).order_by(models.EmbeddingJob.id.desc()).first()
+    return {
+        "running": _thread is not None and _thread.is_alive(),
+        "active_model": utils.EMBEDDING_MODEL,
+        "job": None if job is None else {
+            "id": job.id,
+            "model": job.model,
+            "corpora": job.corpora.split(","),
+            "status": job.status,
+            "embedded": job.embedded,
+            "failed": job.failed,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-embeda perguntas e trechos de PDF (retomável, sem downtime)")
+    parser.add_argument("--model", help="modelo de embeddings (padrão: o modelo ativo)")
+    parser.add_argument("--corpus", choices=["all", *CORPORA], default="all", help="o que re-embedar")
+    parser.add_argument("--batch-size", type=int, default=REFRESH_BATCH_SIZE, help="textos por chamada ao Ollama")
+    parser.add_argument("--workers", type=int, default=REFRESH_WORKERS, help="chamadas simultâneas ao Ollama")
+    parser.add_argument("--commit-every", type=int, default=REFRESH_COMMIT_EVERY, help="itens por commit/checkpoint")
+    args = parser.parse_args()
+
+    from app import migrations
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+
+    with database.SessionLocal() as db:
+        apply_active_model(db)
+        print("🔄 Atualizando embeddings...\n")
+        job = run_job(
+            db, args.model, tuple(CORPORA) if args.corpus == "all" else (args.corpus,),
+            args.batch_size, args.workers, args.commit_every,
+        )
+        if job.status == "active":
+            reconcile(db, job.model)
+            print(f"ℹ️ A API troca para os vetores do job {job.id} sozinha em até EMBEDDING_MODEL_CHECK_INTERVAL s "
+                  "(mesmo sem trocar de modelo), ou na hora via /admin/index/reload.")
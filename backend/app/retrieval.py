@@ -0,0 +1,199 @@
+import heapq
+import os
+from dataclasses import dataclass, field
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from app import lexical, metrics, models, vector_index
+
+load_dotenv()
+
+# 🔹 Busca híbrida: BM25 (FTS5) + vetores, fundidos por Reciprocal Rank Fusion
+HYBRID_ENABLED = os.getenv("HYBRID_ENABLED", "true").lower() in ("1", "true", "yes")
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+# acima deste tamanho de corpus, só os candidatos lexicais recebem score vetorial
+HYBRID_PREFILTER_MIN_CORPUS = int(os.getenv("HYBRID_PREFILTER_MIN_CORPUS", "50000"))
+HYBRID_PREFILTER_CANDIDATES = int(os.getenv("HYBRID_PREFILTER_CANDIDATES", "2000"))
+# o 1º resultado lexical (ex.: "GLI-11") ainda precisa de um mínimo de similaridade
+HYBRID_LEXICAL_MIN_SCORE = float(os.getenv("HYBRID_LEXICAL_MIN_SCORE", "0.3"))
+
+# 🔹 Limiar de similaridade por fonte e diversidade (MMR) do top-k
+QUESTION_MIN_SCORE = float(os.getenv("QUESTION_MIN_SCORE", "0.85"))
+CHUNK_MIN_SCORE = float(os.getenv("CHUNK_MIN_SCORE", "0.45"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1 = só relevância, 0 = só diversidade
+MMR_DUPLICATE_SCORE = float(os.getenv("MMR_DUPLICATE_SCORE", "0.98"))  # acima disso, trecho repetido é descartado
+
+INDEXES = {
+    "questions": lambda: vector_index.question_index,
+    "chunks": lambda: vector_index.chunk_index,
+}
+
+
+@dataclass
+class Hit:
+    id: int
+    score: float              # similaridade de cosseno com a pergunta
+    rrf: float = 0.0          # score fundido (ordena os resultados)
+    dense_rank: int = None    # posição na busca vetorial (0 = melhor)
+    lexical_rank: int = None  # posição na busca BM25 (0 = melhor)
+
+
+def hybrid_search(db: Session, corpus: str, question: str, query_vector, k: int = HYBRID_CANDIDATES):
+    """
+    Busca em "questions" ou "chunks" e devolve até k Hits ordenados por RRF.
+    Corpus pequeno: busca vetorial normal + score vetorial dos candidatos lexicais.
+    Corpus grande: a passada lexical (barata) filtra os candidatos e só eles
+    recebem score vetorial; sem candidatos lexicais, volta à busca vetorial.
+    """
+    index = INDEXES[corpus]()
+    if not HYBRID_ENABLED:
+        with metrics.stage("search.dense"):
+            dense = index.search(query_vector, k=k)
+        return [Hit(id, score, dense_rank=rank) for rank, (id, score) in enumerate(dense)]
+
+    prefilter = len(index) >= HYBRID_PREFILTER_MIN_CORPUS
+    with metrics.stage("search.lexical"):
+        lexical_ids = lexical.search(db, corpus, question, HYBRID_PREFILTER_CANDIDATES if prefilter else HYBRID_CANDIDATES)
+
+    with metrics.stage("search.dense"):
+        if prefilter and lexical_ids:
+            scores = index.score(query_vector, lexical_ids)
+            dense = heapq.nlargest(HYBRID_CANDIDATES, scores.items(), key=lambda item: item[1])
+            lexical_ids = lexical_ids[:HYBRID_CANDIDATES]
+        else:
+            dense = index.search(query_vector, k=max(k, HYBRID_CANDIDATES))
+            scores = dict(dense)
+            missing = [id for id in lexical_ids if id not in scores]
+            if missing:
+                scores.update(index.score(query_vector, missing))
+
+    hits = {}
+    for rank, (id, score) in enumerate(dense):
+        hits[id] = Hit(id, score, rrf=1.0 / (RRF_K + rank + 1), dense_rank=rank)
+    for rank, id in enumerate(lexical_ids):
+        if id not in scores:
+            continue  # ainda não está no índice vetorial
+        hit = hits.setdefault(id, Hit(id, scores[id]))
+        hit.rrf += 1.0 / (RRF_K + rank + 1)
+        hit.lexical_rank = rank
+
+    return heapq.nlargest(k, hits.values(), key=lambda hit: hit.rrf)
+
+
+MIN_SCORES = {"questions": lambda: QUESTION_MIN_SCORE, "chunks": lambda: CHUNK_MIN_SCORE}
+
+
+def relevant(db: Session, corpus: str, question: str, query_vector, min_score: float = None):
+    """
+    Hits do corpus acima do limiar da fonte. Nos PDFs, o 1º resultado BM25
+    (ex.: "GLI-11") entra com HYBRID_LEXICAL_MIN_SCORE, se este for menor.
+    """
+    threshold = MIN_SCORES[corpus]() if min_score is None else min_score
+    lexical_min = min(threshold, HYBRID_LEXICAL_MIN_SCORE) if corpus == "chunks" else threshold
+    return [
+        hit for hit in hybrid_search(db, corpus, question, query_vector)
+        if hit.score >= threshold or (hit.lexical_rank == 0 and hit.score >= lexical_min)
+    ]
+
+
+# -------------------------
+# Top-k nas duas fontes
+# -------------------------
+@dataclass
+class Result:
+    source: str                 # "question" ou "pdf"
+    id: int
+    score: float                # cosseno com a pergunta
+    text: str                   # pergunta cadastrada ou conteúdo do trecho
+    answer: str = None          # resposta cadastrada (source="question")
+    source_name: str = None     # nome do PDF
+    chunk_index: int = None     # posição do trecho no PDF
+    page_start: int = None
+    page_end: int = None
+    lexical: bool = False       # também casou na busca BM25
+    vector: np.ndarray = field(default=None, repr=False)
+
+    def as_dict(self, max_chars: int = None):
+        text = self.text if not max_chars or len(self.text) <= max_chars else self.text[:max_chars] + "..."
+        data = {"source": self.source, "id": self.id, "score": round(self.score, 4), "text": text, "lexical": self.lexical}
+        if self.source == "question":
+            data["answer"] = self.answer
+        else:
+            data.update(source_name=self.source_name, chunk_index=self.chunk_index,
+                        page_start=self.page_start, page_end=self.page_end)
+        return data
+
+
+def mmr(results, k: int, lambda_: float = MMR_LAMBDA):
+    """
+    Maximal Marginal Relevance: escolhe um a um o resultado com melhor
+    lambda * relevância - (1 - lambda) * semelhança com os já escolhidos.
+    Usa os vetores já no índice (sem nova busca); sem vetor, vale só a relevância.
+    Quase-duplicatas (similaridade >= MMR_DUPLICATE_SCORE) de um escolhido saem da disputa.
+    """
+    if len(results) <= 1 or lambda_ >= 1:
+        return heapq.nlargest(k, results, key=lambda r: r.score)
+    dim = max((r.vector.shape[0] for r in results if r.vector is not None), default=0)
+    matrix = np.zeros((len(results), dim), dtype=np.float32)
+    for row, result in enumerate(results):
+        if result.vector is not None and result.vector.shape[0] == dim:
+            matrix[row] = result.vector
+    relevance = np.array([r.score for r in results], dtype=np.float32)
+    redundancy = np.full(len(results), -np.inf, dtype=np.float32)
+    available = np.ones(len(results), dtype=bool)
+    chosen = []
+    for _ in range(min(k, len(results))):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        gains = np.where(available, lambda_ * relevance - (1 - lambda_) * penalty, -np.inf)
+        if not available.any():
+            break
+        best = int(np.argmax(gains))
+        chosen.append(results[best])
+        available[best] = False
+        similarity = matrix @ matrix[best]
+        if dim:
+            available &= similarity < MMR_DUPLICATE_SCORE
+        redundancy = np.maximum(redundancy, similarity)
+    return chosen
+
+
+def search(db: Session, question: str, query_vector, k: int = RETRIEVAL_TOP_K, sources=("questions", "chunks"),
+           diversity: bool = True, min_scores: dict = None):
+    """
+    Top-k nas perguntas cadastradas e nos trechos de PDF, com score, nome da
+    fonte e posição. Cada fonte usa seu próprio limiar; com `diversity`, o MMR
+    evita que o top-k seja só trechos quase iguais da mesma seção.
+    """
+    min_scores = min_scores or {}
+    results = []
+    for corpus in sources:
+        hits = relevant(db, corpus, question, query_vector, min_scores.get(corpus))
+        if not hits:
+            continue
+        ids, vectors = INDEXES[corpus]().vectors([hit.id for hit in hits]) if diversity else ([], [])
+        by_vector = dict(zip(ids, vectors))
+        with metrics.stage("search.rows"):
+            if corpus == "questions":
+                rows = db.query(models.Question).filter(models.Question.id.in_([hit.id for hit in hits])).all()
+            else:
+                rows = db.query(models.DocumentChunk).filter(models.DocumentChunk.id.in_([hit.id for hit in hits])).all()
+        by_id = {row.id: row for row in rows}
+        for hit in hits:
+            row = by_id.get(hit.id)
+            if row is None:
+                continue  # apagado depois da última carga do índice
+            if corpus == "questions":
+                result = Result("question", hit.id, hit.score, row.text, answer=row.answer)
+            else:
+                result = Result("pdf", hit.id, hit.score, row.content, source_name=row.source_name,
+                                chunk_index=row.chunk_index, page_start=row.page_start, page_end=row.page_end)
+            result.lexical = hit.lexical_rank is not None
+            result.vector = by_vector.get(hit.id)
+            results.append(result)
+
+    if diversity:
+        with metrics.stage("search.mmr"):
+            return mmr(results, k)
+    return heapq.nlargest(k, results, key=lambda r: r.score)
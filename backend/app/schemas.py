@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel
 
 # -------------------------
@@ -15,6 +16,21 @@ class Question(QuestionBase):
     class Config:
         orm_mode = True
 
+# -------------------------
+# Import em lote
+# -------------------------
+class ImportFailure(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    total: int
+    inserted: int
+    updated: int
+    skipped: int
+    failed: int
+    errors: list[ImportFailure]
+
 # -------------------------
 # Pendentes
 # -------------------------
@@ -26,5 +42,37 @@ class UnansweredCreate(UnansweredBase):
 
 class Unanswered(UnansweredBase):
     id: int
+    cluster_id: Optional[int] = None
+    class Config:
+        orm_mode = True
+
+class UnansweredCluster(BaseModel):
+    id: int
+    text: str
+    count: int
+    first_seen: Optional[float] = None
+    last_seen: Optional[float] = None
+    question_id: Optional[int] = None
+    samples: list[str]
+
+class ClusterAnswer(BaseModel):
+    answer: str
+    text: Optional[str] = None  # pergunta cadastrada; padrão: a representante do grupo
+
+# -------------------------
+# Fila de ingestão
+# -------------------------
+class IngestJob(BaseModel):
+    id: int
+    source_name: str
+    status: str
+    attempts: int = 0
+    page_count: Optional[int] = None
+    pages_done: int = 0
+    chunks_written: int = 0
+    error: Optional[str] = None
+    created_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
     class Config:
         orm_mode = True
@@ -0,0 +1,301 @@
+"""
+Agrupamento incremental das perguntas sem resposta.
+
+Cada pergunta que o /ask não soube responder é gravada com o embedding que
+a busca já calculou e entra no grupo (cluster) cujo centróide for o mais
+parecido, se passar de UNANSWERED_CLUSTER_THRESHOLD; senão, abre um grupo
+novo. Os centróides ficam num índice em memória, então cada pergunta custa
+uma busca e um UPDATE, sem reagrupar nada. Os leads respondem a pergunta
+representante de cada grupo; a partir daí, as próximas paráfrases que caem
+no grupo recebem essa resposta.
+
+Perguntas gravadas antes disso (sem embedding) são agrupadas por backfill():
+
+    cd backend
+    python -m app.unanswered
+"""
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app import crud, database, embedding_codec, models, schemas, utils, vector_index
+
+load_dotenv()
+
+# 🔹 Similaridade mínima (cosseno com o centróide) para entrar num grupo existente
+UNANSWERED_CLUSTER_THRESHOLD = float(os.getenv("UNANSWERED_CLUSTER_THRESHOLD", "0.8"))
+# quantas formulações de cada grupo aparecem na listagem do painel
+UNANSWERED_CLUSTER_SAMPLES = int(os.getenv("UNANSWERED_CLUSTER_SAMPLES", "5"))
+BACKFILL_BATCH = 64
+
+# Centróides dos grupos do modelo atual, por id do grupo
+_index = vector_index.VectorIndex("unanswered_clusters")
+_lock = threading.Lock()
+_model = None       # modelo dos centróides carregados
+_known_max_id = 0   # grupos criados por outros workers têm id maior
+
+
+def _centroid(cluster) -> np.ndarray:
+    return embedding_codec.decode_embedding(cluster.centroid)
+
+
+def load_clusters(db: Session):
+    """Carrega os centróides dos grupos do modelo de embeddings atual."""
+    global _model, _known_max_id
+    rows = db.query(models.UnansweredCluster.id, models.UnansweredCluster.centroid).filter(
+        models.UnansweredCluster.embedding_model == utils.EMBEDDING_MODEL
+    ).all()
+    _index.build(*embedding_codec.decode_many((r[0] for r in rows), (r[1] for r in rows)))
+    _model = utils.EMBEDDING_MODEL
+    _known_max_id = db.query(func.max(models.UnansweredCluster.id)).scalar() or 0
+
+
+def _catch_up(db: Session):
+    """Traz os grupos abertos por outros processos desde a última olhada."""
+    global _known_max_id
+    if _model != utils.EMBEDDING_MODEL:
+        load_clusters(db)  # o modelo mudou (refresh_embeddings): centróides antigos não servem
+        return
+    rows = db.query(models.UnansweredCluster.id, models.UnansweredCluster.centroid).filter(
+        models.UnansweredCluster.id > _known_max_id,
+        models.UnansweredCluster.embedding_model == _model,
+    ).all()
+    if rows:
+        _index.upsert_many(*embedding_codec.decode_many((r[0] for r in rows), (r[1] for r in rows)))
+    _known_max_id = max([_known_max_id] + [r[0] for r in rows])
+
+
+def _nearest(db: Session, vector):
+    """(grupo, similaridade) do centróide mais parecido acima do limiar, ou (None, melhor similaridade)."""
+    hits = _index.search(vector, 1)
+    if not hits:
+        return None, 0.0
+    cluster_id, score = hits[0]
+    if score < UNANSWERED_CLUSTER_THRESHOLD:
+        return None, score
+    cluster = db.get(models.UnansweredCluster, cluster_id)
+    if cluster is None:
+        _index.remove(cluster_id)  # apagado por outro processo
+    return cluster, score
+
+
+def _answer_of(db: Session, cluster):
+    """Pergunta cadastrada que responde o grupo (None se ainda não respondido ou se ela foi apagada)."""
+    if cluster is None or cluster.question_id is None:
+        return None
+    question = crud.get_question(db, cluster.question_id)
+    if question is None:
+        cluster.question_id = None  # a resposta foi apagada: o grupo volta para a fila
+    return question
+
+
+def _join(db: Session, cluster, row, vector):
+    """Coloca `row` no grupo (ou abre um), atualizando contagem, centróide e representante."""
+    now = time.time()
+    if cluster is None:
+        cluster = models.UnansweredCluster(
+            text=row.text, representative_id=row.id, count=1,
+            centroid=utils.serialize_embedding(vector), embedding_model=utils.EMBEDDING_MODEL,
+            first_seen=row.created_at or now, last_seen=now,
+        )
+        db.add(cluster)
+        db.flush()
+        row.cluster_id = cluster.id
+        return cluster, vector
+
+    centroid = _centroid(cluster) + vector
+    direction = centroid / (np.linalg.norm(centroid) or 1.0)
+    # a representante é a pergunta mais próxima do centróide
+    representative = db.get(models.UnansweredQuestion, cluster.representative_id) if cluster.representative_id else None
+    current = utils.deserialize_embedding(representative.embedding) if representative is not None else None
+    if current is None or len(current) != len(direction) or \
+            float(vector @ direction) > float(vector_index.normalize(current)[0] @ direction):
+        cluster.representative_id = row.id
+        cluster.text = row.text
+
+    cluster.count = models.UnansweredCluster.count + 1  # UPDATE atômico (vários workers)
+    cluster.centroid = utils.serialize_embedding(centroid)
+    cluster.last_seen = now
+    row.cluster_id = cluster.id
+    return cluster, centroid
+
+
+def record(db: Session, text: str, embedding):
+    """
+    Registra uma pergunta sem resposta no grupo certo. Se o grupo já foi
+    respondido pelos leads, nada fica pendente: retorna (pergunta, similaridade)
+    para o /ask usar a resposta. Senão, retorna (None, similaridade).
+    """
+    vector = vector_index.normalize(embedding)[0]
+    with _lock:
+        _catch_up(db)
+        cluster, score = _nearest(db, vector)
+        question = _answer_of(db, cluster)
+        if question is not None:
+            cluster.count = models.UnansweredCluster.count + 1
+            cluster.last_seen = time.time()
+            db.commit()
+            return question, score
+
+        row = models.UnansweredQuestion(
+            text=text,
+            embedding=utils.serialize_embedding(embedding),
+            embedding_model=utils.EMBEDDING_MODEL,
+            created_at=time.time(),
+        )
+        db.add(row)
+        db.flush()
+        cluster, centroid = _join(db, cluster, row, vector)
+        cluster_id = cluster.id
+        db.commit()
+        _index.upsert(cluster_id, centroid)
+    return None, score
+
+
+def backfill(db: Session, batch_size: int = BACKFILL_BATCH) -> int:
+    """Agrupa as perguntas pendentes que ainda não têm grupo (gravadas antes do agrupamento)."""
+    grouped = 0
+    last_id = 0
+    while True:
+        rows = db.query(models.UnansweredQuestion).filter(
+            models.UnansweredQuestion.cluster_id.is_(None), models.UnansweredQuestion.id > last_id
+        ).order_by(models.UnansweredQuestion.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        vectors = utils.get_embeddings([row.text for row in rows])
+        with _lock:
+            _catch_up(db)
+            for row, embedding in zip(rows, vectors):
+                if not embedding:
+                    continue
+                vector = vector_index.normalize(embedding)[0]
+                cluster, _ = _nearest(db, vector)
+                if _answer_of(db, cluster) is not None:
+                    # já respondida pelo grupo: sai da fila
+                    cluster.count = models.UnansweredCluster.count + 1
+                    db.delete(row)
+                    db.commit()
+                    continue
+                row.embedding = utils.serialize_embedding(embedding)
+                row.embedding_model = utils.EMBEDDING_MODEL
+                cluster, centroid = _join(db, cluster, row, vector)
+                cluster_id = cluster.id
+                db.commit()
+                _index.upsert(cluster_id, centroid)
+                grouped += 1
+    if grouped:
+        print(f"🧩 {grouped} perguntas pendentes agrupadas.")
+    return grouped
+
+
+# -------------------------
+# Painel dos leads
+# -------------------------
+def list_clusters(db: Session, status: str = "open", skip: int = 0, limit: int = 10):
+    """Grupos mais perguntados primeiro, com algumas formulações de cada um."""
+    query = db.query(models.UnansweredCluster)
+    if status == "open":
+        query = query.filter(models.UnansweredCluster.question_id.is_(None))
+    elif status == "answered":
+        query = query.filter(models.UnansweredCluster.question_id.isnot(None))
+    clusters = query.order_by(
+        models.UnansweredCluster.count.desc(), models.UnansweredCluster.last_seen.desc()
+    ).offset(skip).limit(limit).all()
+
+    samples = {cluster.id: [] for cluster in clusters}
+    members = db.query(models.UnansweredQuestion.cluster_id, models.UnansweredQuestion.text).filter(
+        models.UnansweredQuestion.cluster_id.in_(list(samples))
+    ).order_by(models.UnansweredQuestion.id.desc())
+    for cluster_id, text in members:
+        texts = samples[cluster_id]
+        if len(texts) < UNANSWERED_CLUSTER_SAMPLES and text not in texts:
+            texts.append(text)
+    return [
+        schemas.UnansweredCluster(
+            id=cluster.id, text=cluster.text, count=cluster.count or 0,
+            first_seen=cluster.first_seen, last_seen=cluster.last_seen,
+            question_id=cluster.question_id, samples=samples[cluster.id],
+        )
+        for cluster in clusters
+    ]
+
+
+def answer_cluster(db: Session, cluster_id: int, answer: schemas.ClusterAnswer, embedding=None):
+    """
+    Cadastra a resposta do grupo como pergunta respondida (texto da
+    representante, ou o informado) e tira as perguntas do grupo da fila.
+    """
+    cluster = db.get(models.UnansweredCluster, cluster_id)
+    if cluster is None:
+        return None
+    question = schemas.QuestionCreate(text=answer.text or cluster.text, answer=answer.answer)
+    existing = crud.get_question_by_text(db, question.text)
+    if existing is not None:
+        db_question = crud.update_question(db, existing.id, question, embedding)
+    else:
+        db_question = crud.create_question(db, question, embedding)
+
+    cluster.question_id = db_question.id
+    db.query(models.UnansweredQuestion).filter(
+        models.UnansweredQuestion.cluster_id == cluster_id
+    ).delete(synchronize_session=False)
+    cluster.representative_id = None
+    db.commit()
+    return db_question
+
+
+def delete_cluster(db: Session, cluster_id: int):
+    """Descarta o grupo inteiro (todas as formulações pendentes)."""
+    cluster = db.get(models.UnansweredCluster, cluster_id)
+    if cluster is None:
+        return None
+    db.query(models.UnansweredQuestion).filter(
+        models.UnansweredQuestion.cluster_id == cluster_id
+    ).delete(synchronize_session=False)
+    db.delete(cluster)
+    db.commit()
+    with _lock:
+        _index.remove(cluster_id)
+    return cluster
+
+
+def delete_member(db: Session, unanswered_id: int):
+    """Apaga uma pergunta pendente; o grupo perde uma ocorrência (e some se ficar vazio)."""
+    row = db.get(models.UnansweredQuestion, unanswered_id)
+    if row is None:
+        return None
+    row_id, cluster_id = row.id, row.cluster_id
+    crud.delete_unanswered(db, unanswered_id)
+    cluster = db.get(models.UnansweredCluster, cluster_id) if cluster_id else None
+    if cluster is None:
+        return row
+    remaining = db.query(models.UnansweredQuestion).filter(
+        models.UnansweredQuestion.cluster_id == cluster.id
+    ).order_by(models.UnansweredQuestion.id.desc()).first()
+    if remaining is None and cluster.question_id is None:
+        db.delete(cluster)
+        db.commit()
+        with _lock:
+            _index.remove(cluster_id)
+        return row
+    cluster.count = models.UnansweredCluster.count - 1
+    if cluster.representative_id == row_id:
+        cluster.representative_id = remaining.id if remaining else None
+        cluster.text = remaining.text if remaining else cluster.text
+    db.commit()
+    return row
+
+
+if __name__ == "__main__":
+    models.Base.metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    try:
+        load_clusters(session)
+        total = backfill(session)
+        print(f"✅ Backfill concluído: {total} perguntas agrupadas.")
+    finally:
+        session.close()
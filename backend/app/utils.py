@@ -1,15 +1,32 @@
-import requests
+import asyncio
 import os
 from dotenv import load_dotenv
-import json
 import numpy as np
 import re
+import time
 from sqlalchemy.orm import Session
 import app.models as models
+from app import embedding_codec, metrics
+from app.embedding_cache import embedding_cache
+from app.ollama_client import OllamaError, dispatcher, ollama, priority, with_keep_alive
 
 # 🔹 Carregar variáveis do .env
 load_dotenv()
 LLAMA_URL = os.getenv("LLAMA_URL", "http://localhost:11434")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+GENERATION_MODEL = os.getenv("GENERATION_MODEL", "llama3")
+
+# 🔹 Sessão HTTP reaproveitada (keep-alive) para os scripts síncronos; a API
+# usa o cliente assíncrono, então o `requests` só é importado quando preciso
+_http = None
+
+
+def http():
+    global _http
+    if _http is None:
+        import requests
+        _http = requests.Session()
+    return _http
 
 # 🔧 Normaliza o texto antes de gerar o embedding
 def normalize_text(text: str):
@@ -22,27 +39,130 @@ def normalize_text(text: str):
     return text.strip()
 
 
+def _request_embedding(text: str, model: str = None):
+    response = http().post(
+        f"{LLAMA_URL}/api/embeddings",
+        json=with_keep_alive({"model": model or EMBEDDING_MODEL, "prompt": text}),
+        timeout=30
+    )
+    response.raise_for_status()
+    data = response.json()
+    return data.get("embedding", [])
+
+
 # ✅ Gera embedding REAL com Ollama local (modelo nomic-embed-text)
 def get_embedding(text: str):
     try:
-        text = normalize_text(text)
-        response = requests.post(
-            f"{LLAMA_URL}/api/embeddings",
-            json={"model": "nomic-embed-text", "prompt": text},
-            timeout=30
+        with metrics.stage("embed"):
+            text = normalize_text(text)
+
+            # 🔹 Perguntas repetidas não precisam ir ao Ollama de novo
+            cached = embedding_cache.get(EMBEDDING_MODEL, text)
+            if cached is not None:
+                return cached
+
+            with metrics.stage("embed.ollama"), priority.interactive_call():
+                embedding = _request_embedding(text)
+            embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+            return embedding
+    except Exception as e:
+        print("⚠️ Falha ao gerar embedding:", e)
+        return None
+
+
+# 🔹 Servidores Ollama antigos não têm /api/embed; desliga no primeiro 404
+_batch_endpoint = True
+
+
+def _request_embeddings(texts: list[str], model: str = None):
+    # lotes são indexação: cedem a vez ao /ask e desaceleram quando o Ollama satura
+    with priority.bulk_call():
+        return _post_embeddings(texts, model)
+
+
+def _post_embeddings(texts: list[str], model: str = None):
+    global _batch_endpoint
+    if _batch_endpoint:
+        response = http().post(
+            f"{LLAMA_URL}/api/embed",
+            json=with_keep_alive({"model": model or EMBEDDING_MODEL, "input": texts}),
+            timeout=30 + 10 * len(texts)
         )
-        response.raise_for_status()
-        data = response.json()
-        return data.get("embedding", [])
+        if response.status_code != 404:
+            response.raise_for_status()
+            return response.json().get("embeddings", [])
+        print("ℹ️ Ollama sem /api/embed; usando /api/embeddings um a um.")
+        _batch_endpoint = False
+    return [_request_embedding(t, model) for t in texts]
+
+
+# ✅ Gera embeddings de vários textos numa única chamada ao Ollama (para indexação)
+def get_embeddings(texts: list[str], model: str = None):
+    """
+    Retorna uma lista alinhada com `texts`; posições que falharem ficam None.
+    Textos já em cache não são reenviados. `model` (padrão: o modelo ativo)
+    permite gerar vetores de outro modelo, como no refresh_embeddings.
+    """
+    model = model or EMBEDDING_MODEL
+    normalized = [normalize_text(t) for t in texts]
+    results = [embedding_cache.get(model, t) for t in normalized]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if not missing:
+        return results
+
+    try:
+        with metrics.stage("embed.ollama_batch"):
+            vectors = _request_embeddings([normalized[i] for i in missing], model)
+    except Exception as e:
+        print("⚠️ Falha ao gerar embeddings em lote:", e)
+        vectors = []
+
+    for i, vector in zip(missing, vectors):
+        if vector:
+            results[i] = vector
+            embedding_cache.put(model, normalized[i], vector)
+    return results
+
+
+# ✅ Versão assíncrona (usada pelas rotas da API), com o mesmo cache
+async def get_embedding_async(text: str):
+    try:
+        with metrics.stage("embed"):
+            text = normalize_text(text)
+
+            # LRU direto no event loop; o arquivo SQLite numa thread (E/S bloqueante)
+            cached = embedding_cache.get_memory(EMBEDDING_MODEL, text)
+            if cached is None:
+                cached = (await asyncio.to_thread(embedding_cache.get_disk, EMBEDDING_MODEL, text)
+                          if embedding_cache.has_disk else embedding_cache.get_disk(EMBEDDING_MODEL, text))
+            if cached is not None:
+                return cached
+
+            # chamadas concorrentes viram micro-lotes; textos iguais em andamento, uma chamada só
+            with metrics.stage("embed.ollama"), priority.interactive_call():
+                embedding = await dispatcher.embed(text, EMBEDDING_MODEL)
+            embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+            return embedding
     except Exception as e:
         print("⚠️ Falha ao gerar embedding:", e)
         return None
 
 
+# 🔥 Aquecimento na subida da API: a primeira chamada a um modelo espera o Ollama carregá-lo
+async def warm_up_embedding_model():
+    vectors = await ollama.embed_batch(["warmup"], EMBEDDING_MODEL)
+    if not vectors or not vectors[0]:
+        raise OllamaError(f"'{EMBEDDING_MODEL}' não devolveu embedding")
+
+
+async def warm_up_generation_model():
+    await ollama.load(GENERATION_MODEL)
+
+
 # ✅ Calcula similaridade de cosseno
 def cosine_similarity(vec1, vec2):
-    v1 = np.array(vec1, dtype=float)
-    v2 = np.array(vec2, dtype=float)
+    v1 = np.asarray(vec1, dtype=np.float32)
+    v2 = np.asarray(vec2, dtype=np.float32)
 
     if v1.size == 0 or v2.size == 0:
         return -1.0
@@ -58,59 +178,82 @@ def cosine_similarity(vec1, vec2):
     return float(np.dot(v1, v2) / denom)
 
 
-# ✅ Busca a pergunta mais similar no banco
+# ✅ Busca a pergunta mais similar no banco (via índice vetorial em memória)
 def find_most_similar(user_embedding, db: Session):
-    questions = db.query(models.Question).all()
-    if not questions:
-        return None, 0.0
+    from app import vector_index
 
-    best_question = None
-    best_score = -1.0
+    hits = vector_index.question_index.search(user_embedding, k=1)
+    if not hits:
+        return None, 0.0
 
-    for q in questions:
-        embedding_record = db.query(models.QuestionEmbedding).filter_by(question_id=q.id).first()
-        if not embedding_record or not embedding_record.embedding:
-            continue
+    question_id, score = hits[0]
+    best_question = db.query(models.Question).filter(models.Question.id == question_id).first()
+    if not best_question:
+        return None, 0.0
+    return best_question, score
 
-        try:
-            emb = json.loads(embedding_record.embedding)
-            score = cosine_similarity(user_embedding, emb)
-            if score > best_score:
-                best_question = q
-                best_score = score
-        except Exception as e:
-            print(f"⚠️ Erro comparando embeddings (ID {q.id}): {e}")
-            continue
 
-    return best_question, best_score
+# ✅ Consulta ao modelo local (Llama3 via Ollama)
+def build_prompt(prompt: str, context: list[str]):
+    context_text = "\n".join(context)
+    return f"Context:\n{context_text}\n\nQuestion:\n{prompt}\nAnswer concisely."
 
 
-# ✅ Consulta ao modelo local (Llama3 via Ollama)
 def query_local_ai(prompt: str, context: list[str] = []):
     try:
-        context_text = "\n".join(context)
-        full_prompt = f"Context:\n{context_text}\n\nQuestion:\n{prompt}\nAnswer concisely."
-
-        response = requests.post(
-            f"{LLAMA_URL}/api/generate",
-            json={"model": "llama3", "prompt": full_prompt, "stream": False},
-            timeout=60
-        )
-        response.raise_for_status()
-        data = response.json()
+        with metrics.stage("generate"):
+            response = http().post(
+                f"{LLAMA_URL}/api/generate",
+                json=with_keep_alive({"model": GENERATION_MODEL, "prompt": build_prompt(prompt, context), "stream": False}),
+                timeout=60
+            )
+            response.raise_for_status()
+            data = response.json()
         return data.get("response", "").strip()
     except Exception as e:
         print("⚠️ Erro ao consultar modelo local:", e)
         return "⚠️ Erro interno ao consultar o modelo local."
 
+
+async def query_local_ai_async(prompt: str, context: list[str] = []):
+    try:
+        with metrics.stage("generate"):
+            return await ollama.generate(build_prompt(prompt, context), GENERATION_MODEL)
+    except Exception as e:
+        print("⚠️ Erro ao consultar modelo local:", e)
+        return "⚠️ Erro interno ao consultar o modelo local."
+
+# ✅ Mesma consulta, mas devolvendo os tokens conforme o modelo gera (usada pelo /ask/stream)
+async def query_local_ai_stream(prompt: str, context: list[str] = []):
+    # primeiro token (o que o usuário sente) e geração inteira
+    started = time.perf_counter()
+    first = True
+    with metrics.stage("generate"):
+        async for token in ollama.generate_stream(build_prompt(prompt, context), GENERATION_MODEL):
+            if first:
+                metrics.record_stage("generate.first_token", time.perf_counter() - started)
+                first = False
+            yield token
+
 # 🆕 ✅ Serializa embedding para armazenar no banco (necessário para o painel Admin)
-def serialize_embedding(embedding):
+def serialize_embedding(embedding, model: str = None):
     """
-    Converte o embedding (lista de floats) em string JSON
-    para armazenamento seguro no banco de dados.
+    Converte o embedding (lista de floats) no blob binário compacto
+    (float32/float16 + dimensão + modelo) armazenado no banco.
     """
+    if embedding is None or len(embedding) == 0:
+        return None
     try:
-        return json.dumps(embedding)
+        return embedding_codec.encode_embedding(embedding, model=model or EMBEDDING_MODEL)
     except Exception as e:
         print(f"⚠️ Erro ao serializar embedding: {e}")
-        return "[]"
\ No newline at end of file
+        return None
+
+
+# ✅ Lê o embedding salvo no banco (binário ou JSON legado) como ndarray
+def deserialize_embedding(value):
+    try:
+        return embedding_codec.decode_embedding(value)
+    except Exception as e:
+        print(f"⚠️ Erro ao ler embedding: {e}")
+        return None
@@ -0,0 +1,1266 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from . import database, models, embedding_codec, metrics
+from .answer_cache import answer_cache
+
+try:
+    import fcntl  # lock entre processos do índice mmap (Linux/macOS)
+except ImportError:
+    fcntl = None
+
+load_dotenv()
+
+# 🔹 Backend de busca: "numpy" (exato), "numpy-int8" (comprimido + re-ranking exato),
+# "mmap" (exato, compartilhado entre workers), "faiss-flat", "faiss-ivf",
+# "faiss-hnsw" ou "pgvector" (busca no próprio PostgreSQL; padrão quando
+# DATABASE_URL é PostgreSQL)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND") or ("pgvector" if database.DIALECT == "postgresql" else "numpy")
+# Índices FAISS persistidos ao lado do data/agent.db
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "./data/index")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_IVF_MIN_TRAIN = int(os.getenv("FAISS_IVF_MIN_TRAIN", "2000"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+# intervalo mínimo entre gravações do índice em disco (segundos)
+FAISS_SAVE_INTERVAL = float(os.getenv("FAISS_SAVE_INTERVAL", "30"))
+# 🔹 Índice HNSW do pgvector
+PGVECTOR_HNSW_M = int(os.getenv("PGVECTOR_HNSW_M", "16"))
+PGVECTOR_EF_CONSTRUCTION = int(os.getenv("PGVECTOR_EF_CONSTRUCTION", "64"))
+PGVECTOR_EF_SEARCH = int(os.getenv("PGVECTOR_EF_SEARCH", "100"))
+PGVECTOR_COUNT_TTL = 5.0  # segundos em que o count(*) do corpus é reaproveitado
+# 🔹 Índice comprimido (numpy-int8): dimensão da 1ª passada (0 = sem redução),
+# método ("pca" ou "truncate" para modelos Matryoshka), candidatos re-ranqueados
+# com os vetores float32 e de onde eles vêm ("db" ou "memory")
+VECTOR_REDUCE_DIM = int(os.getenv("VECTOR_REDUCE_DIM", "256"))
+VECTOR_REDUCE_METHOD = os.getenv("VECTOR_REDUCE_METHOD", "pca")
+VECTOR_RERANK_CANDIDATES = int(os.getenv("VECTOR_RERANK_CANDIDATES", "100"))
+VECTOR_RERANK_SOURCE = os.getenv("VECTOR_RERANK_SOURCE", "db")
+PCA_SAMPLE = 20000  # vetores usados para estimar os eixos do PCA
+QUANTIZED_SCAN_BLOCK = 2048  # linhas convertidas por vez na 1ª passada (cabe no cache)
+# 🔹 Índice mmap: gerações publicadas em VECTOR_INDEX_DIR
+MMAP_PUBLISH_INTERVAL = float(os.getenv("MMAP_PUBLISH_INTERVAL", "1"))  # espera para juntar escritas (s)
+MMAP_CHECK_INTERVAL = float(os.getenv("MMAP_CHECK_INTERVAL", "0.5"))  # frequência de checagem de geração nova (s)
+MMAP_KEEP_GENERATIONS = int(os.getenv("MMAP_KEEP_GENERATIONS", "2"))  # gerações antigas mantidas em disco
+MMAP_COPY_ROWS = 65536  # linhas copiadas por bloco ao gravar uma geração
+
+
+def normalize(vectors) -> np.ndarray:
+    """Matriz float32 com linhas de norma 1 (linhas zeradas continuam zeradas)."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(ids, scores, k: int):
+    """[(id, score)] das k maiores pontuações, em ordem decrescente (seleção parcial + sort só do top)."""
+    k = min(k, len(ids))
+    if k <= 0:
+        return []
+    if k < len(ids):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(ids))
+    top = top[np.argsort(-scores[top])]
+    return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def filter_valid(name, ids, vectors, dim):
+    """Filtra vetores vazios ou com dimensão diferente do índice."""
+    keep_ids, keep_vectors = [], []
+    for item_id, vector in zip(ids, vectors):
+        if vector is None or len(vector) == 0:
+            continue
+        if dim and len(vector) != dim:
+            print(f"⚠️ [{name}] embedding {item_id} com dimensão {len(vector)} (esperado {dim}), ignorado.")
+            continue
+        dim = dim or len(vector)
+        keep_ids.append(int(item_id))
+        keep_vectors.append(vector)
+    return keep_ids, keep_vectors
+
+
+# Colunas (id, embedding) de cada corpus, para os índices que leem vetores do banco
+CORPUS_COLUMNS = {
+    "questions": lambda: (models.QuestionEmbedding.question_id, models.QuestionEmbedding.embedding),
+    "chunks": lambda: (models.DocumentChunk.id, models.DocumentChunk.embedding),
+}
+
+
+# -------------------------
+# Índice vetorial em memória (busca exata)
+# -------------------------
+class VectorIndex:
+    """
+    Mantém os embeddings de um corpus numa matriz float32 já normalizada,
+    para que a busca seja um único produto matriz-vetor + seleção top-k.
+    As escritas trocam a matriz inteira (copy-on-write), então as buscas
+    nunca precisam de lock.
+    """
+
+    backend = "numpy"
+    # sempre recarregado por inteiro do banco (ver _load)
+    loaded = False
+    model = None  # modelo dos vetores carregados
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        # (ids, matriz) trocados juntos numa única atribuição
+        self._state = (np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+        self._positions = (None, {})  # (array de ids, {id: linha}), refeito quando os ids mudam
+
+    def __len__(self):
+        return len(self._state[0])
+
+    @property
+    def dim(self):
+        ids, matrix = self._state
+        return matrix.shape[1] if len(ids) else 0
+
+    def _position_map(self, ids):
+        cached_ids, positions = self._positions
+        if cached_ids is not ids:
+            positions = {item_id: row for row, item_id in enumerate(ids.tolist())}
+            self._positions = (ids, positions)
+        return positions
+
+    def ids(self) -> set:
+        return set(self._state[0].tolist())
+
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pelos vetores."""
+        return self._state[1].nbytes
+
+    def build(self, ids, vectors):
+        """Substitui todo o conteúdo do índice (aceita uma matriz já decodificada)."""
+        if not (isinstance(vectors, np.ndarray) and vectors.ndim == 2):
+            ids, vectors = filter_valid(self.name, ids, vectors, 0)
+        with self._lock:
+            if not len(ids):
+                self._state = (np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+                return
+            self._state = (np.array(ids, dtype=np.int64), normalize(vectors))
+
+    def upsert(self, item_id: int, vector):
+        self.upsert_many([item_id], [vector])
+
+    def upsert_many(self, ids, vectors):
+        """Insere ou substitui vetores pelo id (uma única cópia da matriz por chamada)."""
+        with self._lock:
+            ids, vectors = filter_valid(self.name, ids, vectors, self.dim)
+            if not ids:
+                return
+            new_ids = np.array(ids, dtype=np.int64)
+            new_rows = normalize(vectors)
+            old_ids, old_matrix = self._state
+
+            keep = ~np.isin(old_ids, new_ids)
+            if len(old_ids):
+                matrix = np.vstack([old_matrix[keep], new_rows])
+                all_ids = np.concatenate([old_ids[keep], new_ids])
+            else:
+                matrix, all_ids = new_rows, new_ids
+
+            # último valor vence se o mesmo id vier repetido
+            _, last = np.unique(all_ids[::-1], return_index=True)
+            order = np.sort(len(all_ids) - 1 - last)
+            self._state = (all_ids[order], np.ascontiguousarray(matrix[order]))
+
+    def remove(self, item_id: int):
+        self.remove_many([item_id])
+
+    def remove_many(self, ids):
+        with self._lock:
+            old_ids, old_matrix = self._state
+            if not len(old_ids):
+                return
+            keep = ~np.isin(old_ids, np.array(list(ids), dtype=np.int64))
+            self._state = (old_ids[keep], np.ascontiguousarray(old_matrix[keep]))
+
+    def search(self, query, k: int = 1):
+        """Retorna [(id, score)] dos k vetores mais similares (cosseno), em ordem decrescente."""
+        ids, matrix = self._state
+        if not len(ids) or query is None or len(query) == 0:
+            return []
+
+        q = normalize(query)[0]
+        if q.shape[0] != matrix.shape[1]:
+            print(f"⚠️ [{self.name}] consulta com dimensão {q.shape[0]} (índice usa {matrix.shape[1]}).")
+            return []
+
+        return top_k(ids, matrix @ q, k)
+
+    def vectors(self, candidate_ids):
+        """Retorna (ids encontrados, matriz normalizada com os vetores deles)."""
+        ids, matrix = self._state
+        positions = self._position_map(ids)
+        found = [(i, positions[i]) for i in candidate_ids if i in positions]
+        if not found:
+            return [], np.empty((0, matrix.shape[1]), dtype=np.float32)
+        return [item_id for item_id, _ in found], matrix[[row for _, row in found]]
+
+    def score(self, query, candidate_ids):
+        """Cosseno da consulta com ids específicos (sem varrer o corpus inteiro)."""
+        if query is None or len(query) == 0:
+            return {}
+        found, vectors = self.vectors(candidate_ids)
+        q = normalize(query)[0]
+        if not found or q.shape[0] != vectors.shape[1]:
+            return {}
+        return dict(zip(found, (vectors @ q).tolist()))
+
+    # A busca exata é reconstruída do banco a cada subida; nada a persistir.
+    def load(self) -> bool:
+        return False
+
+    def save(self, force: bool = False):
+        pass
+
+
+# -------------------------
+# Índice comprimido (redução de dimensão + int8) com re-ranking exato
+# -------------------------
+def fit_reducer(matrix, dim: int, method: str = "pca"):
+    """
+    Redução de dimensão para a 1ª passada: ("truncate", d) corta os vetores
+    (modelos Matryoshka, como o nomic-embed-text v1.5) e ("pca", P) projeta
+    nos d eixos principais do corpus. Sem redução (None) se d >= dimensão,
+    ou, no PCA, se ainda houver poucos vetores para estimar os eixos.
+    """
+    if not dim or dim >= matrix.shape[1]:
+        return None
+    if method == "truncate":
+        return ("truncate", dim)
+    if len(matrix) < 2 * dim:
+        return None
+    rng = np.random.default_rng(0)
+    sample = matrix if len(matrix) <= PCA_SAMPLE else matrix[rng.choice(len(matrix), PCA_SAMPLE, replace=False)]
+    # sem centralizar: a projeção preserva o produto interno, que é o que a busca usa
+    _, _, vt = np.linalg.svd(np.asarray(sample, dtype=np.float32), full_matrices=False)
+    return ("pca", np.ascontiguousarray(vt[:dim], dtype=np.float32))
+
+
+def reduce_vectors(reducer, matrix) -> np.ndarray:
+    if reducer is None:
+        return matrix
+    kind, value = reducer
+    if kind == "truncate":
+        return normalize(matrix[:, :value])
+    return matrix @ value.T
+
+
+def quantize(matrix):
+    """int8 simétrico por linha: vetor ≈ códigos * escala."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedVectorIndex(VectorIndex):
+    """
+    Guarda só os vetores reduzidos (PCA ou truncamento) e quantizados em int8:
+    768 floats de 4 bytes viram, por padrão, 256 bytes por vetor. A busca
+    varre os códigos int8 em blocos (1ª passada aproximada) e re-ranqueia os
+    VECTOR_RERANK_CANDIDATES melhores com os vetores float32 completos, lidos
+    do banco (ou mantidos em memória, com VECTOR_RERANK_SOURCE=memory ou
+    para corpora que não estão no banco).
+    """
+
+    backend = "numpy-int8"
+
+    def __init__(self, name: str, reduce_dim: int = None, method: str = None, rerank: int = None,
+                 rerank_source: str = None):
+        super().__init__(name)
+        self.reduce_dim = VECTOR_REDUCE_DIM if reduce_dim is None else reduce_dim
+        self.method = method or VECTOR_REDUCE_METHOD
+        self.rerank = VECTOR_RERANK_CANDIDATES if rerank is None else rerank
+        source = rerank_source or VECTOR_RERANK_SOURCE
+        self._columns = CORPUS_COLUMNS[name]() if source == "db" and name in CORPUS_COLUMNS else None
+        self._reducer = None
+        self._dim = 0
+        # (ids, códigos int8, escalas, float32 completos ou None) trocados juntos
+        self._state = self._empty()
+
+    def _empty(self):
+        return (np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.int8),
+                np.empty(0, dtype=np.float32), None)
+
+    @property
+    def dim(self):
+        return self._dim if len(self._state[0]) else 0
+
+    @property
+    def nbytes(self) -> int:
+        """Memória da 1ª passada (códigos + escalas); os float32 mantidos em memória não entram."""
+        _, codes, scales, _ = self._state
+        return codes.nbytes + scales.nbytes
+
+    def _encode(self, matrix):
+        codes, scales = quantize(reduce_vectors(self._reducer, matrix))
+        return codes, scales, (matrix if self._columns is None else None)
+
+    def build(self, ids, vectors):
+        if not (isinstance(vectors, np.ndarray) and vectors.ndim == 2):
+            ids, vectors = filter_valid(self.name, ids, vectors, 0)
+        with self._lock:
+            if not len(ids):
+                self._state = self._empty()
+                return
+            matrix = normalize(vectors)
+            self._dim = matrix.shape[1]
+            self._reducer = fit_reducer(matrix, self.reduce_dim, self.method)
+            if self._waiting_for_pca():
+                print(f"ℹ️ [{self.name}] {len(ids)} vetores são poucos para o PCA em {self.reduce_dim} dimensões; "
+                      f"só quantizando até haver {2 * self.reduce_dim}.")
+            self._state = (np.array(ids, dtype=np.int64), *self._encode(matrix))
+
+    def _waiting_for_pca(self) -> bool:
+        return self._reducer is None and self.method == "pca" and 0 < self.reduce_dim < self._dim
+
+    def _refit(self):
+        """
+        Ajusta o PCA quando o índice, montado com poucos vetores, cresce o
+        bastante pelos upserts. Sem redução, os códigos são os próprios vetores
+        quantizados: sem os float32 em memória, o PCA usa os dequantizados.
+        """
+        ids, codes, scales, full = self._state
+        matrix = full if full is not None else normalize(codes.astype(np.float32) * scales[:, None])
+        reducer = fit_reducer(matrix, self.reduce_dim, self.method)
+        if reducer is None:
+            return
+        self._reducer = reducer
+        codes, scales = quantize(reduce_vectors(reducer, matrix))
+        self._state = (ids, codes, scales, full)
+        print(f"📐 [{self.name}] PCA ajustado com {len(ids)} vetores: {self._dim} → {self.reduce_dim} dimensões.")
+
+    def upsert_many(self, ids, vectors):
+        with self._lock:
+            ids, vectors = filter_valid(self.name, ids, vectors, self.dim)
+            if not ids:
+                return
+            matrix = normalize(vectors)
+            if not len(self._state[0]):
+                self._dim = matrix.shape[1]
+                if self._reducer is None and self.method == "truncate":
+                    self._reducer = fit_reducer(matrix, self.reduce_dim, self.method)
+            new_ids = np.array(ids, dtype=np.int64)
+            codes, scales, full = self._encode(matrix)
+            old_ids, old_codes, old_scales, old_full = self._state
+
+            keep = ~np.isin(old_ids, new_ids)
+            if len(old_ids):
+                all_ids = np.concatenate([old_ids[keep], new_ids])
+                codes = np.vstack([old_codes[keep], codes])
+                scales = np.concatenate([old_scales[keep], scales])
+                if full is not None:
+                    full = np.vstack([old_full[keep], full])
+            else:
+                all_ids = new_ids
+
+            # último valor vence se o mesmo id vier repetido
+            _, last = np.unique(all_ids[::-1], return_index=True)
+            order = np.sort(len(all_ids) - 1 - last)
+            self._state = (all_ids[order], np.ascontiguousarray(codes[order]), scales[order],
+                           np.ascontiguousarray(full[order]) if full is not None else None)
+            if self._waiting_for_pca() and len(order) >= 2 * self.reduce_dim:
+                self._refit()
+
+    def remove_many(self, ids):
+        with self._lock:
+            old_ids, codes, scales, full = self._state
+            if not len(old_ids):
+                return
+            keep = ~np.isin(old_ids, np.array(list(ids), dtype=np.int64))
+            self._state = (old_ids[keep], np.ascontiguousarray(codes[keep]), scales[keep],
+                           np.ascontiguousarray(full[keep]) if full is not None else None)
+
+    def _scan(self, codes, scales, query):
+        """1ª passada: produto com os códigos int8, convertidos para float32 bloco a bloco."""
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), QUANTIZED_SCAN_BLOCK):
+            block = codes[start:start + QUANTIZED_SCAN_BLOCK]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores * scales
+
+    def _full_vectors(self, ids, rows, full):
+        """Vetores float32 completos (normalizados) de `ids`: da memória ou do banco."""
+        if full is not None:
+            return list(ids), full[rows]
+        id_column, embedding_column = self._columns
+        with database.engine.connect() as conn:
+            found = conn.execute(
+                select(id_column, embedding_column).where(id_column.in_([int(i) for i in ids]))
+            ).all()
+        found_ids, matrix = embedding_codec.decode_many((r[0] for r in found), (r[1] for r in found))
+        if not len(found_ids) or matrix.shape[1] != self._dim:
+            return [], np.empty((0, self._dim), dtype=np.float32)
+        return found_ids.tolist(), normalize(matrix)
+
+    def search(self, query, k: int = 1):
+        ids, codes, scales, full = self._state
+        if not len(ids) or query is None or len(query) == 0:
+            return []
+        q = normalize(query)[0]
+        if q.shape[0] != self._dim:
+            print(f"⚠️ [{self.name}] consulta com dimensão {q.shape[0]} (índice usa {self._dim}).")
+            return []
+
+        approx = self._scan(codes, scales, reduce_vectors(self._reducer, q[None])[0])
+        if self.rerank <= 0:
+            return top_k(ids, approx, k)
+        candidates = max(self.rerank, k)
+        if candidates < len(ids):
+            rows = np.argpartition(-approx, candidates - 1)[:candidates]
+        else:
+            rows = np.arange(len(ids))
+        found, vectors = self._full_vectors(ids[rows], rows, full)
+        if not found:
+            return []
+        return top_k(found, vectors @ q, k)
+
+    def vectors(self, candidate_ids):
+        ids, _, _, full = self._state
+        positions = self._position_map(ids)
+        found = [(i, positions[i]) for i in candidate_ids if i in positions]
+        if not found:
+            return [], np.empty((0, self._dim), dtype=np.float32)
+        return self._full_vectors([i for i, _ in found], [row for _, row in found], full)
+
+
+# -------------------------
+# Índice FAISS (flat / IVF / HNSW), persistido em disco
+# -------------------------
+class FaissIndex:
+    """
+    Índice aproximado com FAISS. Cada vetor recebe um rótulo interno sequencial
+    (mapeado para o id da linha no banco), o que permite substituir e remover
+    vetores mesmo no HNSW, que não suporta remoção: ali o rótulo antigo vira
+    "lápide" e é filtrado na busca até a próxima compactação.
+    """
+
+    def __init__(self, name: str, kind: str = "flat", directory: str = VECTOR_INDEX_DIR):
+        import faiss  # dependência opcional, só exigida por estes backends
+
+        self._faiss = faiss
+        self.name = name
+        self.kind = kind
+        self.backend = f"faiss-{kind}"
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._reset(0)
+        self._last_save = 0.0
+        self._dirty = False
+        # só grava em disco depois de construído/carregado; evita que um processo
+        # avulso (ex.: pdf_indexer via CLI) sobrescreva o índice com dados parciais
+        self.loaded = False
+        self.model = None  # modelo dos vetores (gravado junto; outro modelo = reconstruir)
+
+    # ---- estado interno ----
+    def _reset(self, dim: int):
+        self._index = None
+        self._dim = dim
+        self._label_to_id = {}
+        self._id_to_label = {}
+        self._dead = set()
+        self._next_label = 0
+
+    def _new_index(self, dim: int, train_vectors=None):
+        faiss = self._faiss
+        if self.kind == "hnsw":
+            inner = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            inner.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+            return faiss.IndexIDMap2(inner)
+        if self.kind == "ivf" and train_vectors is not None and len(train_vectors) >= FAISS_IVF_MIN_TRAIN:
+            # ~4·√n listas, mas com pelo menos 39 pontos de treino por centróide
+            nlist = max(1, min(int(4 * np.sqrt(len(train_vectors))), len(train_vectors) // 39))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(train_vectors)
+            # permite reconstruct(rótulo) mesmo depois de remoções (usado em score)
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            index.nprobe = min(FAISS_NPROBE, nlist)
+            return index
+        # flat, ou IVF ainda sem vetores suficientes para treinar
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    @property
+    def _supports_remove(self):
+        return self.kind != "hnsw"
+
+    def __len__(self):
+        return len(self._id_to_label)
+
+    @property
+    def dim(self):
+        return self._dim
+
+    def ids(self) -> set:
+        return set(self._id_to_label)
+
+    # ---- escrita ----
+    def build(self, ids, vectors):
+        if not (isinstance(vectors, np.ndarray) and vectors.ndim == 2):
+            ids, vectors = filter_valid(self.name, ids, vectors, 0)
+        with self._lock:
+            self.loaded = True
+            if not len(ids):
+                self._reset(0)
+                self._dirty = True
+                return
+            matrix = normalize(vectors)
+            self._reset(matrix.shape[1])
+            self._index = self._new_index(self._dim, matrix)
+            self._add(np.asarray(ids, dtype=np.int64), matrix)
+            self.loaded = True
+
+    def _add(self, ids, matrix):
+        labels = np.arange(self._next_label, self._next_label + len(ids), dtype=np.int64)
+        self._next_label += len(ids)
+        self._index.add_with_ids(matrix, labels)
+        for label, item_id in zip(labels.tolist(), ids.tolist()):
+            self._label_to_id[label] = item_id
+            self._id_to_label[item_id] = label
+        self._dirty = True
+
+    def _drop(self, ids):
+        labels = [self._id_to_label.pop(i) for i in ids if i in self._id_to_label]
+        if not labels:
+            return
+        for label in labels:
+            del self._label_to_id[label]
+        if self._supports_remove:
+            self._index.remove_ids(np.array(labels, dtype=np.int64))
+        else:
+            self._dead.update(labels)
+            if len(self._dead) > 0.2 * max(1, self._index.ntotal):
+                self._compact()
+        self._dirty = True
+
+    def _compact(self):
+        """Reconstrói o HNSW só com os vetores vivos (elimina as lápides)."""
+        live = sorted(self._label_to_id.items())
+        vectors = np.vstack([self._index.reconstruct(label) for label, _ in live]) if live else None
+        ids = np.array([item_id for _, item_id in live], dtype=np.int64)
+        self._reset(self._dim)
+        if vectors is not None:
+            self._index = self._new_index(self._dim)
+            self._add(ids, vectors)
+
+    def upsert(self, item_id: int, vector):
+        self.upsert_many([item_id], [vector])
+
+    def upsert_many(self, ids, vectors):
+        with self._lock:
+            ids, vectors = filter_valid(self.name, ids, vectors, self._dim)
+            if not ids:
+                return
+            # último valor vence se o mesmo id vier repetido
+            latest = dict(zip(ids, range(len(ids))))
+            ids = list(latest)
+            matrix = normalize([vectors[i] for i in latest.values()])
+            if self._index is None:
+                self._dim = matrix.shape[1]
+                self._index = self._new_index(self._dim)
+            self._drop(ids)
+            self._add(np.array(ids, dtype=np.int64), matrix)
+        self.save()
+
+    def remove(self, item_id: int):
+        self.remove_many([item_id])
+
+    def remove_many(self, ids):
+        with self._lock:
+            if self._index is None:
+                return
+            self._drop([int(i) for i in ids])
+        self.save()
+
+    # ---- leitura ----
+    def search(self, query, k: int = 1):
+        if query is None or len(query) == 0:
+            return []
+        with self._lock:
+            if self._index is None or not len(self):
+                return []
+            q = normalize(query)
+            if q.shape[1] != self._dim:
+                print(f"⚠️ [{self.name}] consulta com dimensão {q.shape[1]} (índice usa {self._dim}).")
+                return []
+            # pede a mais para compensar as lápides filtradas
+            fetch = min(k + len(self._dead), self._index.ntotal)
+            scores, labels = self._index.search(q, fetch)
+            hits = []
+            for score, label in zip(scores[0].tolist(), labels[0].tolist()):
+                item_id = self._label_to_id.get(label)
+                if label < 0 or item_id is None:
+                    continue
+                hits.append((item_id, float(score)))
+                if len(hits) == k:
+                    break
+            return hits
+
+    def vectors(self, candidate_ids):
+        """Retorna (ids encontrados, matriz com os vetores deles), reconstruindo só esses."""
+        with self._lock:
+            found = [(i, self._id_to_label[i]) for i in candidate_ids if i in self._id_to_label]
+            if not found or self._index is None:
+                return [], np.empty((0, self._dim), dtype=np.float32)
+            vectors = np.vstack([self._index.reconstruct(label) for _, label in found])
+        return [item_id for item_id, _ in found], vectors
+
+    def score(self, query, candidate_ids):
+        """Cosseno da consulta com ids específicos, reconstruindo só esses vetores."""
+        if query is None or len(query) == 0:
+            return {}
+        found, vectors = self.vectors(candidate_ids)
+        q = normalize(query)[0]
+        if not found or q.shape[0] != vectors.shape[1]:
+            return {}
+        return dict(zip(found, (vectors @ q).tolist()))
+
+    # ---- persistência ----
+    def _paths(self):
+        base = os.path.join(self.directory, f"{self.name}.{self.backend}")
+        return base + ".faiss", base + ".json"
+
+    def save(self, force: bool = False):
+        """Grava o índice em disco (no máximo a cada FAISS_SAVE_INTERVAL s, salvo force=True)."""
+        with self._lock:
+            if not self.loaded or not self._dirty or (not force and time.time() - self._last_save < FAISS_SAVE_INTERVAL):
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            index_path, meta_path = self._paths()
+            if self._index is None:
+                for path in (index_path, meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            else:
+                self._faiss.write_index(self._index, index_path + ".tmp")
+                with open(meta_path + ".tmp", "w") as f:
+                    json.dump({
+                        "dim": self._dim,
+                        "next_label": self._next_label,
+                        "labels": list(self._label_to_id.items()),
+                        "dead": sorted(self._dead),
+                        "model": self.model,
+                    }, f)
+                os.replace(index_path + ".tmp", index_path)
+                os.replace(meta_path + ".tmp", meta_path)
+            self._last_save = time.time()
+            self._dirty = False
+
+    def load(self) -> bool:
+        """Lê o índice persistido; retorna False se não existir ou estiver corrompido."""
+        index_path, meta_path = self._paths()
+        if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+            return False
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            index = self._faiss.read_index(index_path)
+        except Exception as e:
+            print(f"⚠️ [{self.name}] índice em disco inválido, reconstruindo: {e}")
+            return False
+        if self.model and meta.get("model") not in (None, self.model):
+            print(f"ℹ️ [{self.name}] índice em disco é do modelo '{meta['model']}', reconstruindo.")
+            return False
+        with self._lock:
+            self._reset(meta["dim"])
+            self._index = index
+            self._next_label = meta["next_label"]
+            self._label_to_id = {int(label): int(item_id) for label, item_id in meta["labels"]}
+            self._id_to_label = {item_id: label for label, item_id in self._label_to_id.items()}
+            self._dead = set(meta["dead"])
+            self._dirty = False
+            self.loaded = True
+        return True
+
+
+# -------------------------
+# Índice compartilhado entre processos (arquivos mapeados em memória)
+# -------------------------
+def _lock_file(path: str):
+    """Lock exclusivo entre processos (flock); no Windows, só entre threads deste processo."""
+    handle = open(path, "a+")
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+    return handle
+
+
+def _unlock_file(handle):
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    handle.close()
+
+
+def _write_npy(path: str, array):
+    with open(path, "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class SharedVectorIndex:
+    """
+    Busca exata sobre uma matriz float32 gravada em disco e mapeada só para
+    leitura (np.load com mmap_mode="r"): todos os workers do uvicorn e os
+    processos avulsos dividem as mesmas páginas pelo page cache do sistema,
+    em vez de cada um manter sua cópia.
+
+    O conteúdo é publicado em gerações imutáveis (`{name}-{geração}.ids.npy`
+    e `.vectors.npy`) e o arquivo `{name}.mmap.json` aponta para a atual,
+    trocado com os.replace. Quem escreve (CRUD do admin, pdf_indexer,
+    bulk) acumula as mudanças numa camada local, já visível nas buscas do
+    próprio processo, e publica uma geração nova sob um lock de arquivo,
+    aplicando as mudanças sobre a geração mais recente (não sobre a que ele
+    tinha mapeado). Os outros processos conferem o ponteiro a cada
+    MMAP_CHECK_INTERVAL s e passam para a geração nova sem reiniciar.
+    """
+
+    backend = "mmap"
+    loaded = False
+    model = None
+
+    def __init__(self, name: str, directory: str = VECTOR_INDEX_DIR):
+        self.name = name
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._base = (np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+        self._pending = {}     # id -> vetor normalizado ainda não publicado
+        self._removed = set()  # ids removidos ainda não publicados
+        # (ids visíveis da base, matriz da base, máscara das linhas escondidas, ids novos, matriz nova)
+        self._view = self._make_view()
+        self._positions = (None, {})
+        self._checked = 0.0
+        self._timer = None
+
+    # ---- arquivos ----
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.name}{suffix}")
+
+    def _read_pointer(self):
+        try:
+            with open(self._path(".mmap.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _map(self, pointer):
+        """Mapeia a geração apontada (só leitura; nada é copiado para a memória do processo)."""
+        ids = np.load(os.path.join(self.directory, pointer["ids"]), mmap_mode="r")
+        matrix = np.load(os.path.join(self.directory, pointer["vectors"]), mmap_mode="r")
+        return np.asarray(ids), matrix
+
+    # ---- visão usada pelas buscas ----
+    def _make_view(self):
+        ids, matrix = self._base
+        hidden = set(self._pending) | self._removed
+        mask = np.isin(ids, np.fromiter(hidden, dtype=np.int64)) if hidden and len(ids) else None
+        if self._pending:
+            extra_ids = np.fromiter(self._pending, dtype=np.int64)
+            extra = np.vstack(list(self._pending.values()))
+        else:
+            extra_ids, extra = np.empty(0, dtype=np.int64), None
+        return ids, matrix, mask, extra_ids, extra
+
+    def _current(self):
+        """Visão atual, trocando para uma geração nova publicada por outro processo."""
+        now = time.monotonic()
+        if now - self._checked >= MMAP_CHECK_INTERVAL:
+            self._checked = now
+            pointer = self._read_pointer()
+            if pointer and pointer["generation"] > self._generation:
+                self._attach(pointer, quiet=False)
+        return self._view
+
+    def _attach(self, pointer, quiet: bool = True):
+        with self._lock:
+            if pointer["generation"] <= self._generation:
+                return
+            try:
+                self._base = self._map(pointer)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ [{self.name}] geração {pointer['generation']} ilegível: {e}")
+                return
+            self._generation = pointer["generation"]
+            self._view = self._make_view()
+        if not quiet:
+            answer_cache.invalidate()  # respostas calculadas com a geração anterior
+            print(f"🔄 [{self.name}] geração {self._generation} mapeada ({pointer['rows']} vetores).")
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def __len__(self):
+        ids, _, mask, extra_ids, _ = self._current()
+        return len(ids) - (int(mask.sum()) if mask is not None else 0) + len(extra_ids)
+
+    @property
+    def dim(self):
+        _, matrix, _, _, extra = self._current()
+        if extra is not None:
+            return extra.shape[1]
+        return matrix.shape[1] if len(matrix) else 0
+
+    def ids(self) -> set:
+        ids, _, mask, extra_ids, _ = self._current()
+        visible = ids[~mask] if mask is not None else ids
+        return set(visible.tolist()) | set(extra_ids.tolist())
+
+    # ---- escrita (camada local + publicação) ----
+    def build(self, ids, vectors):
+        """Publica uma geração com exatamente estes vetores (recarga completa)."""
+        if not (isinstance(vectors, np.ndarray) and vectors.ndim == 2):
+            ids, vectors = filter_valid(self.name, ids, vectors, 0)
+        matrix = normalize(vectors) if len(ids) else np.empty((0, 0), dtype=np.float32)
+        with self._lock:
+            self._pending.clear()
+            self._removed.clear()
+            self._publish(np.asarray(ids, dtype=np.int64), matrix, replace=True)
+            self.loaded = True
+
+    def upsert(self, item_id: int, vector):
+        self.upsert_many([item_id], [vector])
+
+    def upsert_many(self, ids, vectors):
+        with self._lock:
+            ids, vectors = filter_valid(self.name, ids, vectors, self.dim)
+            if not ids:
+                return
+            for item_id, row in zip(ids, normalize(vectors)):
+                self._pending[item_id] = row
+                self._removed.discard(item_id)
+            self._view = self._make_view()
+        self._schedule()
+
+    def remove(self, item_id: int):
+        self.remove_many([item_id])
+
+    def remove_many(self, ids):
+        ids = [int(i) for i in ids]
+        if not ids:
+            return
+        with self._lock:
+            for item_id in ids:
+                self._pending.pop(item_id, None)
+                self._removed.add(item_id)
+            self._view = self._make_view()
+        self._schedule()
+
+    def _schedule(self):
+        """Publica as mudanças em até MMAP_PUBLISH_INTERVAL s (várias escritas viram uma geração)."""
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(MMAP_PUBLISH_INTERVAL, self.save, kwargs={"force": True})
+                self._timer.daemon = True
+                self._timer.start()
+
+    def save(self, force: bool = False):
+        """Publica as mudanças pendentes numa geração nova."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending and not self._removed:
+                return
+            rows = list(self._pending.items())
+            self._publish(np.array([item_id for item_id, _ in rows], dtype=np.int64),
+                          np.vstack([row for _, row in rows]) if rows else None,
+                          removed=self._removed | set(self._pending))
+            self._pending.clear()
+            self._removed.clear()
+            self._view = self._make_view()
+
+    def _publish(self, new_ids, new_rows, removed=(), replace: bool = False):
+        """Grava a geração seguinte (base mais recente - removidos + novos) e troca o ponteiro."""
+        os.makedirs(self.directory, exist_ok=True)
+        handle = _lock_file(self._path(".mmap.lock"))
+        try:
+            pointer = self._read_pointer()
+            if not replace and pointer and pointer.get("model") and self.model and pointer["model"] != self.model:
+                # este processo ficou com vetores de um modelo que já foi trocado
+                print(f"⚠️ [{self.name}] mudanças com o modelo '{self.model}' descartadas "
+                      f"(a geração atual é de '{pointer['model']}').")
+                return
+            generation = (pointer["generation"] if pointer else 0) + 1
+
+            if replace or not pointer:
+                base_ids, base = np.empty(0, dtype=np.int64), None
+            else:
+                base_ids, base = self._map(pointer)
+            dim = base.shape[1] if base is not None and len(base_ids) else (
+                new_rows.shape[1] if new_rows is not None and len(new_ids) else 0)
+            if new_rows is not None and len(new_ids) and new_rows.shape[1] != dim:
+                print(f"⚠️ [{self.name}] {len(new_ids)} vetores com dimensão {new_rows.shape[1]} "
+                      f"(geração usa {dim}), ignorados.")
+                new_ids, new_rows = np.empty(0, dtype=np.int64), None
+
+            keep = ~np.isin(base_ids, np.fromiter(removed, dtype=np.int64)) if len(base_ids) else np.empty(0, bool)
+            kept = int(keep.sum())
+            total = kept + len(new_ids)
+            ids_name = f"{self.name}-{generation:08d}.ids.npy"
+            vectors_name = f"{self.name}-{generation:08d}.vectors.npy"
+
+            # grava a matriz direto no arquivo, em blocos: nunca há uma cópia inteira na memória
+            out = np.lib.format.open_memmap(os.path.join(self.directory, vectors_name + ".tmp"),
+                                            mode="w+", dtype=np.float32, shape=(total, dim))
+            written = 0
+            for start in range(0, len(base_ids), MMAP_COPY_ROWS):
+                block = base[start:start + MMAP_COPY_ROWS][keep[start:start + MMAP_COPY_ROWS]]
+                out[written:written + len(block)] = block
+                written += len(block)
+            if len(new_ids):
+                out[written:] = new_rows
+            out.flush()
+            del out
+            _write_npy(os.path.join(self.directory, ids_name + ".tmp"),
+                       np.concatenate([base_ids[keep], new_ids]) if len(base_ids) else new_ids)
+            os.replace(os.path.join(self.directory, vectors_name + ".tmp"), os.path.join(self.directory, vectors_name))
+            os.replace(os.path.join(self.directory, ids_name + ".tmp"), os.path.join(self.directory, ids_name))
+
+            new_pointer = {
+                "generation": generation,
+                "ids": ids_name,
+                "vectors": vectors_name,
+                "rows": total,
+                "dim": dim,
+                "model": self.model or (pointer or {}).get("model"),
+                "published_at": time.time(),
+            }
+            with open(self._path(".mmap.json.tmp"), "w") as f:
+                json.dump(new_pointer, f)
+            os.replace(self._path(".mmap.json.tmp"), self._path(".mmap.json"))
+            self._prune(generation)
+        finally:
+            _unlock_file(handle)
+        self._attach(new_pointer)
+
+    def _prune(self, generation: int):
+        """Apaga gerações antigas; quem ainda as tem mapeadas continua lendo (o arquivo só some no unmap)."""
+        oldest = generation - MMAP_KEEP_GENERATIONS
+        for file_name in os.listdir(self.directory):
+            if not file_name.startswith(f"{self.name}-") or not file_name.endswith(".npy"):
+                continue
+            try:
+                if int(file_name[len(self.name) + 1:].split(".")[0]) <= oldest:
+                    os.remove(os.path.join(self.directory, file_name))
+            except (ValueError, OSError):
+                pass  # no Windows, um arquivo ainda mapeado não pode ser apagado
+
+    def load(self) -> bool:
+        """Mapeia a geração publicada; retorna False se não houver ou se for de outro modelo."""
+        pointer = self._read_pointer()
+        if not pointer:
+            return False
+        if self.model and pointer.get("model") not in (None, self.model):
+            print(f"ℹ️ [{self.name}] geração em disco é do modelo '{pointer['model']}', reconstruindo.")
+            return False
+        self._attach(pointer)
+        if self._generation != pointer["generation"]:
+            return False
+        self._checked = time.monotonic()
+        self.loaded = True
+        return True
+
+    # ---- leitura ----
+    def search(self, query, k: int = 1):
+        ids, matrix, mask, extra_ids, extra = self._current()
+        if (not len(ids) and not len(extra_ids)) or query is None or len(query) == 0:
+            return []
+        q = normalize(query)[0]
+        dim = extra.shape[1] if extra is not None else matrix.shape[1]
+        if q.shape[0] != dim:
+            print(f"⚠️ [{self.name}] consulta com dimensão {q.shape[0]} (índice usa {dim}).")
+            return []
+
+        scores = matrix @ q if len(ids) else np.empty(0, dtype=np.float32)
+        if mask is not None:
+            scores[mask] = -np.inf
+        if extra is not None:
+            scores = np.concatenate([scores, extra @ q])
+            ids = np.concatenate([ids, extra_ids])
+        return [(item_id, score) for item_id, score in top_k(ids, scores, k) if score != -np.inf]
+
+    def vectors(self, candidate_ids):
+        ids, matrix, mask, extra_ids, extra = self._current()
+        cached_ids, positions = self._positions
+        if cached_ids is not ids:
+            positions = {item_id: row for row, item_id in enumerate(ids.tolist())}
+            self._positions = (ids, positions)
+        extra_positions = {item_id: row for row, item_id in enumerate(extra_ids.tolist())}
+        found, rows = [], []
+        for item_id in candidate_ids:
+            if item_id in extra_positions:
+                found.append(item_id)
+                rows.append(extra[extra_positions[item_id]])
+            elif item_id in positions and (mask is None or not mask[positions[item_id]]):
+                found.append(item_id)
+                rows.append(matrix[positions[item_id]])
+        if not found:
+            return [], np.empty((0, self.dim), dtype=np.float32)
+        return found, np.vstack(rows)
+
+    def score(self, query, candidate_ids):
+        if query is None or len(query) == 0:
+            return {}
+        found, vectors = self.vectors(candidate_ids)
+        q = normalize(query)[0]
+        if not found or q.shape[0] != vectors.shape[1]:
+            return {}
+        return dict(zip(found, (vectors @ q).tolist()))
+
+
+# -------------------------
+# Índice no PostgreSQL (pgvector)
+# -------------------------
+def drop_ann_indexes(conn, table: str, keep: str = None):
+    """Apaga os índices HNSW da tabela (menos `keep`): um índice de outra dimensão quebraria os INSERTs."""
+    names = conn.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexname LIKE :pattern"),
+        {"table": table, "pattern": f"{table}_embedding_hnsw_%"},
+    ).scalars().all()
+    for name in names:
+        if name != keep:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            print(f"🗑️ Índice '{name}' removido.")
+
+
+def ensure_ann_index(conn, table: str, dim: int):
+    """Garante o índice HNSW (cosseno) para a dimensão atual dos vetores da tabela."""
+    name = f"{table}_embedding_hnsw_{dim}"
+    # vários workers sobem ao mesmo tempo: só um cria o índice
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"{table}_hnsw"})
+    drop_ann_indexes(conn, table, keep=name)
+    exists = conn.execute(text("SELECT 1 FROM pg_indexes WHERE indexname = :name"), {"name": name}).first()
+    if exists:
+        return
+    print(f"🧭 Criando índice HNSW '{name}' (pode levar alguns minutos em tabelas grandes)...")
+    conn.execute(text(
+        f"CREATE INDEX {name} ON {table} USING hnsw ((embedding::vector({dim})) vector_cosine_ops) "
+        f"WITH (m = {PGVECTOR_HNSW_M}, ef_construction = {PGVECTOR_EF_CONSTRUCTION})"
+    ))
+
+
+class PgVectorIndex:
+    """
+    Índice que mora no próprio PostgreSQL: nada fica em memória e todos os
+    workers e indexadores enxergam as mesmas linhas, assim que commitadas.
+    A busca é um ORDER BY pela distância de cosseno (<=>), servido pelo
+    índice HNSW. As escritas não fazem nada aqui: as tabelas já são a fonte
+    da verdade. Mesma interface do VectorIndex.
+    """
+
+    backend = "pgvector"
+    loaded = False
+    model = None
+
+    def __init__(self, name: str):
+        if name not in CORPUS_COLUMNS:
+            raise ValueError(f"Corpus desconhecido para o pgvector: {name}")
+        self.name = name
+        self.id_column, self.embedding_column = CORPUS_COLUMNS[name]()
+        self.table = self.id_column.table.name
+        self._dim = 0
+        self._count = (0, 0.0)  # (count, quando foi lido)
+
+    def __len__(self):
+        count, read_at = self._count
+        if time.monotonic() - read_at > PGVECTOR_COUNT_TTL:
+            with database.engine.connect() as conn:
+                count = conn.execute(text(f"SELECT count(*) FROM {self.table} WHERE embedding IS NOT NULL")).scalar()
+            self._count = (count, time.monotonic())
+        return count
+
+    @property
+    def dim(self):
+        return self._dim
+
+    def ids(self) -> set:
+        with database.engine.connect() as conn:
+            return set(conn.execute(select(self.id_column).where(self.embedding_column.isnot(None))).scalars())
+
+    def attach(self):
+        """Descobre a dimensão dos vetores e garante o índice HNSW para ela."""
+        with database.engine.begin() as conn:
+            dim = conn.execute(
+                text(f"SELECT vector_dims(embedding) FROM {self.table} WHERE embedding IS NOT NULL LIMIT 1")
+            ).scalar()
+            if dim:
+                ensure_ann_index(conn, self.table, dim)
+        self._dim = dim or 0
+        self._count = (0, 0.0)
+        self.loaded = True
+        return True
+
+    # as linhas já foram gravadas (e commitadas) por quem chamou
+    def build(self, ids, vectors):
+        self._count = (0, 0.0)
+
+    def upsert(self, item_id: int, vector):
+        self.upsert_many([item_id], [vector])
+
+    def upsert_many(self, ids, vectors):
+        if not self._dim and len(ids):
+            self.attach()  # primeiro vetor da tabela: agora dá para criar o índice
+        self._count = (0, 0.0)
+
+    def remove(self, item_id: int):
+        self._count = (0, 0.0)
+
+    def remove_many(self, ids):
+        self._count = (0, 0.0)
+
+    def _query(self, query):
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if not self._dim or query.shape[0] != self._dim:
+            return None
+        return "[" + ",".join(f"{x:.7g}" for x in query.tolist()) + "]"
+
+    def search(self, query, k: int = 1):
+        literal = self._query(query)
+        if literal is None or k <= 0:
+            return []
+        distance = f"(embedding::vector({self._dim})) <=> CAST(:query AS vector({self._dim}))"
+        with database.engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL hnsw.ef_search = {min(1000, max(PGVECTOR_EF_SEARCH, k))}"))
+            rows = conn.execute(text(
+                f"SELECT {self.id_column.name}, 1 - ({distance}) FROM {self.table} "
+                f"WHERE embedding IS NOT NULL ORDER BY {distance} LIMIT :k"
+            ), {"query": literal, "k": k}).all()
+        return [(int(item_id), float(score)) for item_id, score in rows]
+
+    def score(self, query, candidate_ids):
+        literal = self._query(query)
+        if literal is None or not candidate_ids:
+            return {}
+        with database.engine.connect() as conn:
+            rows = conn.execute(text(
+                f"SELECT {self.id_column.name}, "
+                f"1 - ((embedding::vector({self._dim})) <=> CAST(:query AS vector({self._dim}))) "
+                f"FROM {self.table} WHERE {self.id_column.name} = ANY(:ids) AND embedding IS NOT NULL"
+            ), {"query": literal, "ids": [int(i) for i in candidate_ids]}).all()
+        return {int(item_id): float(score) for item_id, score in rows}
+
+    def vectors(self, candidate_ids):
+        """Retorna (ids encontrados, matriz normalizada com os vetores deles), lidos do banco."""
+        if not candidate_ids:
+            return [], np.empty((0, self._dim), dtype=np.float32)
+        with database.engine.connect() as conn:
+            rows = conn.execute(
+                select(self.id_column, self.embedding_column).where(self.id_column.in_(list(candidate_ids)))
+            ).all()
+        ids, matrix = embedding_codec.decode_many((r[0] for r in rows), (r[1] for r in rows))
+        if not len(ids):
+            return [], np.empty((0, self._dim), dtype=np.float32)
+        return ids.tolist(), normalize(matrix)
+
+    def load(self) -> bool:
+        return self.attach()
+
+    def save(self, force: bool = False):
+        pass
+
+
+def create_index(name: str, backend: str = None):
+    """Cria o índice do backend configurado (cai para numpy se o FAISS não estiver instalado)."""
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        return VectorIndex(name)
+    if backend == "numpy-int8":
+        return QuantizedVectorIndex(name)
+    if backend == "mmap":
+        return SharedVectorIndex(name)
+    if backend == "pgvector":
+        if database.DIALECT == "postgresql":
+            return PgVectorIndex(name)
+        print(f"⚠️ VECTOR_BACKEND=pgvector exige DATABASE_URL PostgreSQL; usando busca exata (numpy) para '{name}'.")
+        return VectorIndex(name)
+    kind = backend.removeprefix("faiss-")
+    if kind not in ("flat", "ivf", "hnsw"):
+        raise ValueError(f"VECTOR_BACKEND desconhecido: {backend}")
+    try:
+        return FaissIndex(name, kind)
+    except ImportError:
+        print(f"⚠️ faiss não instalado; usando busca exata (numpy) para '{name}'.")
+        return VectorIndex(name)
+
+
+# Índices globais do processo
+question_index = create_index("questions")
+chunk_index = create_index("chunks")
+
+metrics.collector("corpus_size", "gauge", "Vectors in the search index",
+                  lambda: {"questions": len(question_index), "chunks": len(chunk_index)}, labels=("corpus",))
+
+LOAD_BATCH = 500
+
+
+def _load(index, db: Session, id_column, embedding_column, full: bool = False, model: str = None):
+    """
+    Sincroniza o índice com o banco. Se o índice já estiver em memória ou
+    persistido em disco, só os ids que faltam são decodificados e os que
+    sumiram do banco são removidos; senão (ou com full=True), tudo é
+    carregado de uma vez.
+    """
+    index.model = model or index.model
+    if isinstance(index, PgVectorIndex):
+        index.attach()  # os vetores já estão nas tabelas; só prepara o índice HNSW
+        return
+    if not full and (index.loaded or index.load()):
+        db_ids = {row[0] for row in db.query(id_column)}
+        known = index.ids()
+        index.remove_many(known - db_ids)
+        missing = sorted(db_ids - known)
+        for start in range(0, len(missing), LOAD_BATCH):
+            batch = missing[start:start + LOAD_BATCH]
+            rows = db.query(id_column, embedding_column).filter(id_column.in_(batch)).all()
+            index.upsert_many(*embedding_codec.decode_many((r[0] for r in rows), (r[1] for r in rows)))
+    else:
+        rows = db.query(id_column, embedding_column).all()
+        index.build(*embedding_codec.decode_many((r[0] for r in rows), (r[1] for r in rows)))
+    index.save(force=True)
+
+
+def load_indexes(db: Session, full: bool = False, model: str = None):
+    """Carrega todos os embeddings do banco para os índices do processo."""
+    _load(question_index, db, models.QuestionEmbedding.question_id, models.QuestionEmbedding.embedding, full, model)
+    _load(chunk_index, db, models.DocumentChunk.id, models.DocumentChunk.embedding, full, model)
+
+    print(
+        f"🧠 Índices carregados ({question_index.backend}): "
+        f"{len(question_index)} perguntas, {len(chunk_index)} trechos de PDF."
+    )
+
+
+def swap_indexes(db: Session, model: str):
+    """
+    Troca de modelo: carrega os vetores novos em índices novos, à parte, e só
+    então substitui os globais — as buscas em andamento seguem no índice antigo.
+    """
+    global question_index, chunk_index
+    for index in (question_index, chunk_index):
+        index.loaded = False  # o índice antigo não grava mais em disco
+    new_questions, new_chunks = create_index("questions"), create_index("chunks")
+    _load(new_questions, db, models.QuestionEmbedding.question_id, models.QuestionEmbedding.embedding, True, model)
+    _load(new_chunks, db, models.DocumentChunk.id, models.DocumentChunk.embedding, True, model)
+    question_index, chunk_index = new_questions, new_chunks
+    print(f"🧠 Índices trocados para o modelo '{model}': {len(question_index)} perguntas, {len(chunk_index)} trechos de PDF.")
+
+
+def save_indexes():
+    """Grava em disco o que ainda estiver pendente (chamado no desligamento)."""
+    question_index.save(force=True)
+    chunk_index.save(force=True)
@@ -0,0 +1,153 @@
+"""
+Subida da API em etapas, com o estado exposto em GET /ready.
+
+Antes de aceitar conexões, só o banco é preparado (tabelas e migrações),
+com no máximo STARTUP_DB_ATTEMPTS tentativas: depois disso a subida falha
+e o processo sai (o restart do compose tenta de novo). O resto roda em
+segundo plano, com novas tentativas até dar certo:
+
+- index: carrega os índices vetoriais e os grupos de pendentes e faz uma
+  busca de aquecimento (páginas do mmap, linhas do SQLite, índice lexical);
+- embedding_model: carrega o modelo de embeddings no Ollama, para o
+  primeiro /ask não pagar a carga do modelo;
+- generation_model: o mesmo para o modelo de geração (com WARMUP_GENERATION).
+
+/ask, /ask/stream e /retrieve esperam o índice (até STARTUP_WAIT_TIMEOUT);
+/ready só responde 200 quando índice e modelo de embeddings estão prontos,
+para o healthcheck e o balanceador só mandarem tráfego a partir daí.
+"""
+import asyncio
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from app import database, maintenance, metrics, migrations, models, refresh_embeddings, retrieval, unanswered, utils, vector_index
+
+load_dotenv()
+
+# 🔹 Quanto um /ask espera o índice carregar antes de responder 503
+STARTUP_WAIT_TIMEOUT = float(os.getenv("STARTUP_WAIT_TIMEOUT", "30"))
+# 🔹 Intervalo entre tentativas de uma etapa que falhou (ex.: Ollama ainda subindo)
+STARTUP_RETRY_INTERVAL = float(os.getenv("STARTUP_RETRY_INTERVAL", "5"))
+# 🔹 Tentativas de preparar o banco antes de desistir da subida (0 = sem limite)
+STARTUP_DB_ATTEMPTS = int(os.getenv("STARTUP_DB_ATTEMPTS", "12"))
+# 🔹 Também carrega o modelo de geração (usado pelo /ask/stream) na subida
+WARMUP_GENERATION = os.getenv("WARMUP_GENERATION", "false").lower() in ("1", "true", "yes")
+
+STEPS = ("database", "index", "embedding_model", "generation_model")
+REQUIRED = ("database", "index", "embedding_model")
+
+_status = {}
+_events = {}
+_started = time.time()
+
+
+class StartupFailed(RuntimeError):
+    """Uma etapa obrigatória esgotou as tentativas: a API não sobe."""
+
+
+def reset():
+    """Estado novo a cada subida (os eventos pertencem ao event loop atual)."""
+    global _started
+    _started = time.time()
+    for step in STEPS:
+        _status[step] = {"state": "pending"}
+        _events[step] = asyncio.Event()
+    if not WARMUP_GENERATION:
+        _status["generation_model"] = {"state": "skipped"}
+
+
+async def _run_step(step: str, work, max_attempts: int = 0):
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            await work()
+            break
+        except Exception as e:
+            if max_attempts and attempt >= max_attempts:
+                _status[step] = {"state": "failed", "attempts": attempt, "error": str(e)}
+                print(f"❌ Aquecimento '{step}' falhou {attempt} vezes, desistindo: {e}")
+                raise StartupFailed(f"startup step '{step}' failed after {attempt} attempts: {e}") from e
+            _status[step] = {"state": "retrying", "attempts": attempt, "error": str(e)}
+            print(f"⚠️ Aquecimento '{step}' falhou (tentativa {attempt}), nova tentativa em {STARTUP_RETRY_INTERVAL:g}s: {e}")
+            await asyncio.sleep(STARTUP_RETRY_INTERVAL)
+    seconds = time.perf_counter() - started
+    metrics.record_stage(f"startup.{step}", seconds)
+    _status[step] = {"state": "ready", "seconds": round(seconds, 3)}
+    _events[step].set()
+    print(f"🔥 '{step}' pronto em {seconds:.1f}s.")
+
+
+# -------------------------
+# Etapas
+# -------------------------
+def prepare_database():
+    with database.engine.begin() as conn:
+        maintenance.configure(conn)  # WAL e auto_vacuum antes das tabelas
+        models.Base.metadata.create_all(bind=conn)
+    migrations.upgrade(database.engine)
+    with database.SessionLocal() as db:
+        refresh_embeddings.apply_active_model(db)
+
+
+def load_corpus():
+    with database.SessionLocal() as db:
+        vector_index.load_indexes(db, model=utils.EMBEDDING_MODEL)
+        unanswered.load_clusters(db)
+        # uma busca completa (vetorial, lexical, linhas) com um vetor qualquer da dimensão do índice
+        dim = vector_index.chunk_index.dim or vector_index.question_index.dim
+        if dim:
+            query = np.random.default_rng(0).standard_normal(dim).astype(np.float32)
+            retrieval.search(db, "warmup", query.tolist(), min_scores={"questions": -1.0, "chunks": -1.0})
+
+
+async def start_database():
+    """Roda antes de aceitar conexões: sem tabelas, nenhuma rota funciona."""
+    reset()
+    await _run_step("database", lambda: run_in_threadpool(prepare_database), STARTUP_DB_ATTEMPTS)
+
+
+async def warm_up():
+    """Índice e modelos em paralelo, em segundo plano."""
+    steps = [
+        _run_step("index", lambda: run_in_threadpool(load_corpus)),
+        _run_step("embedding_model", utils.warm_up_embedding_model),
+    ]
+    if WARMUP_GENERATION:
+        steps.append(_run_step("generation_model", utils.warm_up_generation_model))
+    await asyncio.gather(*steps)
+
+
+# -------------------------
+# Consultas
+# -------------------------
+async def wait_for(step: str, timeout: float = None) -> bool:
+    event = _events.get(step)
+    if event is None:
+        return False
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+def is_done(step: str) -> bool:
+    return _status.get(step, {}).get("state") == "ready"
+
+
+def is_ready() -> bool:
+    return all(is_done(step) for step in REQUIRED)
+
+
+def status() -> dict:
+    return {
+        "ready": is_ready(),
+        "uptime_seconds": round(time.time() - _started, 1),
+        "steps": dict(_status),
+        "index": {"backend": vector_index.question_index.backend,
+                  "questions": len(vector_index.question_index), "chunks": len(vector_index.chunk_index)},
+    }
@@ -0,0 +1,68 @@
+"""
+Configuração comum dos testes: banco SQLite, índices e backups num diretório
+temporário e o Ollama falso (app.fake_ollama), antes de importar a API.
+
+    cd backend
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+
+ROOT = tempfile.mkdtemp(prefix="agentqa-tests-")
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{ROOT}/agent.db",
+    "EMBEDDING_CACHE_PATH": f"{ROOT}/embedding_cache.db",
+    "VECTOR_INDEX_DIR": f"{ROOT}/index",
+    "VECTOR_BACKEND": "numpy",
+    "PDF_FOLDER": f"{ROOT}/pdfs",
+    "BACKUP_DIR": f"{ROOT}/backups",
+    "ADMIN_KEY": "test-key",
+    "INGEST_WORKERS": "0",
+    "MAINTENANCE_ENABLED": "false",
+    "OLLAMA_RETRIES": "0",
+    "HYBRID_ENABLED": "false",
+})
+
+from app import fake_ollama  # noqa: E402
+
+OLLAMA = fake_ollama.start()
+os.environ["LLAMA_URL"] = OLLAMA.url
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+from app import database, maintenance, migrations, models, unanswered, vector_index  # noqa: E402
+from app.answer_cache import answer_cache  # noqa: E402
+
+with database.engine.begin() as connection:
+    maintenance.configure(connection)
+    models.Base.metadata.create_all(bind=connection)
+migrations.upgrade(database.engine)
+
+
+@pytest.fixture
+def db():
+    """Sessão num banco vazio, com os índices em memória vazios."""
+    with database.engine.begin() as conn:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    session = database.SessionLocal()
+    vector_index.load_indexes(session, full=True)
+    unanswered.load_clusters(session)
+    answer_cache.invalidate()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def unit(*components, dim: int = 16):
+    """Vetor de dimensão `dim` com os componentes dados (ex.: unit((0, 0.9), (1, 0.43)))."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for axis, value in components:
+        vector[axis] = value
+    return (vector / np.linalg.norm(vector)).tolist()
@@ -0,0 +1,72 @@
+import asyncio
+import math
+from app import crud, main, models, schemas, utils, vector_index
+from tests.conftest import unit
+
+
+def add_chunk(db, content, embedding, chunk_index=0):
+    chunk = models.DocumentChunk(
+        source_name="manual.pdf", content=content, chunk_index=chunk_index, page_start=1, page_end=1,
+        embedding=utils.serialize_embedding(embedding), embedding_model=utils.EMBEDDING_MODEL,
+    )
+    db.add(chunk)
+    db.commit()
+    vector_index.chunk_index.upsert(chunk.id, embedding)
+    return chunk
+
+
+def test_question_above_threshold_beats_higher_scoring_chunks(db):
+    query = unit((0, 1.0))
+    # pergunta com cosseno 0.90 (acima de QUESTION_MIN_SCORE) e seis trechos diferentes entre si com 0.95
+    crud.create_question(db, schemas.QuestionCreate(text="what is gli eleven", answer="a standard"),
+                         unit((0, 0.90), (1, math.sqrt(1 - 0.90 ** 2))))
+    for i in range(6):
+        add_chunk(db, f"chunk {i}", unit((0, 0.95), (2 + i, math.sqrt(1 - 0.95 ** 2))), chunk_index=i)
+
+    response = main.answer_from_index(db, "what is gli eleven", query)
+    assert response["ai_answer"] == "a standard"
+    assert response["context_used"] == "what is gli eleven"
+    assert round(response["context_match_score"], 2) == 0.90
+
+    context = main.retrieve_context(db, "what is gli eleven", query)
+    assert context["answer"] == "a standard"
+
+
+def test_question_survives_near_duplicate_chunk(db):
+    query = unit((0, 1.0))
+    # um trecho praticamente igual à pergunta (seria descartado como duplicata pelo MMR)
+    same = unit((0, 0.90), (1, math.sqrt(1 - 0.90 ** 2)))
+    crud.create_question(db, schemas.QuestionCreate(text="what is gli eleven", answer="a standard"), same)
+    add_chunk(db, "GLI-11 is a standard", unit((0, 0.92), (1, math.sqrt(1 - 0.92 ** 2))))
+
+    assert main.answer_from_index(db, "what is gli eleven", query)["ai_answer"] == "a standard"
+
+
+def test_chunks_answer_when_question_below_threshold(db):
+    query = unit((0, 1.0))
+    crud.create_question(db, schemas.QuestionCreate(text="unrelated", answer="nope"),
+                         unit((0, 0.5), (1, math.sqrt(1 - 0.25))))
+    for i in range(4):
+        add_chunk(db, f"chunk {i}", unit((0, 0.95), (2 + i, math.sqrt(1 - 0.95 ** 2))), chunk_index=i)
+
+    response = main.answer_from_index(db, "anything", query)
+    assert response["context_used"].startswith("Excerpt of the PDF")
+    assert all(source["source"] == "pdf" for source in response["sources"])
+    assert len(response["sources"]) == 4
+
+
+def test_cached_unanswered_question_is_recorded_without_blocking_embedding(db, monkeypatch):
+    first = asyncio.run(main.ask_question("what is the meaning of zebrafish", db))
+    assert first["context_used"] is None
+
+    def blocking(text):
+        raise AssertionError("the cached path must not call the synchronous embedding client")
+
+    monkeypatch.setattr(utils, "get_embedding", blocking)
+    second = asyncio.run(main.ask_question("What is the meaning of zebrafish?", db))
+    assert second["context_used"] is None
+    assert "Internal Error" not in second["ai_answer"]
+    # as duas perguntas ficam registradas, com vetor, para o agrupamento dos leads
+    recorded = db.query(models.UnansweredQuestion).all()
+    assert len(recorded) == 2
+    assert all(row.embedding is not None for row in recorded)
@@ -0,0 +1,121 @@
+import io
+import sqlite3
+import pytest
+from app import bulk, maintenance, models, utils, vector_index
+
+
+def rows(content: str, fmt: str):
+    return bulk.iter_rows(io.BytesIO(content.encode()), fmt)
+
+
+def stored(db):
+    return sorted((q.text, q.answer) for q in db.query(models.Question))
+
+
+JSONL = "\n".join([
+    '{"text": "what is gli eleven", "answer": "a protein"}',
+    '{"text": "what is ptch1", "answer": "a receptor"}',
+    '{"text": "broken", "answer": ',
+    '["not", "an", "object"]',
+    '{"text": "what is smo", "answer": ""}',
+    '{"text": "what is shh", "answer": "a ligand"}',
+]) + "\n"
+
+CSV = (
+    "text,answer\n"
+    "what is gli eleven,a protein\n"
+    "what is ptch1,a receptor\n"
+    ",no question\n"
+    "what is smo,\n"
+    "a row without a comma\n"
+    "what is shh,a ligand\n"
+)
+
+
+@pytest.mark.parametrize("fmt,content,bad_rows", [
+    ("jsonl", JSONL, [3, 4, 5]),
+    ("csv", CSV, [4, 5, 6]),  # linha 1 é o cabeçalho
+])
+def test_bad_rows_mid_batch_do_not_stop_the_import(db, fmt, content, bad_rows):
+    report = bulk.import_questions(db, rows(content, fmt), batch_size=2)
+
+    assert (report["total"], report["inserted"], report["failed"]) == (6, 3, 3)
+    assert [error["row"] for error in report["errors"]] == bad_rows
+    assert stored(db) == [("what is gli eleven", "a protein"), ("what is ptch1", "a receptor"),
+                          ("what is shh", "a ligand")]
+    assert db.query(models.QuestionEmbedding).count() == 3
+    assert len(vector_index.question_index) == 3
+
+
+def test_embedding_failure_skips_only_that_row(db, monkeypatch):
+    real = utils.get_embeddings
+
+    def flaky(texts, *args, **kwargs):
+        vectors = real(texts, *args, **kwargs)
+        return [None if text == "what is ptch1" else vector for text, vector in zip(texts, vectors)]
+
+    monkeypatch.setattr(utils, "get_embeddings", flaky)
+    report = bulk.import_questions(db, rows(JSONL, "jsonl"), batch_size=2)
+
+    assert report["inserted"] == 2
+    assert {"row": 2, "error": "embedding service unavailable"} in report["errors"]
+    assert ("what is ptch1", "a receptor") not in stored(db)
+    # as linhas que vieram com a falhada no mesmo lote entraram com o próprio vetor
+    embedded = {q.text for q in db.query(models.Question).join(
+        models.QuestionEmbedding, models.QuestionEmbedding.question_id == models.Question.id)}
+    assert embedded == {"what is gli eleven", "what is shh"}
+
+
+def test_other_writers_are_not_blocked_while_embedding(db, monkeypatch):
+    real = utils.get_embeddings
+    writes = []
+
+    def embed_then_write(texts, *args, **kwargs):
+        # outro processo (um /ask registrando pendente) escreve entre um lote e outro
+        conn = sqlite3.connect(maintenance.database_path(), timeout=0.2)
+        try:
+            conn.execute("INSERT INTO unanswered_questions (text) VALUES (?)", (f"pending {len(writes)}",))
+            conn.commit()
+        finally:
+            conn.close()
+        writes.append(len(texts))
+        return real(texts, *args, **kwargs)
+
+    monkeypatch.setattr(utils, "get_embeddings", embed_then_write)
+    report = bulk.import_questions(db, rows(JSONL, "jsonl"), batch_size=1)
+
+    assert report["inserted"] == 3
+    assert len(writes) == 3
+    assert db.query(models.UnansweredQuestion).count() == 3
+
+
+def test_duplicates_skip_or_update(db):
+    bulk.import_questions(db, [(1, {"text": "what is shh", "answer": "a ligand"})])
+
+    report = bulk.import_questions(db, [(1, {"text": "what is shh", "answer": "a morphogen"}),
+                                        (2, {"text": "what is shh", "answer": "again"})])
+    assert (report["skipped"], report["inserted"]) == (2, 0)
+
+    report = bulk.import_questions(db, [(1, {"text": "what is shh", "answer": "a morphogen"})], on_duplicate="update")
+    assert report["updated"] == 1
+    assert stored(db) == [("what is shh", "a morphogen")]
+
+
+@pytest.mark.parametrize("fmt", bulk.FORMATS)
+def test_export_then_import_round_trip(db, fmt):
+    originals = [
+        {"text": "what is gli eleven", "answer": "a protein"},
+        {"text": 'quotes "and", commas', "answer": "line one\nline two"},
+        {"text": "ação e coração", "answer": "acentuação ✓"},
+    ]
+    bulk.import_questions(db, enumerate(originals, start=1))
+    before = stored(db)
+
+    exported = "".join(bulk.export_questions(fmt, page_size=2))
+    db.query(models.QuestionEmbedding).delete()
+    db.query(models.Question).delete()
+    db.commit()
+
+    report = bulk.import_questions(db, rows(exported, fmt))
+    assert (report["inserted"], report["failed"]) == (3, 0)
+    assert stored(db) == before
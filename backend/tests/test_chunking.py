@@ -0,0 +1,76 @@
+import pytest
+from app.chunking import iter_chunks
+
+
+def words(start, end):
+    return " ".join(f"w{i}" for i in range(start, end + 1))
+
+
+CASES = [
+    pytest.param(
+        [(1, words(1, 7))], dict(chunk_size=3),
+        [(words(1, 3), 1, 1), (words(4, 6), 1, 1), ("w7", 1, 1)],
+        id="fixed-split",
+    ),
+    pytest.param(
+        [(1, words(1, 8))], dict(chunk_size=4, overlap=2),
+        [(words(1, 4), 1, 1), (words(3, 6), 1, 1), (words(5, 8), 1, 1)],
+        id="word-overlap",
+    ),
+    pytest.param(
+        [(1, words(1, 4))], dict(chunk_size=3, overlap=5),
+        [(words(1, 3), 1, 1), (words(2, 4), 1, 1)],
+        id="overlap-capped-below-chunk-size",
+    ),
+    pytest.param(
+        [(1, "a b"), (2, "c d"), (3, "e")], dict(chunk_size=3),
+        [("a b c", 1, 2), ("d e", 2, 3)],
+        id="chunk-spans-pages",
+    ),
+    pytest.param(
+        [(1, ""), (2, "a b"), (3, "  \n "), (4, "c")], dict(chunk_size=5),
+        [("a b c", 2, 4)],
+        id="empty-pages-skipped",
+    ),
+    pytest.param(
+        [(1, ""), (2, "\n")], dict(chunk_size=5),
+        [],
+        id="only-empty-pages",
+    ),
+    pytest.param(
+        [(1, "A b. C d. E f. G h.")], dict(chunk_size=5, overlap=2, sentences=True),
+        [("A b. C d.", 1, 1), ("C d. E f.", 1, 1), ("E f. G h.", 1, 1)],
+        id="sentence-overlap",
+    ),
+    pytest.param(
+        [(1, "One two three four five six seven. Short one.")], dict(chunk_size=3, sentences=True),
+        [("One two three", 1, 1), ("four five six", 1, 1), ("seven. Short one.", 1, 1)],
+        id="sentence-longer-than-chunk",
+    ),
+    pytest.param(
+        [(1, "Alpha beta gamma."), (2, "Delta epsilon.")], dict(chunk_size=4, sentences=True),
+        [("Alpha beta gamma.", 1, 1), ("Delta epsilon.", 2, 2)],
+        id="sentence-not-split-across-chunks",
+    ),
+]
+
+
+@pytest.mark.parametrize("pages,options,expected", CASES)
+def test_iter_chunks(pages, options, expected):
+    chunks = list(iter_chunks(pages, **{"overlap": 0, "sentences": False, **options}))
+    assert [(c.text, c.page_start, c.page_end) for c in chunks] == expected
+    assert [c.index for c in chunks] == list(range(len(expected)))
+
+
+def test_streams_pages_lazily():
+    # o primeiro bloco sai antes de a última página ser lida
+    read = []
+
+    def pages():
+        for number in range(1, 4):
+            read.append(number)
+            yield number, words(number * 10, number * 10 + 3)
+
+    first = next(iter_chunks(pages(), chunk_size=4, overlap=0, sentences=False))
+    assert first.text == words(10, 13)
+    assert read == [1, 2]
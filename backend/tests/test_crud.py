@@ -0,0 +1,41 @@
+import pytest
+from app import crud, models, schemas, utils, vector_index
+from tests.conftest import unit
+
+
+def question(text, answer="answer"):
+    return schemas.QuestionCreate(text=text, answer=answer)
+
+
+def test_update_replaces_text_and_vector(db):
+    created = crud.create_question(db, question("old text"), unit((0, 1.0)))
+
+    updated = crud.update_question(db, created.id, question("new text", "new answer"), unit((1, 1.0)))
+
+    assert (updated.text, updated.answer) == ("new text", "new answer")
+    rows = db.query(models.QuestionEmbedding).filter_by(question_id=created.id).all()
+    assert len(rows) == 1
+    assert utils.deserialize_embedding(rows[0].embedding).tolist() == pytest.approx(unit((1, 1.0)))
+    assert vector_index.question_index.search(unit((1, 1.0)), k=1)[0][0] == created.id
+
+
+def test_update_is_one_transaction(db, monkeypatch):
+    created = crud.create_question(db, question("old text"), unit((0, 1.0)))
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("encoder down")
+
+    monkeypatch.setattr(utils, "serialize_embedding", broken)
+    with pytest.raises(RuntimeError):
+        crud.update_question(db, created.id, question("new text"), unit((1, 1.0)))
+    db.rollback()
+
+    # nada da edição ficou gravado: nem o texto, nem o vetor no índice
+    db.expire_all()
+    assert crud.get_question(db, created.id).text == "old text"
+    assert vector_index.question_index.search(unit((0, 1.0)), k=1)[0][0] == created.id
+    assert vector_index.question_index.search(unit((1, 1.0)), k=1)[0][1] < 0.5
+
+
+def test_update_missing_question(db):
+    assert crud.update_question(db, 12345, question("anything"), unit((0, 1.0))) is None
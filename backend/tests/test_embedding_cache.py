@@ -0,0 +1,94 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import pytest
+from app import embedding_cache as cache_module, utils
+from app.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache.db")
+
+
+def test_put_does_not_wait_for_a_locked_disk(path):
+    cache = EmbeddingCache(path=path)
+    cache.put("m", "warm", [0.0, 1.0])
+    cache.flush()
+
+    # outro processo segura a escrita do arquivo
+    blocker = sqlite3.connect(path)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.perf_counter()
+        cache.put("m", "what is gli eleven", [1.0, 0.0])
+        assert time.perf_counter() - started < 0.1
+        assert cache.get_memory("m", "what is gli eleven") == [1.0, 0.0]
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+    cache.flush()
+    # outro processo acha o vetor no disco
+    assert EmbeddingCache(path=path).get("m", "what is gli eleven") == [1.0, 0.0]
+
+
+def test_memory_lookups_do_not_wait_for_disk_reads(path, monkeypatch):
+    cache = EmbeddingCache(path=path)
+    cache.put("m", "hot", [1.0])
+    reading = threading.Event()
+
+    def slow_read(key):
+        reading.set()
+        time.sleep(0.5)
+
+    monkeypatch.setattr(cache, "_disk_get", slow_read)
+    thread = threading.Thread(target=cache.get_disk, args=("m", "cold"))
+    thread.start()
+    reading.wait(1)
+    started = time.perf_counter()
+    assert cache.get_memory("m", "hot") == [1.0]
+    assert time.perf_counter() - started < 0.1
+    thread.join()
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_tier_is_pruned_to_the_newest_rows(path, monkeypatch):
+    monkeypatch.setattr(cache_module, "PRUNE_EVERY", 4)
+    cache = EmbeddingCache(path=path, disk_max_items=4)
+    for i in range(12):
+        cache.put("m", f"text {i}", [float(i)])
+        cache.flush()  # um commit por vetor: horas diferentes
+
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("SELECT count(*) FROM embedding_cache").fetchone()[0] == 4
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT created_at FROM embedding_cache ORDER BY created_at DESC LIMIT 1 OFFSET 3"))
+        assert "embedding_cache_created_at" in plan
+    finally:
+        conn.close()
+    fresh = EmbeddingCache(path=path)
+    assert fresh.get("m", "text 11") == [11.0]
+    assert fresh.get("m", "text 0") is None
+
+
+def test_async_lookup_reads_disk_off_the_event_loop(path, monkeypatch):
+    writer = EmbeddingCache(path=path)
+    writer.put(utils.EMBEDDING_MODEL, "what is ptch1", [0.5, 0.5])
+    writer.flush()
+    cache = EmbeddingCache(path=path)
+    monkeypatch.setattr(utils, "embedding_cache", cache)
+    loop_thread = []
+
+    real = cache.get_disk
+
+    def get_disk(*args):
+        loop_thread.append(threading.current_thread() is threading.main_thread())
+        return real(*args)
+
+    monkeypatch.setattr(cache, "get_disk", get_disk)
+    assert asyncio.run(utils.get_embedding_async("What is PTCH1?")) == [0.5, 0.5]
+    assert loop_thread == [False]
+    assert cache.stats()["disk_hits"] == 1
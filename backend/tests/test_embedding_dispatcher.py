@@ -0,0 +1,95 @@
+import asyncio
+import socket
+import numpy as np
+import pytest
+from app import fake_ollama
+from app.ollama_client import EmbeddingDispatcher, OllamaClient, OllamaError
+
+DIM = 32
+
+
+@pytest.fixture
+def server():
+    # cada chamada leva 0.2s: dá tempo de as outras chegarem com ela em voo
+    srv = fake_ollama.start(dim=DIM, embed_latency=0.2)
+    yield srv
+    srv.shutdown()
+
+
+def run(url, scenario, **options):
+    async def main():
+        client = OllamaClient(base_url=url, retries=0)
+        try:
+            return await scenario(EmbeddingDispatcher(client, **options))
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def expected(text):
+    return fake_ollama.embed(text, DIM)
+
+
+def test_identical_texts_in_flight_share_one_call(server):
+    async def scenario(dispatcher):
+        return await asyncio.gather(*(dispatcher.embed("what is gli eleven", "m") for _ in range(10)))
+
+    results = run(server.url, scenario)
+    assert server.requests == 1
+    for vector in results:
+        assert np.allclose(vector, expected("what is gli eleven"), atol=1e-6)
+
+
+def test_texts_arriving_during_a_call_go_out_in_one_batch_to_the_right_callers(server):
+    texts = [f"question number {i}" for i in range(20)]
+
+    async def scenario(dispatcher):
+        first = asyncio.ensure_future(dispatcher.embed("warm", "m"))
+        await asyncio.sleep(0.05)  # a primeira chamada está no Ollama
+        rest = await asyncio.gather(*(dispatcher.embed(text, "m") for text in texts))
+        return await first, rest
+
+    first, rest = run(server.url, scenario)
+    assert server.requests == 2
+    assert server.embedded_texts == 21
+    assert np.allclose(first, expected("warm"), atol=1e-6)
+    for text, vector in zip(texts, rest):
+        assert np.allclose(vector, expected(text), atol=1e-6)
+
+
+def test_max_batch_splits_large_bursts(server):
+    async def scenario(dispatcher):
+        return await asyncio.gather(*(dispatcher.embed(f"text {i}", "m") for i in range(10)))
+
+    results = run(server.url, scenario, max_batch=4)
+    assert server.requests == 3  # 4 + 4 + 2
+    assert all(np.allclose(v, expected(f"text {i}"), atol=1e-6) for i, v in enumerate(results))
+
+
+def test_every_waiter_gets_the_error():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    sock.close()  # nada escutando nessa porta
+
+    async def scenario(dispatcher):
+        return await asyncio.gather(*(dispatcher.embed(text, "m") for text in ["a", "a", "b"]),
+                                    return_exceptions=True)
+
+    results = run(url, scenario)
+    assert len(results) == 3
+    assert all(isinstance(result, OllamaError) for result in results)
+
+
+def test_cancelled_waiter_does_not_cancel_the_others(server):
+    async def scenario(dispatcher):
+        leaving = asyncio.ensure_future(dispatcher.embed("shared", "m"))
+        staying = asyncio.ensure_future(dispatcher.embed("shared", "m"))
+        await asyncio.sleep(0.05)
+        leaving.cancel()
+        return await staying, leaving.cancelled()
+
+    vector, cancelled = run(server.url, scenario)
+    assert cancelled
+    assert np.allclose(vector, expected("shared"), atol=1e-6)
+    assert server.requests == 1
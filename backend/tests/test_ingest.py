@@ -0,0 +1,128 @@
+import os
+import tempfile
+import threading
+import time
+import pytest
+from app import database, ingest, models, pdf_indexer
+
+
+def make_job(db, name="manual.pdf"):
+    return ingest.enqueue(db, name, f"/nowhere/{name}")
+
+
+def fake_indexer(db_name, seconds, during=None):
+    """process_pdf que leva `seconds` sem chamar o callback de progresso (um lote lento do Ollama)."""
+    def process_pdf(file_path, on_progress=None, raise_errors=False, source_name=None):
+        if during:
+            threading.Timer(seconds / 2, during).start()
+        time.sleep(seconds)
+        with database.SessionLocal() as db:
+            db.add(models.IndexedDocument(source_name=db_name, status="complete", page_count=3, chunk_count=2))
+            db.commit()
+        return 2
+    return process_pdf
+
+
+def test_heartbeat_keeps_slow_job_from_being_requeued(db, monkeypatch):
+    monkeypatch.setattr(ingest, "HEARTBEAT_INTERVAL", 0.05)
+    monkeypatch.setattr(ingest, "INGEST_STALE_SECONDS", 0.2)
+    make_job(db)
+    job = ingest.claim(db)
+
+    def other_worker_looks():
+        with database.SessionLocal() as other:
+            ingest._recover_stale(other)
+
+    monkeypatch.setattr(pdf_indexer, "process_pdf", fake_indexer("manual.pdf", 0.6, during=other_worker_looks))
+    ingest.run(db, job)
+    assert db.get(models.IngestJob, job.id).status == "done"
+
+
+def test_stale_job_taken_over_keeps_the_new_owner_state(db, monkeypatch):
+    make_job(db)
+    first = ingest.claim(db)
+    attempt = first.attempts
+
+    # o primeiro worker "sumiu": o job volta para a fila e é pego de novo
+    monkeypatch.setattr(ingest, "INGEST_STALE_SECONDS", 0)
+    monkeypatch.setattr(ingest, "_stale_checked", 0.0)
+    with database.SessionLocal() as other:
+        second = ingest.claim(other)
+        assert second.id == first.id and second.attempts == attempt + 1
+
+    assert not ingest._finish(db, first, attempt, status="done", finished_at=time.time())
+    job = db.get(models.IngestJob, first.id)
+    assert job.status == "running" and job.attempts == attempt + 1
+
+
+def test_progress_from_old_owner_stops_it(db):
+    make_job(db)
+    job = ingest.claim(db)
+    report = ingest._reporter(job.id, job.attempts - 1)  # tentativa anterior
+    with pytest.raises(ingest.IngestLost):
+        report(3, 3, 1)
+
+
+def stage(name, content):
+    """Um envio do POST /admin/pdfs: arquivo próprio em UPLOAD_FOLDER."""
+    os.makedirs(ingest.UPLOAD_FOLDER, exist_ok=True)
+    handle, path = tempfile.mkstemp(dir=ingest.UPLOAD_FOLDER, prefix="upload-", suffix=f"-{name}")
+    with os.fdopen(handle, "wb") as f:
+        f.write(content)
+    return path
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_reupload_while_running_leaves_the_running_file_alone(db, monkeypatch):
+    first = ingest.enqueue(db, "manual.pdf", stage("manual.pdf", b"%PDF- v1"))
+    running = ingest.claim(db)
+    assert running.id == first.id
+
+    second = ingest.enqueue(db, "manual.pdf", stage("manual.pdf", b"%PDF- v2"))
+    uploads = [first.file_path, second.file_path]
+    assert second.id != first.id
+    assert read(db.get(models.IngestJob, first.id).file_path) == b"%PDF- v1"
+    # o mesmo nome não roda duas vezes ao mesmo tempo
+    assert ingest.claim(db) is None
+
+    seen = []
+
+    def process_pdf(file_path, on_progress=None, raise_errors=False, source_name=None):
+        seen.append((read(file_path), source_name))
+        with database.SessionLocal() as other:
+            if other.query(models.IndexedDocument).filter_by(source_name=source_name).first() is None:
+                other.add(models.IndexedDocument(source_name=source_name, status="complete", page_count=1, chunk_count=1))
+                other.commit()
+        return 1
+
+    monkeypatch.setattr(pdf_indexer, "process_pdf", process_pdf)
+    ingest.run(db, running)
+    published = os.path.join(ingest.PDF_FOLDER, "manual.pdf")
+    assert read(published) == b"%PDF- v1"
+
+    ingest.run(db, ingest.claim(db))
+    assert seen == [(b"%PDF- v1", "manual.pdf"), (b"%PDF- v2", "manual.pdf")]
+    assert read(published) == b"%PDF- v2"
+    assert not any(os.path.exists(path) for path in uploads)  # publicados (movidos) para a pasta
+
+
+def test_reupload_while_queued_replaces_the_pending_file(db):
+    old = stage("manual.pdf", b"%PDF- v1")
+    job = ingest.enqueue(db, "manual.pdf", old)
+    new = stage("manual.pdf", b"%PDF- v2")
+
+    assert ingest.enqueue(db, "manual.pdf", new).id == job.id
+    assert db.get(models.IngestJob, job.id).file_path == new
+    assert not os.path.exists(old)
+
+
+def test_cancelling_job_still_blocks_its_name(db):
+    job = ingest.enqueue(db, "manual.pdf", stage("manual.pdf", b"%PDF- v1"))
+    ingest.claim(db)
+    ingest.cancel(db, job.id)
+    ingest.enqueue(db, "manual.pdf", stage("manual.pdf", b"%PDF- v2"))
+    assert ingest.claim(db) is None
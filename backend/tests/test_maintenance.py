@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import time
+from app import maintenance, models
+from app.embedding_codec import encode_embedding
+
+
+def test_only_one_process_holds_a_task(db):
+    assert maintenance.claim(db, "checkpoint")
+    # outro processo (ou um pedido do admin) não entra enquanto a reserva vale, nem com force
+    assert not maintenance.claim(db, "checkpoint")
+    assert not maintenance.claim(db, "checkpoint", force=True)
+    assert maintenance.run_task("checkpoint", force=True) is None
+
+    maintenance._execute(db, "checkpoint")
+    task = db.query(models.MaintenanceTask).filter_by(name="checkpoint").one()
+    db.refresh(task)
+    assert task.lease_until is None
+    assert task.last_status == "ok"
+
+    assert not maintenance.claim(db, "checkpoint")          # acabou de rodar: só no próximo intervalo
+    assert maintenance.claim(db, "checkpoint", force=True)  # livre de novo
+
+
+def test_expired_lease_is_taken_over(db):
+    assert maintenance.claim(db, "optimize")
+    # o processo que reservou morreu no meio
+    db.query(models.MaintenanceTask).filter_by(name="optimize").update({"lease_until": time.time() - 1})
+    db.commit()
+    assert maintenance.claim(db, "optimize")
+
+
+def test_failed_task_releases_the_lease(db, monkeypatch):
+    def broken(_db):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setitem(maintenance.TASKS, "checkpoint", broken)
+    assert maintenance.run_task("checkpoint", force=True) == {"error": "disk full"}
+
+    task = db.query(models.MaintenanceTask).filter_by(name="checkpoint").one()
+    assert (task.last_status, task.lease_until) == ("failed", None)
+    assert maintenance.claim(db, "checkpoint", force=True)
+
+
+def test_backup_restores_to_a_valid_copy(db, tmp_path):
+    db.add_all([models.Question(text=f"question {i}", answer=f"answer {i}") for i in range(50)])
+    db.commit()
+
+    # páginas pequenas: a cópia anda em vários passos
+    result = maintenance.backup(dest_dir=str(tmp_path), pages=2)
+    assert result["steps"] > 1
+    assert os.listdir(tmp_path) == [result["file"]]
+
+    restored = sqlite3.connect(tmp_path / result["file"])
+    try:
+        assert restored.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+        assert restored.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        assert restored.execute("SELECT count(*) FROM questions").fetchone()[0] == 50
+        assert restored.execute("SELECT answer FROM questions WHERE text = 'question 7'").fetchone()[0] == "answer 7"
+    finally:
+        restored.close()
+
+
+def test_backup_keeps_only_the_newest_copies(db, tmp_path):
+    stem = os.path.splitext(os.path.basename(maintenance.database_path()))[0]
+    old = [f"{stem}_2020-01-0{day}_00-00-00.db" for day in (1, 2, 3)]
+    for name in old:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / f"{stem}_2020-01-04_00-00-00.db.part").write_bytes(b"")  # cópia interrompida
+
+    result = maintenance.backup(dest_dir=str(tmp_path), keep=2)
+
+    assert result["removed"] == 2
+    assert sorted(os.listdir(tmp_path)) == sorted([old[-1], result["file"]])
+
+
+def test_cleanup_removes_orphan_embeddings(db):
+    question = models.Question(text="kept", answer="yes")
+    db.add(question)
+    db.flush()
+    db.add_all([
+        models.QuestionEmbedding(question_id=question.id, embedding=encode_embedding([1.0, 0.0])),
+        models.QuestionEmbedding(question_id=question.id + 1000, embedding=encode_embedding([0.0, 1.0])),
+    ])
+    db.commit()
+
+    assert maintenance.cleanup(db, batch_size=1) == {"question_embeddings": 1, "shadow_embeddings": 0}
+    assert [row.question_id for row in db.query(models.QuestionEmbedding)] == [question.id]
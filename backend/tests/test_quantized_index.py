@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from app import vector_index
+
+DIM = 16
+
+
+def vectors(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+@pytest.mark.parametrize("source,rerank", [("memory", 8), ("db", 0)])
+def test_pca_is_fitted_once_upserts_bring_enough_vectors(source, rerank):
+    index = vector_index.QuantizedVectorIndex("questions", reduce_dim=4, rerank=rerank, rerank_source=source)
+    data = vectors(12)
+    index.build([0, 1, 2], data[:3])
+    assert index._reducer is None  # 3 < 2 × 4: só quantiza
+
+    for item_id in range(3, 7):
+        index.upsert(item_id, data[item_id])
+    assert index._reducer is None
+    index.upsert(7, data[7])  # 8 vetores: o PCA em 4 dimensões já pode ser estimado
+    assert index._reducer[0] == "pca"
+    assert index._state[1].shape == (8, 4)
+
+    index.upsert_many(list(range(8, 12)), data[8:])
+    assert index._state[1].shape == (12, 4)
+    assert len(index) == 12
+    if rerank:
+        for item_id in (0, 5, 11):
+            assert index.search(data[item_id], k=1)[0][0] == item_id
+
+
+def test_build_with_enough_vectors_fits_directly():
+    index = vector_index.QuantizedVectorIndex("questions", reduce_dim=4, rerank_source="memory")
+    index.build(list(range(8)), vectors(8))
+    assert index._reducer[0] == "pca"
@@ -0,0 +1,88 @@
+import time
+import numpy as np
+import pytest
+from app import crud, database, models, refresh_embeddings, schemas, utils, vector_index
+from tests.conftest import unit
+
+
+@pytest.fixture
+def api_process(monkeypatch):
+    # processo da API recém-iniciado: ainda nenhum job ativado
+    monkeypatch.setattr(refresh_embeddings, "_active_job_id", None)
+    monkeypatch.setattr(utils, "EMBEDDING_MODEL", utils.EMBEDDING_MODEL)
+
+
+def finish_job_elsewhere(db, question_id, vector, model=None):
+    """O que o refresh_embeddings faz em outro processo: grava os vetores novos e ativa um job."""
+    model = model or utils.EMBEDDING_MODEL
+    db.query(models.QuestionEmbedding).filter_by(question_id=question_id).update(
+        {"embedding": utils.serialize_embedding(vector, model), "embedding_model": model})
+    db.query(models.EmbeddingJob).filter_by(status="active").update({"status": "retired"})
+    job = models.EmbeddingJob(model=model, corpora="questions,chunks", status="active", question_cursor=0,
+                              chunk_cursor=0, embedded=1, failed=0, started_at=time.time(), finished_at=time.time())
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_same_model_refresh_reloads_the_index(db, api_process):
+    question = crud.create_question(db, schemas.QuestionCreate(text="what is gli eleven", answer="a standard"),
+                                    unit((0, 1.0)))
+    assert not refresh_embeddings.sync_active_model(db)
+
+    job = finish_job_elsewhere(db, question.id, unit((1, 1.0)))
+
+    assert refresh_embeddings.sync_active_model(db)
+    assert refresh_embeddings._active_job_id == job.id
+    assert vector_index.question_index.search(unit((1, 1.0)), k=1) == [(question.id, pytest.approx(1.0))]
+    assert not refresh_embeddings.sync_active_model(db)  # já está com os vetores deste job
+
+
+def test_model_change_switches_the_query_model(db, api_process):
+    question = crud.create_question(db, schemas.QuestionCreate(text="what is gli eleven", answer="a standard"),
+                                    unit((0, 1.0)))
+    finish_job_elsewhere(db, question.id, unit((2, 1.0)), model="other-embedder")
+
+    assert refresh_embeddings.sync_active_model(db)
+    assert utils.EMBEDDING_MODEL == "other-embedder"
+    assert vector_index.question_index.search(unit((2, 1.0)), k=1)[0][0] == question.id
+
+
+def test_startup_adopts_the_active_job(db, api_process):
+    question = crud.create_question(db, schemas.QuestionCreate(text="what is gli eleven", answer="a standard"),
+                                    unit((0, 1.0)))
+    job = finish_job_elsewhere(db, question.id, unit((1, 1.0)))
+
+    # a subida aplica o modelo e carrega os índices depois: nada a trocar em seguida
+    refresh_embeddings.apply_active_model(db)
+    assert refresh_embeddings._active_job_id == job.id
+    assert not refresh_embeddings.sync_active_model(db)
+
+
+def test_question_edited_while_its_vector_is_computed_is_re_embedded(db, api_process, monkeypatch):
+    question = crud.create_question(db, schemas.QuestionCreate(text="what is gli eleven", answer="a standard"),
+                                    utils.get_embedding("what is gli eleven"))
+    other = crud.create_question(db, schemas.QuestionCreate(text="what is ptch1", answer="a receptor"),
+                                 utils.get_embedding("what is ptch1"))
+    real = utils.get_embeddings
+    edited = []
+
+    def edit_during_call(texts, model=None):
+        vectors = real(texts, model)
+        if not edited:
+            # o admin edita a pergunta depois de o job ler o texto e antes de ele gravar a sombra
+            with database.SessionLocal() as admin:
+                crud.update_question(admin, question.id,
+                                     schemas.QuestionCreate(text="what is gli twelve", answer="another standard"))
+            edited.append(True)
+        return vectors
+
+    monkeypatch.setattr(utils, "get_embeddings", edit_during_call)
+    job = refresh_embeddings.run_job(db, corpora=("questions", "chunks"), workers=1)
+
+    assert job.status == "active"
+    assert edited
+    db.expire_all()
+    stored = {row.question_id: utils.deserialize_embedding(row.embedding) for row in db.query(models.QuestionEmbedding)}
+    assert np.allclose(stored[question.id], real(["what is gli twelve"])[0], atol=1e-6)
+    assert np.allclose(stored[other.id], real(["what is ptch1"])[0], atol=1e-6)
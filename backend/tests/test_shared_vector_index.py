@@ -0,0 +1,103 @@
+import os
+import numpy as np
+import pytest
+from app import vector_index
+from tests.conftest import unit
+
+
+def axis(i):
+    return unit((i, 1.0))
+
+
+@pytest.fixture
+def pair(tmp_path, monkeypatch):
+    # dois "processos" sobre o mesmo diretório; o ponteiro é conferido a cada busca
+    monkeypatch.setattr(vector_index, "MMAP_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(vector_index, "MMAP_PUBLISH_INTERVAL", 60)  # só publica no save() explícito
+    a = vector_index.SharedVectorIndex("questions", directory=str(tmp_path))
+    b = vector_index.SharedVectorIndex("questions", directory=str(tmp_path))
+    yield a, b
+    a.save()
+    b.save()
+
+
+def top(index, vector):
+    results = index.search(vector, k=1)
+    return results[0][0] if results else None
+
+
+def test_build_is_visible_to_another_instance(pair):
+    a, b = pair
+    a.build([1, 2, 3], [axis(0), axis(1), axis(2)])
+
+    assert b.load()
+    assert b.generation == a.generation == 1
+    assert b.ids() == {1, 2, 3}
+    assert top(b, axis(1)) == 2
+
+
+def test_changes_are_local_until_published(pair):
+    a, b = pair
+    a.build([1, 2], [axis(0), axis(1)])
+    b.load()
+
+    a.upsert(3, axis(2))
+    a.remove(1)
+    assert a.ids() == {2, 3}
+    assert b.ids() == {1, 2}
+
+    a.save(force=True)
+    assert a.generation == 2
+    assert b.ids() == {2, 3}
+    assert b.generation == 2
+    assert top(b, axis(2)) == 3
+    assert top(b, axis(0)) != 1
+
+
+def test_upsert_replaces_the_published_vector(pair):
+    a, b = pair
+    a.build([1, 2], [axis(0), axis(1)])
+    b.load()
+
+    a.upsert(1, axis(3))
+    a.save(force=True)
+
+    assert len(b) == 2
+    assert top(b, axis(3)) == 1
+    found, rows = b.vectors([1])
+    assert found == [1]
+    assert np.allclose(rows[0], axis(3))
+
+
+def test_concurrent_writers_are_merged_on_the_latest_generation(pair):
+    a, b = pair
+    a.build([1, 2, 3], [axis(0), axis(1), axis(2)])
+    b.load()
+
+    # os dois mexem sobre a geração 1 sem ver um ao outro
+    a.upsert(4, axis(3))
+    a.remove(2)
+    b.upsert(5, axis(4))
+    b.remove(3)
+    b.upsert(1, axis(5))
+
+    a.save(force=True)
+    b.save(force=True)
+
+    assert b.generation == 3
+    assert a.ids() == b.ids() == {1, 4, 5}
+    assert top(a, axis(5)) == 1  # o vetor novo de b venceu o da geração 1
+    assert top(a, axis(3)) == 4
+    assert top(b, axis(3)) == 4
+
+
+def test_old_generations_are_pruned(pair, monkeypatch):
+    monkeypatch.setattr(vector_index, "MMAP_KEEP_GENERATIONS", 1)
+    a, _ = pair
+    a.build([1], [axis(0)])
+    for item_id in range(2, 5):
+        a.upsert(item_id, axis(item_id))
+        a.save(force=True)
+
+    files = sorted(name for name in os.listdir(a.directory) if name.endswith(".npy"))
+    assert files == ["questions-00000004.ids.npy", "questions-00000004.vectors.npy"]
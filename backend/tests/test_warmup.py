@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+from app import warmup
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(warmup, "STARTUP_RETRY_INTERVAL", 0)
+    monkeypatch.setattr(warmup, "STARTUP_DB_ATTEMPTS", 3)
+
+
+def test_database_step_gives_up_after_max_attempts(fast_retries, monkeypatch):
+    calls = []
+
+    def unreachable():
+        calls.append(1)
+        raise OSError("could not connect to server")
+
+    monkeypatch.setattr(warmup, "prepare_database", unreachable)
+    with pytest.raises(warmup.StartupFailed, match="could not connect"):
+        asyncio.run(warmup.start_database())
+
+    assert len(calls) == 3
+    status = warmup.status()
+    assert not status["ready"]
+    assert status["steps"]["database"] == {"state": "failed", "attempts": 3, "error": "could not connect to server"}
+
+
+def test_database_step_recovers_within_the_limit(fast_retries, monkeypatch):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OSError("database is locked")
+
+    monkeypatch.setattr(warmup, "prepare_database", flaky)
+    asyncio.run(warmup.start_database())
+
+    assert warmup.is_done("database")
+    assert len(calls) == 3
@@ -3,13 +3,15 @@ const resetBtn = document.getElementById("resetBtn");
 const questionInput = document.getElementById("question");
 const responseDiv = document.getElementById("response");
 
-const API_URL = `http://${window.location.hostname}:8000/ask`;
+const BASE_URL = `http://${window.location.hostname}:8000`;
+const API_URL = `${BASE_URL}/ask`;
 
 let isProcessing = false;
+let isReady = false;
 
 sendBtn.addEventListener("click", async (event) => {
   event.preventDefault();
-  if (isProcessing) return;
+  if (isProcessing || !isReady) return;
 
   const userQuestion = questionInput.value.trim();
   if (!userQuestion) {
@@ -23,50 +25,149 @@ sendBtn.addEventListener("click", async (event) => {
 
   try {
     const res = await fetch(
-      `${API_URL}?user_question=${encodeURIComponent(userQuestion)}`,
+      `${API_URL}/stream?user_question=${encodeURIComponent(userQuestion)}`,
       {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { Accept: "text/event-stream" },
         cache: "no-cache",
       }
     );
 
-    const data = await res.json();
-    console.log("🧩 Backend response:", data); // mantém debug
+    // 🔁 Backend sem streaming: usa o /ask normal
+    if (!res.ok || !res.body) {
+      await askOnce(userQuestion);
+      return;
+    }
 
-    // ✅ Proteção contra campos ausentes
-    const answer =
-      data?.ai_answer && data.ai_answer.trim() !== ""
-        ? data.ai_answer
-        : "❓ I don’t have this answer now. Please check with one of the leads.";
+    await readStream(res.body);
+  } catch (err) {
+    console.error("⚠️ Error:", err);
+    responseDiv.innerHTML = `<span style="color:red;">Error: ${err.message}</span>`;
+  } finally {
+    isProcessing = false;
+    sendBtn.disabled = !isReady;
+  }
+});
 
-    const score =
-      typeof data?.context_match_score === "number"
-        ? `${(data.context_match_score * 100).toFixed(2)}%`
-        : "N/A";
+// -------------------------
+// Prontidão do backend (/ready)
+// -------------------------
+// ⌛ Logo depois de subir, o backend ainda carrega índices e modelos: espera antes de liberar o envio
+async function waitUntilReady() {
+  sendBtn.disabled = true;
+  responseDiv.innerHTML = "<em>⌛ Warming up...</em>";
+  while (true) {
+    try {
+      const res = await fetch(`${BASE_URL}/ready`, { cache: "no-cache" });
+      if (res.ok) break;
+    } catch (err) {
+      // backend ainda não aceita conexões
+    }
+    await new Promise((resolve) => setTimeout(resolve, 2000));
+  }
+  isReady = true;
+  sendBtn.disabled = isProcessing;
+  responseDiv.innerHTML = "";
+}
+
+// -------------------------
+// Renderização da resposta
+// -------------------------
+function formatScore(value) {
+  return typeof value === "number" ? `${(value * 100).toFixed(2)}%` : "N/A";
+}
 
-    const context =
-      data?.context_used && data.context_used !== "null"
-        ? data.context_used
-        : "No context available.";
+function formatContext(value) {
+  return value && value !== "null" ? value : "No context available.";
+}
 
-    responseDiv.innerHTML = `
+function renderResponse(score, context) {
+  responseDiv.innerHTML = `
   <div class="response">
     <p><strong>💬 Answer:</strong></p>
-    <div class="answer-line">${answer}</div>
+    <div class="answer-line"></div>
 
     <p><strong>📊 Similarity:</strong> ${score}</p>
-    <p><strong>🧩 Context:</strong> ${context}</p>
+    <p><strong>🧩 Context:</strong> <span class="context-line"></span></p>
   </div>
     `;
-  } catch (err) {
-    console.error("⚠️ Error:", err);
-    responseDiv.innerHTML = `<span style="color:red;">Error: ${err.message}</span>`;
-  } finally {
-    isProcessing = false;
-    sendBtn.disabled = false;
+  responseDiv.querySelector(".context-line").textContent = context;
+  return responseDiv.querySelector(".answer-line");
+}
+
+// ✅ Resposta completa de uma vez (endpoint /ask)
+async function askOnce(userQuestion) {
+  const res = await fetch(
+    `${API_URL}?user_question=${encodeURIComponent(userQuestion)}`,
+    {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      cache: "no-cache",
+    }
+  );
+
+  const data = await res.json();
+  console.log("🧩 Backend response:", data); // mantém debug
+
+  // ✅ Proteção contra campos ausentes
+  const answer =
+    data?.ai_answer && data.ai_answer.trim() !== ""
+      ? data.ai_answer
+      : "❓ I don’t have this answer now. Please check with one of the leads.";
+
+  const answerLine = renderResponse(
+    formatScore(data?.context_match_score),
+    formatContext(data?.context_used)
+  );
+  answerLine.textContent = answer;
+}
+
+// 🌊 Resposta em streaming (SSE do /ask/stream): os tokens aparecem conforme chegam
+async function readStream(body) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let answerLine = null;
+
+  const handle = (event, data) => {
+    if (event === "meta") {
+      console.log("🧩 Backend context:", data); // mantém debug
+      answerLine = renderResponse(
+        formatScore(data.context_match_score),
+        formatContext(data.context_used)
+      );
+    } else if (event === "token" && answerLine) {
+      answerLine.textContent += data.text;
+    } else if (event === "done" && answerLine && !answerLine.textContent.trim()) {
+      answerLine.textContent =
+        "❓ I don’t have this answer now. Please check with one of the leads.";
+    } else if (event === "error") {
+      if (!answerLine) answerLine = renderResponse("N/A", "No context available.");
+      answerLine.textContent = data.ai_answer;
+    }
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // cada evento SSE termina com uma linha em branco
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (data) handle(event, JSON.parse(data));
+    }
   }
-});
+}
 
 resetBtn.addEventListener("click", (e) => {
   e.preventDefault();
@@ -80,3 +181,5 @@ questionInput.addEventListener("keydown", (e) => {
     sendBtn.click();
   }
 });
+
+waitUntilReady();